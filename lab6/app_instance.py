@@ -1,12 +1,20 @@
 from flask import Flask, jsonify
+import os
+import random
 import socket
 import sys
+import time
 
 app = Flask(__name__)
 
 HOSTNAME = socket.gethostname()
 PORT = int(sys.argv[1])
 
+# искусственная задержка и доля ошибок /process — для нагрузочных тестов (loadtest.py)
+LATENCY_MS = float(os.getenv("INSTANCE_LATENCY_MS", "0"))
+LATENCY_JITTER_MS = float(os.getenv("INSTANCE_LATENCY_JITTER_MS", "0"))
+FAIL_RATE = float(os.getenv("INSTANCE_FAIL_RATE", "0"))
+
 @app.route("/health")
 def health():
     return jsonify({
@@ -17,6 +25,11 @@ def health():
 
 @app.route("/process")
 def process():
+    delay = LATENCY_MS + random.uniform(0, LATENCY_JITTER_MS)
+    if delay:
+        time.sleep(delay / 1000)
+    if FAIL_RATE and random.random() < FAIL_RATE:
+        return jsonify({"error": "Injected failure", "port": PORT}), 500
     return jsonify({
         "message": "Processed by instance",
         "instance": HOSTNAME,
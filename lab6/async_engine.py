@@ -0,0 +1,348 @@
+# async_engine.py
+"""
+Асинхронный движок прокси: asyncio + aiohttp (сервер и клиент).
+
+Ожидающий ответа инстанса запрос — это корутина, а не поток, поэтому один
+процесс на одном ядре держит десятки тысяч одновременных соединений.
+Реестр инстансов, выбор инстанса, проверки здоровья и веб-интерфейс берутся
+из load_balancer.py: служебные пути (ADMIN_PATHS) выполняются Flask-приложением
+балансировщика в пуле потоков, всё остальное проксируется.
+
+    python load_balancer.py --engine async --port 8000
+    python async_engine.py                 # то же, порт из LB_PORT
+"""
+import asyncio
+import os
+import time
+
+from aiohttp import ClientError, ClientSession, ClientTimeout, DummyCookieJar, TCPConnector, web
+from werkzeug.test import EnvironBuilder, run_wsgi_app
+
+import load_balancer as lb
+import metrics
+from health import IDEMPOTENT_METHODS, RETRY_STATUSES, can_retry
+from response_cache import LB_CACHE_WAIT, AsyncSingleFlight, freshness, request_bypasses
+
+ADMIN_PATHS = {"/", "/health", "/metrics", "/add_instance", "/remove_instance", "/cache/stats"}
+
+# 0 — без общего ограничения; на инстанс — UPSTREAM_POOL_SIZE keep-alive соединений
+ASYNC_UPSTREAM_LIMIT = int(os.getenv("ASYNC_UPSTREAM_LIMIT", "0"))
+ASYNC_UPSTREAM_LIMIT_PER_HOST = int(os.getenv("ASYNC_UPSTREAM_LIMIT_PER_HOST", "0"))
+ASYNC_BACKLOG = int(os.getenv("ASYNC_BACKLOG", "4096"))
+
+CLIENT = web.AppKey("client", ClientSession)  # общий клиент к инстансам
+
+
+def forward_headers(request):
+    """Заголовки клиента без hop-by-hop и Host, плюс X-Forwarded-*."""
+    headers = {
+        name: value for name, value in request.headers.items()
+        if name.lower() not in lb.HOP_BY_HOP and name.lower() != "host"
+    }
+    client = request.remote or ""
+    forwarded_for = request.headers.get("X-Forwarded-For")
+    headers["X-Forwarded-For"] = f"{forwarded_for}, {client}" if forwarded_for else client
+    headers["X-Forwarded-Host"] = request.host
+    headers["X-Forwarded-Proto"] = request.scheme
+    return headers
+
+
+async def send_upstream(client, method, path_qs, headers, body, key, retryable):
+    """
+    Отправить запрос на инстанс с повторами, как load_balancer.send_upstream.
+    Возвращает ((upstream, inst, strategy, started), None) или (None, ответ с ошибкой).
+    """
+    strategy = lb.strategy
+    lb.retry_budget.deposit()
+    tried = []
+    error = web.json_response({"error": "Нет активных инстансов"}, status=503)
+
+    for attempt in range(lb.MAX_ATTEMPTS):
+        inst = lb.pick_instance(strategy, key, tried)
+        if not inst:
+            return None, error
+        tried.append(inst)
+
+        url = f"http://{inst['ip']}:{inst['port']}{path_qs}"
+        started = time.perf_counter()
+        strategy.on_start(inst)
+        metrics.backend_started(inst)
+        try:
+            upstream = await client.request(method, url, headers=headers, data=body, allow_redirects=False)
+        except (asyncio.TimeoutError, ClientError) as exc:
+            elapsed = time.perf_counter() - started
+            strategy.on_finish(inst, elapsed, False)
+            lb.monitor.record(inst, ok=False)
+            metrics.backend_finished(inst, "timeout" if isinstance(exc, asyncio.TimeoutError) else "error", elapsed)
+            if isinstance(exc, asyncio.TimeoutError):
+                error = web.json_response({"error": "Инстанс не ответил вовремя"}, status=504)
+            else:
+                error = web.json_response({"error": "Инстанс недоступен"}, status=503)
+            if retryable and can_retry(method, attempt, lb.retry_budget):
+                continue
+            return None, error
+
+        if upstream.status in RETRY_STATUSES and retryable and can_retry(method, attempt, lb.retry_budget):
+            upstream.release()
+            elapsed = time.perf_counter() - started
+            strategy.on_finish(inst, elapsed, False)
+            lb.monitor.record(inst, ok=False)
+            metrics.backend_finished(inst, upstream.status, elapsed)
+            continue
+
+        return (upstream, inst, strategy, started), None
+
+    return None, error
+
+
+def complete_upstream(upstream, finished, upstream_failed=False):
+    response, inst, strategy, started = upstream
+    elapsed = time.perf_counter() - started
+    healthy = not upstream_failed and response.status < 500
+    strategy.on_finish(inst, elapsed, finished and healthy)
+    lb.monitor.record(inst, ok=healthy)
+    metrics.backend_finished(inst, "error" if upstream_failed else response.status, elapsed)
+    if finished:
+        response.release()
+    else:
+        response.close()
+
+
+async def proxy(request):
+    """
+    Аналог load_balancer.proxy: метод, тело и заголовки туда, ответ потоком
+    обратно; идемпотентные запросы повторяются на другом инстансе.
+    """
+    if lb.response_cache is not None:
+        if not request_bypasses(request.method, request.headers):
+            return await cached_proxy(request)
+        if request.method == "GET":
+            lb.response_cache.count("bypass")
+
+    retryable = request.method in IDEMPOTENT_METHODS
+    # повторять можно только тело, прочитанное целиком; остальное идёт потоком
+    if not request.body_exists:
+        body = None
+    elif retryable:
+        body = await request.read()
+    else:
+        body = request.content.iter_chunked(lb.STREAM_CHUNK_SIZE)
+    upstream, error = await send_upstream(
+        request.app[CLIENT], request.method, request.path_qs, forward_headers(request), body,
+        lb.balance_key(request.headers, request.remote), retryable,
+    )
+    if upstream is None:
+        return error
+    return await stream_response(request, upstream)
+
+
+async def stream_response(request, upstream, prefix=b"", extra_headers=()):
+    source = upstream[0]
+    finished = upstream_failed = False
+    try:
+        response = web.StreamResponse(status=source.status, reason=source.reason)
+        for name, value in source.headers.items():
+            if name.lower() not in lb.HOP_BY_HOP:
+                response.headers.add(name, value)
+        for name, value in extra_headers:
+            response.headers[name] = value
+        await response.prepare(request)
+        if prefix:
+            await response.write(prefix)
+        try:
+            async for chunk in source.content.iter_chunked(lb.STREAM_CHUNK_SIZE):
+                await response.write(chunk)
+        except ClientError:
+            upstream_failed = True  # обрыв со стороны инстанса
+            raise
+        await response.write_eof()
+        finished = True
+        return response
+    finally:
+        complete_upstream(upstream, finished, upstream_failed)
+
+
+# КЭШ ОТВЕТОВ (response_cache.py); логика та же, что в load_balancer.cached_proxy
+
+flights = AsyncSingleFlight()
+
+
+async def read_for_cache(upstream):
+    """(body, cacheable); при cacheable=False ответ ещё не дочитан."""
+    source = upstream[0]
+    cache = lb.response_cache
+    if freshness(source.status, source.headers, time.time()) is None:
+        cache.count("uncacheable")
+        return b"", False
+    if source.content_length is not None and source.content_length > cache.max_body:
+        cache.count("uncacheable")
+        return b"", False
+    try:
+        body = await source.content.read(cache.max_body + 1)
+        while len(body) <= cache.max_body and not source.content.at_eof():
+            chunk = await source.content.read(cache.max_body + 1 - len(body))
+            if not chunk:
+                break
+            body += chunk
+    except (asyncio.TimeoutError, ClientError):
+        complete_upstream(upstream, finished=False, upstream_failed=True)
+        raise
+    if len(body) > cache.max_body:
+        cache.count("uncacheable")
+        return body, False
+    complete_upstream(upstream, finished=True)
+    return body, True
+
+
+def cached_response(entry, state):
+    response = web.Response(body=entry.body, status=entry.status)
+    for name, value in entry.response_headers(state, time.time()):
+        response.headers.add(name, value)
+    return response
+
+
+def revalidate(client, cache_key, headers, key, request_headers):
+    flight = ("revalidate", cache_key)
+    if not flights.begin(flight)[0]:
+        return
+
+    async def run():
+        try:
+            upstream, _ = await send_upstream(client, "GET", cache_key, headers, None, key, True)
+            if upstream is None:
+                return
+            body, cacheable = await read_for_cache(upstream)
+            if cacheable:
+                source = upstream[0]
+                lb.response_cache.store(cache_key, request_headers, source.status, source.headers, body)
+                lb.response_cache.count("revalidations")
+            else:
+                complete_upstream(upstream, finished=False)
+        except (asyncio.TimeoutError, ClientError):
+            pass
+        finally:
+            flights.end(flight)
+
+    asyncio.get_running_loop().create_task(run())
+
+
+async def cached_proxy(request):
+    cache = lb.response_cache
+    cache_key = request.path_qs if request.query_string else request.path + "?"
+    headers = forward_headers(request)
+    key = lb.balance_key(request.headers, request.remote)
+    client = request.app[CLIENT]
+
+    entry, state = cache.lookup(cache_key, request.headers)
+    if state == "fresh":
+        cache.count("hits")
+        return cached_response(entry, "HIT")
+    if state == "stale":
+        cache.count("stale_hits")
+        revalidate(client, cache_key, headers, key, request.headers.copy())
+        return cached_response(entry, "STALE")
+
+    leader, event = flights.begin(cache_key)
+    if not leader:
+        try:
+            await asyncio.wait_for(event.wait(), LB_CACHE_WAIT)
+        except asyncio.TimeoutError:
+            pass
+        entry, state = cache.lookup(cache_key, request.headers)
+        if entry is not None:
+            cache.count("coalesced")
+            return cached_response(entry, "COALESCED")
+
+    cache.count("misses")
+    try:
+        upstream, error = await send_upstream(client, "GET", cache_key, headers, None, key, True)
+        if upstream is None:
+            return error
+        body, cacheable = await read_for_cache(upstream)
+        if not cacheable:
+            return await stream_response(request, upstream, prefix=body, extra_headers=[("X-Cache", "MISS")])
+        source = upstream[0]
+        cache.store(cache_key, request.headers, source.status, source.headers, body)
+        response = web.Response(body=body, status=source.status)
+        for name, value in source.headers.items():
+            if name.lower() not in lb.HOP_BY_HOP and name.lower() != "content-length":
+                response.headers.add(name, value)
+        response.headers["X-Cache"] = "MISS"
+        return response
+    finally:
+        if leader:
+            flights.end(cache_key)
+
+
+async def admin(request):
+    """Служебные страницы — через WSGI-вызов Flask-приложения в пуле потоков."""
+    builder = EnvironBuilder(
+        path=request.path, method=request.method, query_string=request.query_string,
+        headers=list(request.headers.items()), data=await request.read(),
+    )
+    environ = builder.get_environ()
+    builder.close()
+    loop = asyncio.get_running_loop()
+    app_iter, status, headers = await loop.run_in_executor(
+        None, lambda: run_wsgi_app(lb.app, environ, buffered=True)
+    )
+    body = b"".join(app_iter)
+    response = web.Response(body=body, status=int(status.split(" ", 1)[0]))
+    for name, value in headers.items():
+        if name.lower() not in ("content-length", "transfer-encoding"):
+            response.headers.add(name, value)
+    return response
+
+
+async def dispatch(request):
+    if request.path in ADMIN_PATHS:
+        return await admin(request)
+    started = time.perf_counter()
+    response = await proxy(request)
+    metrics.observe_request(response.status, time.perf_counter() - started)
+    return response
+
+
+async def open_client(app):
+    lb.start_health_checks()  # при старте приложения — как бы его ни запустили
+    connector = TCPConnector(limit=ASYNC_UPSTREAM_LIMIT, limit_per_host=ASYNC_UPSTREAM_LIMIT_PER_HOST)
+    timeout = ClientTimeout(sock_connect=lb.UPSTREAM_CONNECT_TIMEOUT, sock_read=lb.UPSTREAM_READ_TIMEOUT)
+    # auto_decompress=False — сжатое тело проходит как есть, вместе с Content-Encoding
+    app[CLIENT] = ClientSession(connector=connector, timeout=timeout, auto_decompress=False,
+                                  cookie_jar=DummyCookieJar())
+    yield
+    await app[CLIENT].close()
+
+
+def make_app():
+    app = web.Application()
+    app.cleanup_ctx.append(open_client)
+    app.router.add_route("*", "/{tail:.*}", dispatch)
+    return app
+
+
+def raise_nofile_limit():
+    """Каждое соединение — файловый дескриптор; поднимаем мягкий лимит до жёсткого."""
+    try:
+        import resource  # только Unix
+    except ImportError:
+        return
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    target = hard if hard != resource.RLIM_INFINITY else 1 << 20
+    if soft < target:
+        try:
+            resource.setrlimit(resource.RLIMIT_NOFILE, (target, hard))
+        except (ValueError, OSError):
+            pass
+
+
+def run(port: int = 8000, strategy: str | None = None):
+    raise_nofile_limit()
+    if strategy:
+        lb.set_strategy(strategy)
+    print(f"Балансировщик (async) работает на порту {port}")
+    web.run_app(make_app(), port=port, backlog=ASYNC_BACKLOG, access_log=None, print=None)
+
+
+if __name__ == "__main__":
+    run(int(os.getenv("LB_PORT", "8000")))
@@ -0,0 +1,281 @@
+# balancing.py
+"""
+Стратегии выбора инстанса для балансировщика.
+
+Каждая стратегия получает снимок активных инстансов в rebuild() — он
+вызывается только при изменении пула или статуса, а не на каждый запрос, —
+и заранее строит всё нужное для выбора. pick() работает за O(1) или O(log n):
+
+- round_robin — счётчик по кругу;
+- weighted_round_robin — заранее развёрнутое «гладкое» расписание по весам;
+- least_outstanding — меньше всего запросов в работе (куча с ленивым удалением);
+- p2c_ewma — два случайных инстанса, выигрывает меньший EWMA-задержки × (в работе + 1);
+- consistent_hash — кольцо хэшей с виртуальными узлами, ключ — заголовок или IP клиента.
+
+on_start / on_finish сообщают стратегии о начале и конце проксируемого запроса.
+"""
+import hashlib
+import heapq
+import itertools
+import math
+import os
+import random
+import threading
+import time
+from bisect import bisect
+from functools import reduce
+
+EWMA_DECAY = float(os.getenv("EWMA_DECAY", "10"))                    # секунды затухания EWMA
+EWMA_FAILURE_PENALTY = float(os.getenv("EWMA_FAILURE_PENALTY", "1"))  # «задержка» неудачного запроса
+HASH_VNODES = int(os.getenv("HASH_VNODES", "100"))                   # виртуальных узлов на единицу веса
+
+
+def backend_key(inst):
+    return (inst["ip"], inst["port"])
+
+
+def weight_of(inst) -> int:
+    return max(int(inst.get("weight", 1)), 1)
+
+
+class Strategy:
+    """Базовая стратегия: снимок активных инстансов и пустые хуки."""
+    name = ""
+
+    def __init__(self):
+        self.snapshot = ()
+
+    def rebuild(self, active):
+        self.snapshot = tuple(active)
+
+    def pick(self, key=None):
+        raise NotImplementedError
+
+    def on_start(self, inst):
+        pass
+
+    def on_finish(self, inst, elapsed: float, ok: bool):
+        pass
+
+
+class RoundRobin(Strategy):
+    name = "round_robin"
+
+    def __init__(self):
+        super().__init__()
+        self._counter = itertools.count()  # next() атомарен — блокировка не нужна
+
+    def pick(self, key=None):
+        snapshot = self.snapshot
+        if not snapshot:
+            return None
+        return snapshot[next(self._counter) % len(snapshot)]
+
+
+class WeightedRoundRobin(Strategy):
+    """Гладкий WRR (как в nginx), развёрнутый в расписание при rebuild."""
+    name = "weighted_round_robin"
+
+    def __init__(self):
+        super().__init__()
+        self._counter = itertools.count()
+        self._schedule = ()
+
+    def rebuild(self, active):
+        active = tuple(active)
+        weights = [weight_of(inst) for inst in active]
+        schedule = []
+        if active:
+            divisor = reduce(math.gcd, weights)
+            weights = [w // divisor for w in weights]
+            total = sum(weights)
+            current = [0] * len(active)
+            for _ in range(total):
+                for i, w in enumerate(weights):
+                    current[i] += w
+                best = max(range(len(active)), key=current.__getitem__)
+                current[best] -= total
+                schedule.append(active[best])
+        self.snapshot, self._schedule = active, tuple(schedule)
+
+    def pick(self, key=None):
+        schedule = self._schedule
+        if not schedule:
+            return None
+        return schedule[next(self._counter) % len(schedule)]
+
+
+class LeastOutstanding(Strategy):
+    """
+    Инстанс с наименьшим числом запросов в работе. Каждое изменение счётчика
+    кладёт в кучу новую запись (при равенстве выигрывает давно не менявшийся
+    инстанс); устаревшие выбрасываются при выборе, а куча перестраивается,
+    когда мусора становится больше, чем живых записей.
+    """
+    name = "least_outstanding"
+
+    def __init__(self):
+        super().__init__()
+        self._lock = threading.Lock()
+        self._seq = itertools.count()
+        self._by_key = {}
+        self._in_flight = {}
+        self._latest = {}  # key -> seq актуальной записи в куче
+        self._heap = []
+
+    def _reheap(self):
+        self._heap = []
+        for key in self._in_flight:
+            self._latest[key] = seq = next(self._seq)
+            self._heap.append((self._in_flight[key], seq, key))
+        heapq.heapify(self._heap)
+
+    def _push(self, key):
+        self._latest[key] = seq = next(self._seq)
+        heapq.heappush(self._heap, (self._in_flight[key], seq, key))
+        if len(self._heap) > 4 * len(self._by_key) + 16:
+            self._reheap()
+
+    def rebuild(self, active):
+        with self._lock:
+            self.snapshot = tuple(active)
+            self._by_key = {backend_key(inst): inst for inst in self.snapshot}
+            self._in_flight = {key: self._in_flight.get(key, 0) for key in self._by_key}
+            self._latest = {}
+            self._reheap()
+
+    def pick(self, key=None):
+        with self._lock:
+            heap = self._heap
+            while heap:
+                _, seq, backend = heap[0]
+                if self._latest.get(backend) == seq:
+                    return self._by_key[backend]
+                heapq.heappop(heap)
+            return None
+
+    def _adjust(self, inst, delta):
+        key = backend_key(inst)
+        with self._lock:
+            if key in self._in_flight:
+                self._in_flight[key] = max(self._in_flight[key] + delta, 0)
+                self._push(key)
+
+    def on_start(self, inst):
+        self._adjust(inst, 1)
+
+    def on_finish(self, inst, elapsed, ok):
+        self._adjust(inst, -1)
+
+    def in_flight(self) -> dict:
+        with self._lock:
+            return dict(self._in_flight)
+
+
+class P2CEwma(Strategy):
+    """
+    Power of two choices: из двух случайных инстансов берётся тот, у кого
+    меньше EWMA задержки × (запросов в работе + 1). Медленный инстанс
+    получает меньше трафика, а случайность не даёт всем потокам ринуться
+    на один и тот же «лучший».
+    """
+    name = "p2c_ewma"
+
+    def __init__(self):
+        super().__init__()
+        self._lock = threading.Lock()
+        self._stats = {}  # key -> [ewma, время последнего замера, в работе]
+
+    def rebuild(self, active):
+        with self._lock:
+            self.snapshot = tuple(active)
+            self._stats = {
+                backend_key(inst): self._stats.get(backend_key(inst), [0.0, time.monotonic(), 0])
+                for inst in self.snapshot
+            }
+
+    def _cost(self, inst) -> float:
+        ewma, _, in_flight = self._stats.get(backend_key(inst), (0.0, 0.0, 0))
+        return ewma * (in_flight + 1)
+
+    def pick(self, key=None):
+        snapshot = self.snapshot
+        n = len(snapshot)
+        if n < 2:
+            return snapshot[0] if snapshot else None
+        i = random.randrange(n)
+        j = random.randrange(n - 1)
+        if j >= i:
+            j += 1
+        a, b = snapshot[i], snapshot[j]
+        return a if self._cost(a) <= self._cost(b) else b
+
+    def on_start(self, inst):
+        with self._lock:
+            stats = self._stats.get(backend_key(inst))
+            if stats is not None:
+                stats[2] += 1
+
+    def on_finish(self, inst, elapsed, ok):
+        sample = elapsed if ok else max(elapsed, EWMA_FAILURE_PENALTY)
+        now = time.monotonic()
+        with self._lock:
+            stats = self._stats.get(backend_key(inst))
+            if stats is None:
+                return
+            ewma, last, in_flight = stats
+            weight = math.exp(-(now - last) / EWMA_DECAY)
+            stats[0] = ewma * weight + sample * (1 - weight) if ewma else sample
+            stats[1] = now
+            stats[2] = max(in_flight - 1, 0)
+
+    def ewma(self) -> dict:
+        with self._lock:
+            return {key: stats[0] for key, stats in self._stats.items()}
+
+
+def _hash(value: str) -> int:
+    return int.from_bytes(hashlib.blake2b(value.encode(), digest_size=8).digest(), "big")
+
+
+class ConsistentHash(Strategy):
+    """
+    Кольцо хэшей: ключ (заголовок или IP клиента) попадает на ближайший
+    по часовой стрелке виртуальный узел. При изменении пула переезжает
+    только доля ключей исчезнувшего/нового инстанса.
+    """
+    name = "consistent_hash"
+
+    def __init__(self, vnodes: int = HASH_VNODES):
+        super().__init__()
+        self.vnodes = vnodes
+        self._ring = ((), ())
+
+    def rebuild(self, active):
+        active = tuple(active)
+        points = sorted(
+            (_hash(f"{inst['ip']}:{inst['port']}#{v}"), index)
+            for index, inst in enumerate(active)
+            for v in range(self.vnodes * weight_of(inst))
+        )
+        hashes = tuple(h for h, _ in points)
+        owners = tuple(active[index] for _, index in points)
+        self.snapshot, self._ring = active, (hashes, owners)
+
+    def pick(self, key=None):
+        hashes, owners = self._ring
+        if not hashes:
+            return None
+        return owners[bisect(hashes, _hash(key or "")) % len(hashes)]
+
+
+STRATEGIES = {
+    cls.name: cls
+    for cls in (RoundRobin, WeightedRoundRobin, LeastOutstanding, P2CEwma, ConsistentHash)
+}
+
+
+def make_strategy(name: str) -> Strategy:
+    if name not in STRATEGIES:
+        raise ValueError(f"Неизвестная стратегия {name!r}; доступны: {', '.join(STRATEGIES)}")
+    return STRATEGIES[name]()
@@ -0,0 +1,134 @@
+# bench_engines.py
+"""
+Сравнение движков балансировщика: threaded (Flask/werkzeug) и async (aiohttp).
+
+Запускает 3 инстанса на портах 5001-5003 (по умолчанию — лёгкие aiohttp-заглушки,
+чтобы узким местом был балансировщик; --backend flask — app_instance.py),
+поднимает балансировщик с каждым движком и гоняет GET /process с заданным
+числом одновременных соединений. Печатает req/s, p50/p99 и число ошибок.
+
+    python bench_engines.py
+    python bench_engines.py --concurrency 100 1000 5000 --requests 20000
+"""
+import argparse
+import asyncio
+import os
+import subprocess
+import sys
+import time
+
+from aiohttp import ClientSession, ClientTimeout, TCPConnector, web
+
+from async_engine import raise_nofile_limit
+
+BACKEND_PORTS = (5001, 5002, 5003)
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def serve_stub_backend(port: int):
+    """Инстанс-заглушка с теми же /health и /process, что у app_instance.py."""
+    async def reply(request):
+        return web.json_response({"message": "Processed by instance", "instance": "stub", "port": port})
+
+    app = web.Application()
+    app.router.add_get("/health", reply)
+    app.router.add_get("/process", reply)
+    web.run_app(app, port=port, access_log=None, print=None)
+
+
+def spawn(args: list[str], env: dict | None = None) -> subprocess.Popen:
+    return subprocess.Popen([sys.executable, *args], cwd=HERE, env={**os.environ, **(env or {})},
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+async def wait_ready(url: str, timeout: float = 15.0):
+    deadline = time.monotonic() + timeout
+    async with ClientSession() as session:
+        while time.monotonic() < deadline:
+            try:
+                async with session.get(url) as resp:
+                    if resp.status == 200:
+                        return
+            except OSError:
+                pass
+            await asyncio.sleep(0.2)
+    raise RuntimeError(f"{url} не поднялся за {timeout} с")
+
+
+def percentile(samples: list[float], q: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, max(0, round(q / 100 * len(ordered)) - 1))]
+
+
+async def drive(url: str, requests: int, concurrency: int) -> dict:
+    """concurrency клиентов-корутин по своим keep-alive соединениям; всего requests запросов."""
+    latencies, errors = [], 0
+    remaining = requests
+
+    async def worker(session):
+        nonlocal remaining, errors
+        while remaining > 0:
+            remaining -= 1
+            started = time.perf_counter()
+            try:
+                async with session.get(url) as resp:
+                    await resp.read()
+                    errors += resp.status != 200
+            except Exception:
+                errors += 1
+            latencies.append(time.perf_counter() - started)
+
+    connector = TCPConnector(limit=concurrency)
+    async with ClientSession(connector=connector, timeout=ClientTimeout(total=60)) as session:
+        started = time.perf_counter()
+        await asyncio.gather(*(worker(session) for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+    return {
+        "rps": round(len(latencies) / elapsed, 1),
+        "p50_ms": round(percentile(latencies, 50) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 2),
+        "p999_ms": round(percentile(latencies, 99.9) * 1000, 2),
+        "errors": errors,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="threaded vs async движок балансировщика")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[10, 100, 1000])
+    parser.add_argument("--requests", type=int, default=5000, help="запросов на уровень")
+    parser.add_argument("--backend", choices=["stub", "flask"], default="stub")
+    parser.add_argument("--serve-backend", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve_backend:
+        serve_stub_backend(args.serve_backend)
+        return
+
+    raise_nofile_limit()
+    backend_cmd = (lambda port: [__file__, "--serve-backend", str(port)]) if args.backend == "stub" \
+        else (lambda port: ["app_instance.py", str(port)])
+    backends = [spawn(backend_cmd(port)) for port in BACKEND_PORTS]
+    try:
+        for port in BACKEND_PORTS:
+            asyncio.run(wait_ready(f"http://127.0.0.1:{port}/health"))
+
+        print(f"{'engine':<10} {'conc':>6} {'req/s':>10} {'p50 ms':>9} {'p99 ms':>9} {'errors':>7}")
+        for engine, port in (("threaded", 8100), ("async", 8101)):
+            balancer = spawn(["load_balancer.py", "--engine", engine, "--port", str(port)])
+            try:
+                asyncio.run(wait_ready(f"http://127.0.0.1:{port}/health"))
+                for concurrency in args.concurrency:
+                    result = asyncio.run(drive(f"http://127.0.0.1:{port}/process",
+                                               args.requests, concurrency))
+                    print(f"{engine:<10} {concurrency:>6} {result['rps']:>10} {result['p50_ms']:>9} "
+                          f"{result['p99_ms']:>9} {result['errors']:>7}")
+            finally:
+                balancer.terminate()
+                balancer.wait()
+    finally:
+        for proc in backends:
+            proc.terminate()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+# conftest.py
+import asyncio
+import importlib
+import json
+import os
+import sys
+import threading
+
+import pytest
+from aiohttp import web
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+# модули, которые load_balancer создаёт при импорте или которые есть и в rgz (metrics)
+FRESH_MODULES = ("load_balancer", "async_engine", "metrics", "registry", "response_cache",
+                 "bench_engines", "loadtest")
+
+
+class Backend:
+    """
+    Инстанс для тестов: aiohttp-сервер (с keep-alive, в отличие от
+    werkzeug) в своём потоке на свободном порту. /echo — запрос как его
+    увидел инстанс; /status/N — ответ N; /stream — длинное тело; /cached —
+    ответ с max-age. calls — запросов по путям, connections — порты клиента
+    (сколько соединений открыл балансировщик).
+    """
+
+    def __init__(self):
+        self.calls = {}
+        self.connections = set()
+        self.stream_closed = threading.Event()
+        app = web.Application(middlewares=[self._count])
+        app.router.add_get("/health", self.health)
+        app.router.add_route("*", "/echo", self.echo)
+        app.router.add_route("*", "/status/{code}", self.status)
+        app.router.add_get("/stream", self.stream)
+        app.router.add_get("/cached", self.cached)
+        self.runner = web.AppRunner(app, access_log=None)
+        self.loop = asyncio.new_event_loop()
+        self.loop.run_until_complete(self.runner.setup())
+        self.loop.run_until_complete(web.TCPSite(self.runner, "127.0.0.1", 0).start())
+        self.port = self.runner.addresses[0][1]
+        self.entry = {"ip": "127.0.0.1", "port": self.port, "weight": 1}
+        threading.Thread(target=self.loop.run_forever, daemon=True).start()
+
+    @web.middleware
+    async def _count(self, request, handler):
+        self.calls[request.path] = self.calls.get(request.path, 0) + 1
+        self.connections.add(request.transport.get_extra_info("peername")[1])
+        return await handler(request)
+
+    async def health(self, request):
+        return web.json_response({"status": "ok"})
+
+    async def echo(self, request):
+        resp = web.json_response({
+            "method": request.method,
+            "args": {name: request.query.getall(name) for name in request.query},
+            "body": await request.text(),
+            "headers": dict(request.headers),
+            "port": self.port,
+        })
+        resp.headers.add("Set-Cookie", "a=1; Path=/")
+        resp.headers.add("Set-Cookie", "b=2; Path=/")
+        resp.headers["X-Backend"] = "echo"
+        resp.headers["Keep-Alive"] = "timeout=5"
+        resp.headers["Proxy-Authenticate"] = "Basic"
+        return resp
+
+    async def status(self, request):
+        return web.json_response({"port": self.port}, status=int(request.match_info["code"]))
+
+    async def stream(self, request):
+        resp = web.StreamResponse()
+        await resp.prepare(request)
+        try:
+            for _ in range(200):
+                await resp.write(b"x" * 65536)
+                await asyncio.sleep(0.01)
+        finally:
+            self.stream_closed.set()
+        return resp
+
+    async def cached(self, request):
+        resp = web.json_response({"port": self.port, "call": self.calls["/cached"]})
+        resp.headers["Cache-Control"] = "max-age=60"
+        return resp
+
+    def close(self):
+        asyncio.run_coroutine_threadsafe(self.runner.cleanup(), self.loop).result(5)
+        self.loop.call_soon_threadsafe(self.loop.stop)
+
+
+@pytest.fixture
+def backend():
+    server = Backend()
+    yield server
+    server.close()
+
+
+@pytest.fixture
+def other_backend():
+    """Второй инстанс — в пул его добавляет сам тест."""
+    server = Backend()
+    yield server
+    server.close()
+
+
+@pytest.fixture
+def free_port():
+    """Порт, на котором никто не слушает, — недоступный инстанс."""
+    import socket
+
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+@pytest.fixture
+def lb(monkeypatch, tmp_path, backend):
+    """
+    Свежий load_balancer.py с пулом из одного инстанса backend (файл в
+    tmp_path), своими реестром, монитором и метриками. Фоновые проверки не
+    запускаются — тесты вызывают их сами. Переменные окружения
+    (LB_CACHE_ENABLED и т.п.) задаются до фикстуры.
+    """
+    config = tmp_path / "instances.json"
+    config.write_text(json.dumps([backend.entry]), encoding="utf-8")
+    monkeypatch.setenv("LB_CONFIG", str(config))
+    monkeypatch.syspath_prepend(HERE)
+    saved = {name: sys.modules.pop(name) for name in FRESH_MODULES if name in sys.modules}
+    try:
+        module = importlib.import_module("load_balancer")
+        module.health_checks_started = True
+        yield module
+        for session in list(module.sessions.values()):
+            session.close()
+    finally:
+        for name in FRESH_MODULES:
+            sys.modules.pop(name, None)
+        sys.modules.update(saved)
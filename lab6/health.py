@@ -0,0 +1,263 @@
+# health.py
+"""
+Здоровье инстансов балансировщика.
+
+- Активные проверки: планировщик раз в HEALTH_TICK секунд отдаёт пулу из
+  HEALTH_WORKERS потоков проверки, время которых пришло. У каждого инстанса
+  свой интервал (поле health_interval или HEALTH_INTERVAL) со случайным
+  сдвигом ±HEALTH_JITTER, поэтому 50 инстансов проверяются параллельно и
+  не одной пачкой.
+- Пассивные проверки и circuit breaker: ошибки и таймауты проксируемых
+  запросов (и ответы 5xx) считаются подряд; после EJECT_CONSECUTIVE_FAILURES
+  инстанс исключается на EJECT_BASE_SECONDS × 2^(n-1) (не больше
+  EJECT_MAX_SECONDS), затем пропускается один пробный запрос (half-open):
+  успех возвращает инстанс, ошибка — снова исключает с удвоенной паузой.
+  Пока пробный запрос не завершился (не дольше HALF_OPEN_TRIAL_SECONDS),
+  другие запросы на инстанс не идут.
+  Одновременно исключается не больше MAX_EJECTION_PERCENT процентов пула.
+- Повторы: идемпотентный запрос, упавший до ответа или получивший 502/503/504,
+  повторяется на другом инстансе, пока есть бюджет (RetryBudget).
+"""
+import logging
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+HEALTH_INTERVAL = float(os.getenv("HEALTH_INTERVAL", "5"))
+HEALTH_JITTER = float(os.getenv("HEALTH_JITTER", "0.2"))   # доля интервала
+HEALTH_WORKERS = int(os.getenv("HEALTH_WORKERS", "16"))
+HEALTH_TICK = float(os.getenv("HEALTH_TICK", "0.1"))
+
+EJECT_CONSECUTIVE_FAILURES = int(os.getenv("EJECT_CONSECUTIVE_FAILURES", "5"))
+EJECT_BASE_SECONDS = float(os.getenv("EJECT_BASE_SECONDS", "5"))
+EJECT_MAX_SECONDS = float(os.getenv("EJECT_MAX_SECONDS", "300"))
+MAX_EJECTION_PERCENT = int(os.getenv("MAX_EJECTION_PERCENT", "50"))
+# сколько ждать итога пробного запроса, прежде чем пустить следующий (ответ потерян)
+HALF_OPEN_TRIAL_SECONDS = float(os.getenv("HALF_OPEN_TRIAL_SECONDS", "30"))
+
+MAX_RETRIES = int(os.getenv("MAX_RETRIES", "2"))
+RETRY_BUDGET_RATIO = float(os.getenv("RETRY_BUDGET_RATIO", "0.2"))      # повторов на запрос
+RETRY_MIN_PER_SECOND = float(os.getenv("RETRY_MIN_PER_SECOND", "5"))    # при малом трафике
+
+IDEMPOTENT_METHODS = {"GET", "HEAD", "OPTIONS", "PUT", "DELETE"}
+RETRY_STATUSES = {502, 503, 504}
+
+
+def backend_key(inst):
+    return (inst["ip"], inst["port"])
+
+
+class CircuitBreaker:
+    """closed -> open (исключён) -> half_open (один пробный запрос) -> closed."""
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.state = self.CLOSED
+        self.failures = 0
+        self.ejections = 0
+        self.reopen_at = 0.0
+        self.trial_until = 0.0  # half_open: до этого момента идёт пробный запрос
+
+    def _open(self):
+        self.ejections += 1
+        pause = min(EJECT_BASE_SECONDS * 2 ** (self.ejections - 1), EJECT_MAX_SECONDS)
+        self.state, self.failures, self.reopen_at = self.OPEN, 0, time.monotonic() + pause
+        self.trial_until = 0.0
+
+    def allow(self) -> bool:
+        """Можно ли отправить запрос: в half_open — только один пробный за раз."""
+        if self.state == self.CLOSED:
+            return True
+        with self._lock:
+            if self.state != self.HALF_OPEN:
+                return self.state == self.CLOSED
+            now = time.monotonic()
+            if now < self.trial_until:
+                return False
+            self.trial_until = now + HALF_OPEN_TRIAL_SECONDS
+            return True
+
+    def record(self, ok: bool, can_eject) -> bool:
+        """Учесть результат запроса. True — если инстанс вошёл в пул или вышел из него."""
+        with self._lock:
+            if ok:
+                self.failures = 0
+                if self.state == self.HALF_OPEN:
+                    self.state, self.ejections, self.trial_until = self.CLOSED, 0, 0.0
+                return False
+            if self.state == self.OPEN:
+                return False
+            self.failures += 1
+            if self.state == self.HALF_OPEN or (
+                self.failures >= EJECT_CONSECUTIVE_FAILURES and can_eject()
+            ):
+                self._open()
+                return True
+            return False
+
+    def tick(self, now: float) -> bool:
+        """Пауза истекла — пропустить пробный запрос. True — если состояние сменилось."""
+        with self._lock:
+            if self.state == self.OPEN and now >= self.reopen_at:
+                self.state, self.trial_until = self.HALF_OPEN, 0.0
+                return True
+            return False
+
+    def admits(self) -> bool:
+        return self.state != self.OPEN
+
+
+class HealthMonitor:
+    """
+    get_instances() — текущий список инстансов, probe(inst) -> bool — активная
+    проверка, on_change() — вызывается, когда меняется набор доступных инстансов.
+    Результаты проверок хранятся здесь, по (ip, port), а не в записях реестра:
+    снимок пула общий для всех потоков и не меняется на месте.
+    """
+
+    def __init__(self, get_instances, probe, on_change):
+        self.get_instances = get_instances
+        self.probe = probe
+        self.on_change = on_change
+        self._breakers = {}
+        self._active = {}  # (ip, port) -> прошёл ли последнюю активную проверку
+        self._lock = threading.Lock()
+        self._next_probe = {}
+        self._probing = set()
+        self._thread = None
+
+    def breaker(self, inst) -> CircuitBreaker:
+        key = backend_key(inst)
+        breaker = self._breakers.get(key)
+        if breaker is None:
+            with self._lock:
+                breaker = self._breakers.setdefault(key, CircuitBreaker())
+        return breaker
+
+    def active(self, inst) -> bool:
+        """Результат последней активной проверки; до первой — считается живым."""
+        return self._active.get(backend_key(inst), True)
+
+    def admits(self, inst) -> bool:
+        return self.active(inst) and self.breaker(inst).admits()
+
+    def allow(self, inst) -> bool:
+        """Перед отправкой запроса: в half_open пропускается только пробный."""
+        return self.breaker(inst).allow()
+
+    def state(self, inst) -> str:
+        return self.breaker(inst).state
+
+    def _can_eject(self) -> bool:
+        instances = self.get_instances()
+        ejected = sum(1 for inst in instances if self.breaker(inst).state == CircuitBreaker.OPEN)
+        return (ejected + 1) * 100 <= len(instances) * MAX_EJECTION_PERCENT
+
+    def forget(self, inst):
+        """Инстанс убран из пула — его состояние больше не нужно."""
+        key = backend_key(inst)
+        with self._lock:
+            self._breakers.pop(key, None)
+            self._active.pop(key, None)
+            self._next_probe.pop(key, None)
+
+    def record(self, inst, ok: bool):
+        """Пассивная проверка: результат проксируемого запроса."""
+        if self.breaker(inst).record(ok, self._can_eject):
+            self.on_change()
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="health", daemon=True)
+            self._thread.start()
+
+    def _schedule(self, inst, now: float):
+        interval = float(inst.get("health_interval", HEALTH_INTERVAL))
+        self._next_probe[backend_key(inst)] = now + interval * (1 + random.uniform(-HEALTH_JITTER, HEALTH_JITTER))
+
+    def _check(self, inst):
+        try:
+            ok = bool(self.probe(inst))
+        except Exception:
+            ok = False
+        key = backend_key(inst)
+        with self._lock:
+            changed = self._active.get(key, True) != ok
+            self._active[key] = ok
+            self._schedule(inst, time.monotonic())
+            self._probing.discard(key)
+        if changed:
+            try:
+                self.on_change()
+            except Exception:
+                logger.exception("Ошибка обработчика смены состояния %s:%s", *key)
+
+    def tick(self, pool):
+        """Отдать пулу проверки, время которых пришло, и продвинуть circuit breaker'ы."""
+        now = time.monotonic()
+        due = []
+        with self._lock:
+            for inst in self.get_instances():
+                key = backend_key(inst)
+                if key not in self._probing and now >= self._next_probe.get(key, 0):
+                    self._probing.add(key)
+                    due.append(inst)
+        for inst in due:
+            pool.submit(self._check, inst)
+
+        if any([breaker.tick(now) for breaker in list(self._breakers.values())]):
+            self.on_change()
+
+    def _run(self):
+        with ThreadPoolExecutor(HEALTH_WORKERS, thread_name_prefix="probe") as pool:
+            while True:
+                # одна ошибка (get_instances, on_change) не должна останавливать проверки навсегда
+                try:
+                    self.tick(pool)
+                except Exception:
+                    logger.exception("Ошибка цикла проверок здоровья")
+                time.sleep(HEALTH_TICK)
+
+
+class RetryBudget:
+    """
+    Ведро токенов: каждый запрос добавляет RETRY_BUDGET_RATIO токена, каждый
+    повтор забирает один; плюс RETRY_MIN_PER_SECOND в секунду при малом
+    трафике. Когда ведро пусто, повторов нет — они не умножают нагрузку на
+    и так перегруженные инстансы.
+    """
+
+    def __init__(self, ratio=RETRY_BUDGET_RATIO, min_per_second=RETRY_MIN_PER_SECOND, capacity=100.0):
+        self.ratio = ratio
+        self.min_per_second = min_per_second
+        self.capacity = capacity
+        self._tokens = 0.0
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+        self.retries = 0
+        self.denied = 0
+
+    def deposit(self):
+        with self._lock:
+            self._tokens = min(self._tokens + self.ratio, self.capacity)
+
+    def withdraw(self) -> bool:
+        now = time.monotonic()
+        with self._lock:
+            self._tokens = min(self._tokens + (now - self._updated) * self.min_per_second, self.capacity)
+            self._updated = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                self.retries += 1
+                return True
+            self.denied += 1
+            return False
+
+
+def can_retry(method: str, attempt: int, budget: RetryBudget) -> bool:
+    return method in IDEMPOTENT_METHODS and attempt < MAX_RETRIES and budget.withdraw()
@@ -1,69 +1,435 @@
-from flask import Flask, request, jsonify, render_template_string, redirect
+from flask import (
+    Flask, Response, g, request, jsonify, render_template_string, redirect, stream_with_context
+)
+from http.cookiejar import DefaultCookiePolicy
+from requests.adapters import HTTPAdapter
+from werkzeug.datastructures import Headers
 import requests
+import argparse
+import os
+import sys
 import threading
 import time
 
+import metrics
+from balancing import STRATEGIES, make_strategy
+from health import MAX_RETRIES, RETRY_STATUSES, HealthMonitor, RetryBudget, can_retry
+from registry import Registry
+from response_cache import LB_CACHE_WAIT, SingleFlight, cache as response_cache, freshness, request_bypasses
+
 app = Flask(__name__)
 
-# --- Пул инстансов ---
-instances = [
-    {"ip": "127.0.0.1", "port": 5001, "active": True},
-    {"ip": "127.0.0.1", "port": 5002, "active": True},
-    {"ip": "127.0.0.1", "port": 5003, "active": True},
-]
+# --- Настройки соединений с инстансами ---
+UPSTREAM_POOL_SIZE = int(os.getenv("UPSTREAM_POOL_SIZE", "32"))         # keep-alive соединений на инстанс
+UPSTREAM_CONNECT_TIMEOUT = float(os.getenv("UPSTREAM_CONNECT_TIMEOUT", "2"))
+UPSTREAM_READ_TIMEOUT = float(os.getenv("UPSTREAM_READ_TIMEOUT", "30"))
+HEALTH_TIMEOUT = float(os.getenv("HEALTH_TIMEOUT", "1"))
+MAX_ATTEMPTS = MAX_RETRIES + 1
+STREAM_CHUNK_SIZE = int(os.getenv("STREAM_CHUNK_SIZE", "65536"))
+
+# --- Стратегия балансировки (balancing.py) ---
+LB_STRATEGY = os.getenv("LB_STRATEGY", "round_robin")
+HASH_HEADER = os.getenv("HASH_HEADER", "")  # ключ consistent_hash; пусто — IP клиента
+
+# заголовки одного соединения (RFC 7230, 6.1) — дальше прокси не передаются
+HOP_BY_HOP = {
+    "connection", "keep-alive", "proxy-authenticate", "proxy-authorization",
+    "te", "trailer", "trailers", "transfer-encoding", "upgrade",
+}
+
+# --- Пул инстансов: copy-on-write реестр с файлом конфигурации (registry.py) ---
+registry = Registry(
+    on_change=lambda: refresh_snapshot(),
+    on_removed=lambda inst: (monitor.forget(inst), close_session(inst)),
+    in_flight=metrics.in_flight,
+)
+
+strategy = make_strategy(LB_STRATEGY)
+
+
+def available_instances():
+    """Активные по проверкам, не исключённые circuit breaker'ом и не на дренировании."""
+    return [i for i in registry.instances if not i["draining"] and monitor.admits(i)]
+
+
+def refresh_snapshot():
+    """Передать стратегии снимок доступных инстансов (после любого изменения пула)."""
+    strategy.rebuild(available_instances())
 
-current_index = 0  # Round Robin указатель
+
+def set_strategy(name):
+    global strategy
+    new = make_strategy(name)
+    new.rebuild(available_instances())
+    strategy = new
+
+
+# --- Пулы keep-alive соединений: одна requests.Session на инстанс ---
+sessions = {}
+sessions_lock = threading.Lock()
+
+
+def get_session(inst):
+    """Session с пулом на UPSTREAM_POOL_SIZE соединений для инстанса."""
+    key = (inst["ip"], inst["port"])
+    session = sessions.get(key)
+    if session is None:
+        with sessions_lock:
+            session = sessions.get(key)
+            if session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=UPSTREAM_POOL_SIZE)
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+                # cookies разных клиентов не должны копиться в общей сессии
+                session.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+                sessions[key] = session
+    return session
+
+
+def close_session(inst):
+    with sessions_lock:
+        session = sessions.pop((inst["ip"], inst["port"]), None)
+    if session is not None:
+        session.close()
 
 
 # ФУНКЦИЯ ПРОВЕРКИ ДОСТУПНОСТИ ИНСТАНСОВ
-def health_check_loop():
-    while True:
-        for inst in instances:
-            try:
-                url = f"http://{inst['ip']}:{inst['port']}/health"
-                response = requests.get(url, timeout=1)
-                inst["active"] = (response.status_code == 200)
-            except:
-                inst["active"] = False
+def probe_instance(inst):
+    url = f"http://{inst['ip']}:{inst['port']}/health"
+    response = get_session(inst).get(url, timeout=HEALTH_TIMEOUT)
+    return response.status_code == 200
 
-        time.sleep(5)
 
+# активные проверки параллельно, пассивные — по результатам проксирования (health.py)
+monitor = HealthMonitor(lambda: registry.instances, probe_instance, refresh_snapshot)
+retry_budget = RetryBudget()
+refresh_snapshot()
 
-# Запускаем проверку в отдельном потоке
-threading.Thread(target=health_check_loop, daemon=True).start()
 
+health_checks_started = False
+health_checks_lock = threading.Lock()
 
-# ROUND ROBIN ВЫБОР ИНСТАНСА
-def get_next_instance():
-    global current_index
 
-    active_instances = [i for i in instances if i["active"]]
+def start_health_checks():
+    """
+    Проверки и слежение за файлом пула — фоновые потоки, по одному на процесс.
+    Запускаются при старте сервера (любого движка) или первым запросом, если
+    app подхвачен WSGI-сервером (gunicorn load_balancer:app и т.п.).
+    """
+    global health_checks_started
+    with health_checks_lock:
+        if not health_checks_started:
+            monitor.start()
+            registry.watch()
+            health_checks_started = True
 
-    if not active_instances:
-        return None
 
-    inst = active_instances[current_index % len(active_instances)]
-    current_index += 1
-    return inst
+# ВЫБОР ИНСТАНСА ТЕКУЩЕЙ СТРАТЕГИЕЙ
+def get_next_instance(key=None):
+    """key — ключ для consistent_hash (значение HASH_HEADER или IP клиента)."""
+    return strategy.pick(key)
 
 
-# ЭНДПОИНТЫ БАЛАНСИРОВЩИКА
+def balance_key(headers, client_ip):
+    return (headers.get(HASH_HEADER) if HASH_HEADER else None) or client_ip
 
-@app.route("/health")
-def balancer_health():
-    return jsonify(instances)
 
+def pick_instance(current, key, tried):
+    """
+    Инстанс по стратегии; для повтора или если инстанс в half_open уже занят
+    пробным запросом (monitor.allow) — любой другой ещё не опробованный.
+    """
+    inst = current.pick(key)
+    if inst is not None and not any(inst is t for t in tried) and monitor.allow(inst):
+        return inst
+    for other in current.snapshot:
+        if other is not inst and not any(other is t for t in tried) and monitor.allow(other):
+            return other
+    return None
 
-@app.route("/process")
-def process_request():
-    inst = get_next_instance()
 
-    if not inst:
-        return jsonify({"error": "Нет активных инстансов"}), 503
+# ЭНДПОИНТЫ БАЛАНСИРОВЩИКА
 
-    url = f"http://{inst['ip']}:{inst['port']}/process"
-    resp = requests.get(url)
-    return resp.json()
+@app.route("/health")
+def balancer_health():
+    return jsonify([{**inst, "active": monitor.active(inst), "circuit": monitor.state(inst)}
+                    for inst in registry.instances])
+
+
+@app.route("/metrics")
+def metrics_endpoint():
+    body = metrics.render(registry.instances, monitor, retry_budget, response_cache)
+    return Response(body, content_type=metrics.CONTENT_TYPE)
+
+
+# ПРОКСИРОВАНИЕ ЗАПРОСА НА ИНСТАНС
+
+PROXY_METHODS = ["GET", "POST", "PUT", "PATCH", "DELETE", "HEAD", "OPTIONS"]
+PROXY_ENDPOINTS = {"process_request", "catch_all"}
+
+
+@app.before_request
+def mark_started():
+    if not health_checks_started:
+        start_health_checks()
+    g.started = time.perf_counter()
+
+
+@app.after_request
+def observe_proxied(response):
+    """Ответ клиенту в lb_requests_total / lb_request_duration_seconds (служебные пути — нет)."""
+    if request.endpoint in PROXY_ENDPOINTS:
+        metrics.observe_request(response.status_code, time.perf_counter() - g.started)
+    return response
+
+
+def forward_headers():
+    """Заголовки клиента без hop-by-hop и Host, плюс X-Forwarded-*."""
+    headers = {
+        name: value for name, value in request.headers.items()
+        if name.lower() not in HOP_BY_HOP and name.lower() != "host"
+    }
+    forwarded_for = request.headers.get("X-Forwarded-For")
+    client = request.remote_addr or ""
+    headers["X-Forwarded-For"] = f"{forwarded_for}, {client}" if forwarded_for else client
+    headers["X-Forwarded-Host"] = request.host
+    headers["X-Forwarded-Proto"] = request.scheme
+    return headers
+
+
+def send_upstream(method, path, params, data, headers, key):
+    """
+    Отправить запрос на инстанс по текущей стратегии. Идемпотентный запрос,
+    не дошедший до инстанса или получивший 502/503/504, повторяется на другом
+    инстансе (не больше MAX_RETRIES, в рамках retry_budget).
+    Возвращает ((resp, inst, strategy, started), None) или (None, (текст ошибки, статус)).
+    """
+    current = strategy  # запрос завершается в той же стратегии, где начался
+    retry_budget.deposit()
+    tried = []
+    error = ("Нет активных инстансов", 503)
+
+    for attempt in range(MAX_ATTEMPTS):
+        inst = pick_instance(current, key, tried)
+        if not inst:
+            return None, error
+        tried.append(inst)
+
+        url = f"http://{inst['ip']}:{inst['port']}/{path}"
+        started = time.perf_counter()
+        current.on_start(inst)
+        metrics.backend_started(inst)
+        try:
+            resp = get_session(inst).request(
+                method, url, params=params, data=data, headers=headers,
+                stream=True,
+                allow_redirects=False,
+                timeout=(UPSTREAM_CONNECT_TIMEOUT, UPSTREAM_READ_TIMEOUT),
+            )
+        except requests.RequestException as exc:
+            elapsed = time.perf_counter() - started
+            current.on_finish(inst, elapsed, ok=False)
+            monitor.record(inst, ok=False)
+            metrics.backend_finished(inst, "timeout" if isinstance(exc, requests.Timeout) else "error", elapsed)
+            if isinstance(exc, requests.Timeout):
+                error = ("Инстанс не ответил вовремя", 504)
+            else:
+                error = ("Инстанс недоступен", 503)
+            if can_retry(method, attempt, retry_budget):
+                continue
+            return None, error
+
+        if resp.status_code in RETRY_STATUSES and can_retry(method, attempt, retry_budget):
+            resp.close()
+            elapsed = time.perf_counter() - started
+            current.on_finish(inst, elapsed, ok=False)
+            monitor.record(inst, ok=False)
+            metrics.backend_finished(inst, resp.status_code, elapsed)
+            continue
+
+        return (resp, inst, current, started), None
+
+    return None, error
+
+
+def complete_upstream(upstream, finished, upstream_failed=False):
+    """Отчитаться стратегии и монитору и вернуть соединение в пул (или закрыть)."""
+    resp, inst, current, started = upstream
+    elapsed = time.perf_counter() - started
+    healthy = not upstream_failed and resp.status_code < 500
+    current.on_finish(inst, elapsed, ok=finished and healthy)
+    monitor.record(inst, ok=healthy)
+    metrics.backend_finished(inst, "error" if upstream_failed else resp.status_code, elapsed)
+    if finished:
+        resp.raw.release_conn()  # тело прочитано — соединение обратно в пул
+    else:
+        resp.close()  # ответ не дочитан — соединение не переиспользуем
+
+
+def upstream_headers(resp):
+    return [(name, value) for name, value in resp.raw.headers.items() if name.lower() not in HOP_BY_HOP]
+
+
+def stream_response(upstream, prefix=b"", extra_headers=()):
+    """Ответ инстанса клиенту потоком по STREAM_CHUNK_SIZE, без буферизации тела."""
+    resp = upstream[0]
+
+    def body():
+        # decode_content=False — gzip и т.п. проходят как есть, вместе с Content-Encoding
+        finished = upstream_failed = False
+        try:
+            if prefix:
+                yield prefix
+            yield from resp.raw.stream(STREAM_CHUNK_SIZE, decode_content=False)
+            finished = True
+        except Exception:
+            upstream_failed = True  # обрыв со стороны инстанса; уход клиента — GeneratorExit
+            raise
+        finally:
+            complete_upstream(upstream, finished, upstream_failed)
+
+    headers = upstream_headers(resp) + list(extra_headers)
+    return Response(stream_with_context(body()), status=resp.status_code, headers=headers)
+
+
+def proxy(path):
+    """
+    Передать текущий запрос на инстанс: метод, query string, тело и заголовки.
+    Ответ (статус, заголовки, тело) отдаётся клиенту потоком. При включённом
+    кэше GET-запросы идут через cached_proxy.
+    """
+    if response_cache is not None:
+        if not request_bypasses(request.method, request.headers):
+            return cached_proxy(path)
+        if request.method == "GET":
+            response_cache.count("bypass")
+
+    upstream, error = send_upstream(
+        request.method, path, request.args.to_dict(flat=False), request.get_data(),
+        forward_headers(), balance_key(request.headers, request.remote_addr),
+    )
+    if upstream is None:
+        return jsonify({"error": error[0]}), error[1]
+    return stream_response(upstream)
+
+
+# КЭШ ОТВЕТОВ (response_cache.py)
+
+flights = SingleFlight()
+
+
+def read_for_cache(upstream):
+    """
+    Прочитать тело, если ответ можно кэшировать и оно не больше max_body.
+    Возвращает (body, cacheable); при cacheable=False ответ ещё не дочитан.
+    """
+    resp = upstream[0]
+    if freshness(resp.status_code, resp.raw.headers, time.time()) is None:
+        response_cache.count("uncacheable")
+        return b"", False
+    length = resp.raw.headers.get("Content-Length")
+    if length and length.isdigit() and int(length) > response_cache.max_body:
+        response_cache.count("uncacheable")
+        return b"", False
+    try:
+        body = resp.raw.read(response_cache.max_body + 1, decode_content=False)
+    except Exception:
+        complete_upstream(upstream, finished=False, upstream_failed=True)
+        raise
+    if len(body) > response_cache.max_body:
+        response_cache.count("uncacheable")
+        return body, False
+    complete_upstream(upstream, finished=True)
+    return body, True
+
+
+def cached_response(entry, state):
+    return Response(entry.body, status=entry.status, headers=entry.response_headers(state, time.time()))
+
+
+def revalidate(cache_key, path, params, headers, key, request_headers):
+    """Фоновое обновление устаревшей записи (stale-while-revalidate), одно на ключ."""
+    flight = ("revalidate", cache_key)
+    if not flights.begin(flight)[0]:
+        return
+
+    def run():
+        try:
+            upstream, _ = send_upstream("GET", path, params, b"", headers, key)
+            if upstream is None:
+                return
+            body, cacheable = read_for_cache(upstream)
+            if cacheable:
+                resp = upstream[0]
+                response_cache.store(cache_key, request_headers, resp.status_code, resp.raw.headers, body)
+                response_cache.count("revalidations")
+            else:
+                complete_upstream(upstream, finished=False)
+        except Exception:
+            pass  # не обновилось — до конца окна отдаётся старая запись
+        finally:
+            flights.end(flight)
+
+    threading.Thread(target=run, name="revalidate", daemon=True).start()
+
+
+def cached_proxy(path):
+    """
+    GET через кэш: свежая запись — HIT; устаревшая в окне stale-while-revalidate —
+    STALE и фоновое обновление; промах — один запрос к инстансу на ключ
+    (остальные одновременные промахи ждут его и получают COALESCED).
+    """
+    cache_key = f"/{path}?{request.query_string.decode('latin-1')}"
+    params = request.args.to_dict(flat=False)
+    headers = forward_headers()
+    key = balance_key(request.headers, request.remote_addr)
+
+    entry, state = response_cache.lookup(cache_key, request.headers)
+    if state == "fresh":
+        response_cache.count("hits")
+        return cached_response(entry, "HIT")
+    if state == "stale":
+        response_cache.count("stale_hits")
+        revalidate(cache_key, path, params, headers, key, Headers(request.headers.items()))
+        return cached_response(entry, "STALE")
+
+    leader, event = flights.begin(cache_key)
+    if not leader:
+        event.wait(LB_CACHE_WAIT)
+        entry, state = response_cache.lookup(cache_key, request.headers)
+        if entry is not None:
+            response_cache.count("coalesced")
+            return cached_response(entry, "COALESCED")
+        # ответ лидера не попал в кэш — идём к инстансу сами
+
+    response_cache.count("misses")
+    try:
+        upstream, error = send_upstream("GET", path, params, b"", headers, key)
+        if upstream is None:
+            return jsonify({"error": error[0]}), error[1]
+        body, cacheable = read_for_cache(upstream)
+        if not cacheable:
+            return stream_response(upstream, prefix=body, extra_headers=[("X-Cache", "MISS")])
+        resp = upstream[0]
+        response_cache.store(cache_key, request.headers, resp.status_code, resp.raw.headers, body)
+        return Response(body, status=resp.status_code,
+                        headers=upstream_headers(resp) + [("X-Cache", "MISS")])
+    finally:
+        if leader:
+            flights.end(cache_key)
+
+
+@app.route("/cache/stats")
+def cache_stats():
+    if response_cache is None:
+        return jsonify({"enabled": False})
+    return jsonify(response_cache.stats())
+
+
+@app.route("/process", methods=PROXY_METHODS)
+def process_request():
+    return proxy("process")
 
 
 # WEB UI
@@ -71,20 +437,36 @@ def process_request():
 HTML_TEMPLATE = """
 <h1>Load Balancer UI</h1>
 
+<p>Стратегия: <b>{{ strategy }}</b></p>
+
+<p>Всего: {{ total.rps }} req/s, {{ total.requests }} запросов, ошибок {{ total.error_percent }}%,
+p50 {{ total.p50_ms }} мс, p99 {{ total.p99_ms }} мс (<a href="/metrics">/metrics</a>)</p>
+
 <h3>Активные инстансы:</h3>
 
 <table border="1" cellpadding="5">
-<tr><th>#</th><th>IP</th><th>Port</th><th>Status</th><th>Action</th></tr>
+<tr><th>#</th><th>IP</th><th>Port</th><th>Weight</th><th>Status</th>
+<th>req/s</th><th>Запросов</th><th>Ошибок, %</th><th>В работе</th><th>p50, мс</th><th>p99, мс</th><th>Action</th></tr>
 
 {% for inst in instances %}
 <tr>
     <td>{{ loop.index0 }}</td>
     <td>{{ inst.ip }}</td>
     <td>{{ inst.port }}</td>
-    <td>{{ "ACTIVE" if inst.active else "DOWN" }}</td>
+    <td>{{ inst.weight }}</td>
+    <td>{{ "DRAINING" if inst.draining else
+           ("EJECTED" if circuits[loop.index0] == "open" else "ACTIVE") if actives[loop.index0] else "DOWN" }}</td>
+    {% set m = stats[loop.index0] %}
+    <td>{{ m.rps }}</td>
+    <td>{{ m.requests }}</td>
+    <td>{{ m.error_percent }}</td>
+    <td>{{ m.in_flight }}</td>
+    <td>{{ m.p50_ms if m.p50_ms is not none else "—" }}</td>
+    <td>{{ m.p99_ms if m.p99_ms is not none else "—" }}</td>
     <td>
         <form action="/remove_instance" method="post">
-            <input type="hidden" name="index" value="{{ loop.index0 }}">
+            <input type="hidden" name="ip" value="{{ inst.ip }}">
+            <input type="hidden" name="port" value="{{ inst.port }}">
             <button type="submit">Удалить</button>
         </form>
     </td>
@@ -97,52 +479,73 @@ HTML_TEMPLATE = """
 <form action="/add_instance" method="post">
     IP: <input type="text" name="ip" required>
     Port: <input type="number" name="port" required>
+    Weight: <input type="number" name="weight" value="1" min="1">
     <button type="submit">Добавить</button>
 </form>
 """
 
 @app.route("/")
 def index():
-    return render_template_string(HTML_TEMPLATE, instances=instances)
+    instances = registry.instances
+    return render_template_string(
+        HTML_TEMPLATE, instances=instances, strategy=strategy.name,
+        circuits=[monitor.state(inst) for inst in instances],
+        actives=[monitor.active(inst) for inst in instances],
+        stats=[metrics.backend_summary(inst) for inst in instances], total=metrics.total_summary(),
+    )
 
 
 @app.route("/add_instance", methods=["POST"])
 def add_instance():
-    ip = request.form["ip"]
-    port = int(request.form["port"])
-
-    instances.append({"ip": ip, "port": port, "active": True})
+    entry = {"ip": request.form.get("ip"), "port": request.form.get("port"),
+             "weight": request.form.get("weight") or 1}
+    try:
+        registry.add(entry)
+    except ValueError as exc:
+        return jsonify({"error": str(exc)}), 400
     return redirect("/")
 
 
 @app.route("/remove_instance", methods=["POST"])
 def remove_instance():
-    index = int(request.form["index"])
-    if 0 <= index < len(instances):
-        instances.pop(index)
+    """Инстанс по ip и port уходит на дренирование и удаляется, когда закончит начатые запросы."""
+    try:
+        port = int(request.form.get("port", ""))
+    except ValueError:
+        return jsonify({"error": "Неверный порт"}), 400
+    if not registry.remove(request.form.get("ip"), port):
+        return jsonify({"error": "Инстанс не найден"}), 404
     return redirect("/")
 
 
 # ПЕРЕХВАТ ВСЕХ ПРОЧИХ ЗАПРОСОВ
 
-@app.route("/<path:path>")
+@app.route("/<path:path>", methods=PROXY_METHODS)
 def catch_all(path):
-    inst = get_next_instance()
-
-    if not inst:
-        return jsonify({"error": "Нет активных инстансов"}), 503
-
-    url = f"http://{inst['ip']}:{inst['port']}/{path}"
-
-    try:
-        resp = requests.get(url)
-        return resp.text
-    except:
-        return jsonify({"error": "Инстанс недоступен"}), 503
+    return proxy(path)
 
 
 # ЗАПУСК СЕРВЕРА
 
+# --engine threaded — Flask/werkzeug, поток на запрос (по умолчанию);
+# --engine async — asyncio + aiohttp (async_engine.py), тот же реестр и UI
+
 if __name__ == "__main__":
-    print("Балансировщик работает на порту 8000")
-    app.run(port=8000)
+    parser = argparse.ArgumentParser(description="Балансировщик нагрузки")
+    parser.add_argument("--engine", choices=["threaded", "async"],
+                        default=os.getenv("LB_ENGINE", "threaded"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("LB_PORT", "8000")))
+    parser.add_argument("--strategy", choices=list(STRATEGIES), default=LB_STRATEGY)
+    args = parser.parse_args()
+
+    if args.engine == "async":
+        # async_engine берёт реестр, монитор и UI из модуля load_balancer; запущенный
+        # скриптом, он называется __main__ — без этого импорт собрал бы их второй раз
+        sys.modules.setdefault("load_balancer", sys.modules[__name__])
+        from async_engine import run
+        run(args.port, args.strategy)
+    else:
+        set_strategy(args.strategy)
+        start_health_checks()
+        print(f"Балансировщик работает на порту {args.port}")
+        app.run(port=args.port, threaded=True)
@@ -0,0 +1,153 @@
+# loadtest.py
+"""
+Нагрузочный тест балансировщика по стратегиям.
+
+Запускает N инстансов app_instance.py (с искусственной задержкой и ошибками
+через INSTANCE_LATENCY_MS / INSTANCE_LATENCY_JITTER_MS / INSTANCE_FAIL_RATE),
+для каждой стратегии поднимает балансировщик с пулом из этих инстансов
+(отдельный файл LB_CONFIG), прогревает и гоняет GET /process. Печатает
+req/s, p50/p99/p99.9, ошибки и долю запросов каждого инстанса (по /metrics
+балансировщика).
+
+Задержка и ошибки задаются для всех инстансов (--latency 20) или для
+одного порта (--latency 5003=200 --fail 5004=0.3):
+
+    python loadtest.py --instances 4 --latency 10 5003=150 --fail 5004=0.2
+    python loadtest.py --strategies round_robin p2c_ewma --engine async --concurrency 200
+"""
+import argparse
+import asyncio
+import json
+import os
+import re
+import tempfile
+
+import requests
+
+from balancing import STRATEGIES
+from bench_engines import drive, raise_nofile_limit, spawn, wait_ready
+
+BALANCER_PORT = 8300
+METRIC_LINE = re.compile(r'^lb_backend_requests_total\{backend="([^"]+)",code="([^"]+)"\} (\S+)$')
+
+
+def per_port(specs: list[str], ports: list[int]) -> dict:
+    """["20", "5003=200"] -> {5001: "20", 5002: "20", 5003: "200"}."""
+    values = {}
+    for spec in specs:
+        port, sep, value = spec.rpartition("=")
+        targets = [int(port)] if sep else ports
+        for target in targets:
+            values[target] = value
+    return values
+
+
+def start_instances(ports, latency, jitter, fail):
+    procs = []
+    for port in ports:
+        env = {}
+        if port in latency:
+            env["INSTANCE_LATENCY_MS"] = latency[port]
+        if port in jitter:
+            env["INSTANCE_LATENCY_JITTER_MS"] = jitter[port]
+        if port in fail:
+            env["INSTANCE_FAIL_RATE"] = fail[port]
+        procs.append(spawn(["app_instance.py", str(port)], env))
+    for port in ports:
+        asyncio.run(wait_ready(f"http://127.0.0.1:{port}/health"))
+    return procs
+
+
+def write_pool(ports: list[int]) -> str:
+    """Файл пула для балансировщика (registry.py) — только запущенные инстансы."""
+    fd, path = tempfile.mkstemp(prefix="lb-pool-", suffix=".json")
+    with os.fdopen(fd, "w") as f:
+        json.dump([{"ip": "127.0.0.1", "port": port, "weight": 1} for port in ports], f)
+    return path
+
+
+def backend_counts(base: str) -> dict:
+    return parse_counts(requests.get(f"{base}/metrics").text)
+
+
+def parse_counts(text: str) -> dict:
+    """{backend: [запросов, ошибок]} по lb_backend_requests_total."""
+    counts = {}
+    for line in text.splitlines():
+        match = METRIC_LINE.match(line)
+        if match:
+            backend, code, value = match.group(1), match.group(2), float(match.group(3))
+            entry = counts.setdefault(backend, [0, 0])
+            entry[0] += value
+            if not code.isdigit() or int(code) >= 500:
+                entry[1] += value
+    return counts
+
+
+def run_strategy(name, args, pool) -> tuple[dict, dict]:
+    base = f"http://127.0.0.1:{BALANCER_PORT}"
+    balancer = spawn(["load_balancer.py", "--engine", args.engine, "--port", str(BALANCER_PORT),
+                      "--strategy", name], {"LB_CONFIG": pool})
+    try:
+        asyncio.run(wait_ready(f"{base}/health"))
+        if args.warmup:
+            asyncio.run(drive(f"{base}/process", args.warmup, min(args.concurrency, args.warmup)))
+        before = backend_counts(base)
+        result = asyncio.run(drive(f"{base}/process", args.requests, args.concurrency))
+        after = backend_counts(base)
+    finally:
+        balancer.terminate()
+        balancer.wait()
+    return result, shares(before, after)
+
+
+def shares(before: dict, after: dict) -> dict:
+    """{backend: (запросов, ошибок)} за прогон — разница двух backend_counts."""
+    return {
+        backend: (total - before.get(backend, [0, 0])[0], errors - before.get(backend, [0, 0])[1])
+        for backend, (total, errors) in after.items()
+    }
+
+
+def spread(shares: dict) -> str:
+    """Доля запросов каждого инстанса: "5001:50%  5002:50%(err 3)"."""
+    total = sum(count for count, _ in shares.values()) or 1
+    return "  ".join(
+        f"{backend.rsplit(':', 1)[1]}:{100 * count / total:.0f}%" + (f"(err {errors:.0f})" if errors else "")
+        for backend, (count, errors) in sorted(shares.items())
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Нагрузочный тест балансировщика по стратегиям")
+    parser.add_argument("--instances", type=int, default=3)
+    parser.add_argument("--base-port", type=int, default=5001)
+    parser.add_argument("--latency", nargs="*", default=[], help="мс: 20 или ПОРТ=200")
+    parser.add_argument("--jitter", nargs="*", default=[], help="мс случайной добавки: 10 или ПОРТ=50")
+    parser.add_argument("--fail", nargs="*", default=[], help="доля ошибок 500: 0.1 или ПОРТ=0.3")
+    parser.add_argument("--strategies", nargs="+", choices=list(STRATEGIES), default=list(STRATEGIES))
+    parser.add_argument("--engine", choices=["threaded", "async"], default="threaded")
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--requests", type=int, default=3000)
+    parser.add_argument("--warmup", type=int, default=200)
+    args = parser.parse_args()
+
+    raise_nofile_limit()
+    ports = [args.base_port + i for i in range(args.instances)]
+    procs = start_instances(ports, per_port(args.latency, ports), per_port(args.jitter, ports),
+                            per_port(args.fail, ports))
+    pool = write_pool(ports)
+    try:
+        print(f"{'strategy':<22} {'req/s':>8} {'p50 ms':>8} {'p99 ms':>8} {'p99.9 ms':>9} {'errors':>7}  распределение")
+        for name in args.strategies:
+            result, counts = run_strategy(name, args, pool)
+            print(f"{name:<22} {result['rps']:>8} {result['p50_ms']:>8} {result['p99_ms']:>8} "
+                  f"{result['p999_ms']:>9} {result['errors']:>7}  {spread(counts)}")
+    finally:
+        for proc in procs:
+            proc.terminate()
+        os.remove(pool)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,236 @@
+# metrics.py
+"""
+Метрики балансировщика: по каждому инстансу и в целом.
+
+- lb_backend_requests_total{backend, code} — ответы инстансов по статусу;
+  code="timeout" / "error" — запрос не дошёл или ответ оборвался;
+- lb_backend_request_duration_seconds{backend} — время запроса к инстансу
+  до конца тела;
+- lb_backend_in_flight{backend} — запросов к инстансу в работе;
+- lb_requests_total{code}, lb_request_duration_seconds — ответы клиентам
+  (с повторами и кэшем); время в threaded-движке — до заголовков ответа,
+  в async — до конца тела.
+
+render() отдаёт всё в текстовом формате Prometheus для /metrics,
+backend_summary() — сводку для веб-интерфейса (req/s, ошибки, p50/p99).
+"""
+import os
+import threading
+import time
+from bisect import bisect_left
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+RATE_WINDOW = int(os.getenv("METRICS_RATE_WINDOW", "10"))  # секунд для req/s в интерфейсе
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _labels(names: tuple, values: tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{value}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value) -> str:
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    def __init__(self, name: str, help_text: str, labels: tuple = (), kind: str = "counter"):
+        self.name, self.help, self.labels, self.kind = name, help_text, labels, kind
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values, amount=1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def values(self) -> dict:
+        with self._lock:
+            return dict(self._values)
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        lines += [f"{self.name}{_labels(self.labels, key)} {_number(v)}"
+                  for key, v in sorted(self.values().items())]
+        return lines
+
+
+class Histogram:
+    """Гистограмма с фиксированными границами; сумма и число — как в Prometheus."""
+
+    def __init__(self, name: str, help_text: str, labels: tuple = (), buckets=LATENCY_BUCKETS):
+        self.name, self.help, self.labels = name, help_text, labels
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *label_values):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def quantile(self, q: float, *label_values) -> float | None:
+        """Оценка квантиля линейной интерполяцией внутри корзины (как histogram_quantile)."""
+        with self._lock:
+            series = self._series.get(label_values)
+            if not series or not series[2]:
+                return None
+            counts, total = list(series[0]), series[2]
+        rank, cumulative = q * total, 0
+        for index, bucket in enumerate(counts):
+            if cumulative + bucket >= rank and bucket:
+                if index == len(self.buckets):
+                    return self.buckets[-1]
+                lower = self.buckets[index - 1] if index else 0.0
+                return lower + (self.buckets[index] - lower) * (rank - cumulative) / bucket
+            cumulative += bucket
+        return self.buckets[-1]
+
+    def render(self) -> list[str]:
+        with self._lock:
+            items = sorted((key, (list(s[0]), s[1], s[2])) for key, s in self._series.items())
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for key, (counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket
+                le = 'le="+Inf"' if bound == float("inf") else f'le="{_number(bound)}"'
+                lines.append(f"{self.name}_bucket{_labels(self.labels, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labels, key)} {_number(total)}")
+            lines.append(f"{self.name}_count{_labels(self.labels, key)} {count}")
+        return lines
+
+
+class Rate:
+    """Событий в секунду за последние RATE_WINDOW секунд (кольцо посекундных слотов)."""
+
+    def __init__(self, window: int = RATE_WINDOW):
+        self.window = window
+        self._slots = [[0, 0] for _ in range(window)]  # [секунда, число]
+        self._lock = threading.Lock()
+
+    def mark(self):
+        second = int(time.monotonic())
+        with self._lock:
+            slot = self._slots[second % self.window]
+            if slot[0] != second:
+                slot[0], slot[1] = second, 0
+            slot[1] += 1
+
+    def per_second(self) -> float:
+        now = int(time.monotonic())
+        with self._lock:
+            return sum(n for second, n in self._slots if now - self.window < second <= now) / self.window
+
+
+backend_requests = Counter(
+    "lb_backend_requests_total", "Ответы инстансов по статусу", ("backend", "code"),
+)
+backend_duration = Histogram(
+    "lb_backend_request_duration_seconds", "Время запроса к инстансу до конца тела", ("backend",),
+)
+backend_in_flight = Counter(
+    "lb_backend_in_flight", "Запросов к инстансу в работе", ("backend",), kind="gauge",
+)
+requests_total = Counter("lb_requests_total", "Ответы клиентам по статусу", ("code",))
+request_duration = Histogram(
+    "lb_request_duration_seconds", "Время ответа клиенту",
+)
+
+COLLECTORS = (backend_requests, backend_duration, backend_in_flight, requests_total, request_duration)
+
+_rates = {}
+_rates_lock = threading.Lock()
+
+
+def backend_label(inst) -> str:
+    return f"{inst['ip']}:{inst['port']}"
+
+
+def _rate(label: str) -> Rate:
+    rate = _rates.get(label)
+    if rate is None:
+        with _rates_lock:
+            rate = _rates.setdefault(label, Rate())
+    return rate
+
+
+def backend_started(inst):
+    backend_in_flight.inc(backend_label(inst))
+
+
+def backend_finished(inst, code, elapsed: float):
+    """code — HTTP-статус или "timeout" / "error"."""
+    label = backend_label(inst)
+    backend_in_flight.inc(label, amount=-1)
+    backend_requests.inc(label, str(code))
+    backend_duration.observe(elapsed, label)
+    _rate(label).mark()
+
+
+def in_flight(inst) -> int:
+    return backend_in_flight.values().get((backend_label(inst),), 0)
+
+
+def observe_request(code: int, elapsed: float):
+    requests_total.inc(str(code))
+    request_duration.observe(elapsed)
+    _rate("").mark()
+
+
+def _summary(label: str, codes: dict, quantile) -> dict:
+    total = sum(codes.values())
+    errors = sum(n for code, n in codes.items() if not code.isdigit() or int(code) >= 500)
+    p50, p99 = quantile(0.5), quantile(0.99)
+    return {
+        "rps": round(_rate(label).per_second(), 1),
+        "requests": total,
+        "error_percent": round(100 * errors / total, 1) if total else 0.0,
+        "p50_ms": round(p50 * 1000, 1) if p50 is not None else None,
+        "p99_ms": round(p99 * 1000, 1) if p99 is not None else None,
+    }
+
+
+def backend_summary(inst) -> dict:
+    label = backend_label(inst)
+    codes = {code: n for (backend, code), n in backend_requests.values().items() if backend == label}
+    summary = _summary(label, codes, lambda q: backend_duration.quantile(q, label))
+    summary["in_flight"] = in_flight(inst)
+    return summary
+
+
+def total_summary() -> dict:
+    codes = {code: n for (code,), n in requests_total.values().items()}
+    return _summary("", codes, request_duration.quantile)
+
+
+def render(instances, monitor, retry_budget, cache=None) -> str:
+    """Все метрики плюс текущее состояние пула, повторов и кэша."""
+    lines = []
+    for collector in COLLECTORS:
+        lines += collector.render()
+
+    lines += ["# HELP lb_backend_up Инстанс проходит проверки и не исключён", "# TYPE lb_backend_up gauge"]
+    lines += [f'lb_backend_up{{backend="{backend_label(inst)}",circuit="{monitor.state(inst)}"}} '
+              f'{int(monitor.admits(inst))}' for inst in instances]
+    lines += ["# HELP lb_retries_total Повторы запросов", "# TYPE lb_retries_total counter",
+              f"lb_retries_total {retry_budget.retries}",
+              "# HELP lb_retries_denied_total Повторы, не пропущенные бюджетом",
+              "# TYPE lb_retries_denied_total counter",
+              f"lb_retries_denied_total {retry_budget.denied}"]
+    if cache is not None:
+        stats = cache.stats()
+        lines += ["# HELP lb_cache_events_total События кэша ответов", "# TYPE lb_cache_events_total counter"]
+        lines += [f'lb_cache_events_total{{event="{name}"}} {stats[name]}' for name in sorted(cache.counters)]
+        lines += ["# HELP lb_cache_bytes Размер тел в кэше", "# TYPE lb_cache_bytes gauge",
+                  f"lb_cache_bytes {stats['bytes']}",
+                  "# HELP lb_cache_entries Записей в кэше", "# TYPE lb_cache_entries gauge",
+                  f"lb_cache_entries {stats['entries']}"]
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,188 @@
+# registry.py
+"""
+Реестр инстансов балансировщика: copy-on-write.
+
+- registry.instances — неизменяемый кортеж; любое изменение пула собирает
+  новый кортеж под блокировкой и подменяет ссылку одним присваиванием.
+  Потоки запросов и проверок читают снимок без блокировок: начатый обход
+  видит согласованный пул, даже если его в это время меняют.
+- Состав пула хранится в JSON-файле (LB_CONFIG): изменения через веб-интерфейс
+  записываются в него, а правка файла руками подхватывается на лету
+  (проверка mtime раз в LB_CONFIG_POLL секунд).
+- Удаление — с дренированием: инстанс помечается draining и перестаёт
+  получать новые запросы, реестр ждёт завершения начатых (не дольше
+  DRAIN_TIMEOUT секунд) и только потом убирает его из пула.
+- Инстанс определяется парой (ip, port), а не индексом в списке.
+"""
+import json
+import os
+import threading
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+LB_CONFIG = os.getenv("LB_CONFIG", os.path.join(HERE, "instances.json"))
+LB_CONFIG_POLL = float(os.getenv("LB_CONFIG_POLL", "1"))
+DRAIN_TIMEOUT = float(os.getenv("DRAIN_TIMEOUT", "30"))
+DRAIN_POLL = 0.1
+
+DEFAULT_INSTANCES = [
+    {"ip": "127.0.0.1", "port": 5001, "weight": 1},
+    {"ip": "127.0.0.1", "port": 5002, "weight": 1},
+    {"ip": "127.0.0.1", "port": 5003, "weight": 1},
+]
+CONFIG_FIELDS = ("ip", "port", "weight", "health_interval")
+
+
+def backend_key(inst):
+    return (inst["ip"], inst["port"])
+
+
+def make_instance(entry: dict) -> dict:
+    """Запись конфига -> инстанс реестра; ValueError при неверных полях."""
+    try:
+        inst = {"ip": str(entry["ip"]), "port": int(entry["port"]), "weight": int(entry.get("weight", 1))}
+        if "health_interval" in entry:
+            inst["health_interval"] = float(entry["health_interval"])
+    except (KeyError, TypeError, ValueError) as exc:
+        raise ValueError(f"Неверная запись инстанса {entry!r}: {exc}") from exc
+    if not 0 < inst["port"] < 65536 or inst["weight"] < 1:
+        raise ValueError(f"Неверная запись инстанса {entry!r}")
+    inst["draining"] = False
+    return inst
+
+
+class Registry:
+    """
+    on_change() — пул изменился (пересобрать стратегию), on_removed(inst) —
+    инстанс окончательно убран (закрыть соединения), in_flight(inst) — число
+    запросов к инстансу в работе.
+    """
+
+    def __init__(self, path=LB_CONFIG, on_change=None, on_removed=None, in_flight=None):
+        self.path = path
+        self.on_change = on_change or (lambda: None)
+        self.on_removed = on_removed or (lambda inst: None)
+        self.in_flight = in_flight or (lambda inst: 0)
+        self._lock = threading.Lock()
+        self._mtime = None
+        self._watcher = None
+        self.instances = ()
+        self.instances = tuple(make_instance(entry) for entry in self._read() or DEFAULT_INSTANCES)
+
+    # --- изменения пула ---
+
+    def _publish(self, instances, save=True):
+        """Подменить снимок (вызывается под self._lock)."""
+        self.instances = tuple(instances)
+        if save:
+            self._save()
+
+    def find(self, ip, port):
+        return next((inst for inst in self.instances if backend_key(inst) == (ip, port)), None)
+
+    def add(self, entry: dict, save=True) -> dict:
+        """Добавить инстанс; для уже известного — обновить вес и отменить дренирование."""
+        new = make_instance(entry)
+        with self._lock:
+            current = self.find(*backend_key(new))
+            if current is None:
+                self._publish(self.instances + (new,), save)
+            elif current["draining"] or any(current.get(f) != new.get(f) for f in CONFIG_FIELDS):
+                # новая запись вместо старой, дренирование отменяется; здоровье —
+                # в HealthMonitor по (ip, port), переносить его не нужно
+                self._publish([new if inst is current else inst for inst in self.instances], save)
+            else:
+                return current
+        self.on_change()
+        return new
+
+    def remove(self, ip, port, save=True) -> bool:
+        """Начать дренирование; False — такого инстанса нет."""
+        with self._lock:
+            inst = self.find(ip, port)
+            if inst is None:
+                return False
+            if inst["draining"]:
+                return True
+            drained = {**inst, "draining": True}
+            self._publish([drained if i is inst else i for i in self.instances], save)
+        self.on_change()
+        threading.Thread(target=self._drain, args=(drained,), name="drain", daemon=True).start()
+        return True
+
+    def _drain(self, inst):
+        deadline = time.monotonic() + DRAIN_TIMEOUT
+        while True:
+            time.sleep(DRAIN_POLL)  # сначала пауза — запросы, выбравшие инстанс до пометки, успевают стартовать
+            if self.in_flight(inst) <= 0 or time.monotonic() >= deadline:
+                break
+        with self._lock:
+            if not any(i is inst for i in self.instances):
+                return  # инстанс вернули в пул (add) — удалять нечего
+            self._publish([i for i in self.instances if i is not inst], save=False)
+        self.on_change()
+        self.on_removed(inst)
+
+    # --- файл конфигурации ---
+
+    def config(self) -> list[dict]:
+        """Состав пула без инстансов на дренировании, в формате файла."""
+        return [
+            {field: inst[field] for field in CONFIG_FIELDS if field in inst}
+            for inst in self.instances if not inst["draining"]
+        ]
+
+    def _read(self):
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                self._mtime = os.stat(f.fileno()).st_mtime_ns
+                entries = json.load(f)
+        except FileNotFoundError:
+            return None
+        if not isinstance(entries, list):
+            raise ValueError(f"{self.path}: ожидается список инстансов")
+        return entries
+
+    def _save(self):
+        """Записать атомарно (временный файл + os.replace), чтобы слежение не прочло половину."""
+        tmp = f"{self.path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self.config(), f, ensure_ascii=False, indent=2)
+        os.replace(tmp, self.path)
+        self._mtime = os.stat(self.path).st_mtime_ns
+
+    def reload(self):
+        """Привести пул к файлу: новые — добавить, изменённые — обновить, пропавшие — дренировать."""
+        try:
+            entries = self._read()
+            wanted = {backend_key(inst): inst for inst in map(make_instance, entries or ())}
+        except ValueError as exc:
+            print(f"Конфигурация пула не применена: {exc}")
+            return
+        if entries is None:
+            return  # файл удалён — пул не трогаем
+        for key, inst in wanted.items():
+            self.add(inst, save=False)
+        for inst in self.instances:
+            if backend_key(inst) not in wanted:
+                self.remove(*backend_key(inst), save=False)
+
+    def _changed(self) -> bool:
+        try:
+            return os.stat(self.path).st_mtime_ns != self._mtime
+        except FileNotFoundError:
+            return False
+
+    def watch(self):
+        """Следить за файлом конфигурации в фоновом потоке."""
+        if self._watcher is not None:
+            return
+
+        def run():
+            while True:
+                time.sleep(LB_CONFIG_POLL)
+                if self._changed():
+                    self.reload()
+
+        self._watcher = threading.Thread(target=run, name="config-watch", daemon=True)
+        self._watcher.start()
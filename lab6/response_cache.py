@@ -0,0 +1,245 @@
+# response_cache.py
+"""
+Кэш ответов балансировщика (включается LB_CACHE_ENABLED=1).
+
+- Кэшируются ответы на GET со статусом из CACHEABLE_STATUSES, если инстанс
+  разрешил: Cache-Control max-age / s-maxage или Expires; no-store, private,
+  no-cache и Vary: * — не кэшируются. Запрос с Authorization или
+  Cache-Control: no-cache / no-store идёт мимо кэша.
+- Vary: заголовки из Vary входят в ключ варианта.
+- stale-while-revalidate=N: после истечения свежести ещё N секунд отдаётся
+  старый ответ, а обновление идёт в фоне (одно на ключ).
+- LRU с ограничением по числу записей и по сумме размеров тел; тела
+  больше LB_CACHE_MAX_BODY не кэшируются.
+- Схлопывание запросов (single-flight): при N одновременных промахах по
+  одному ключу к инстансу идёт один запрос, остальные ждут его результат.
+"""
+import asyncio
+import os
+import threading
+import time
+from collections import OrderedDict
+from email.utils import parsedate_to_datetime
+
+LB_CACHE_ENABLED = os.getenv("LB_CACHE_ENABLED", "0") == "1"
+LB_CACHE_MAX_ENTRIES = int(os.getenv("LB_CACHE_MAX_ENTRIES", "10000"))
+LB_CACHE_MAX_BYTES = int(os.getenv("LB_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+LB_CACHE_MAX_BODY = int(os.getenv("LB_CACHE_MAX_BODY", str(1024 * 1024)))
+LB_CACHE_WAIT = float(os.getenv("LB_CACHE_WAIT", "30"))  # сколько ждать лидера при схлопывании
+
+CACHEABLE_STATUSES = {200, 203, 204, 300, 301, 404, 410}
+# заголовки, которые не сохраняются в кэше: относятся к одному ответу или
+# соединению; Content-Length пересчитывается при отдаче
+SKIP_STORED_HEADERS = {
+    "age", "date", "set-cookie", "x-cache", "content-length",
+    "connection", "keep-alive", "proxy-authenticate", "proxy-authorization",
+    "te", "trailer", "trailers", "transfer-encoding", "upgrade",
+}
+
+
+def parse_cache_control(value: str | None) -> dict:
+    directives = {}
+    for part in (value or "").split(","):
+        name, _, arg = part.strip().partition("=")
+        if name:
+            directives[name.lower()] = arg.strip().strip('"')
+    return directives
+
+
+def _seconds(value) -> float | None:
+    try:
+        return max(float(value), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+
+def request_bypasses(method: str, headers) -> bool:
+    """Запрос не обслуживается из кэша."""
+    if method != "GET" or headers.get("Authorization"):
+        return True
+    directives = parse_cache_control(headers.get("Cache-Control"))
+    return "no-cache" in directives or "no-store" in directives or headers.get("Pragma") == "no-cache"
+
+
+def freshness(status: int, headers, now: float):
+    """
+    (свежесть в секундах, окно stale-while-revalidate, Vary) или None, если
+    ответ кэшировать нельзя. headers — заголовки ответа (регистр не важен).
+    """
+    if status not in CACHEABLE_STATUSES:
+        return None
+    directives = parse_cache_control(headers.get("Cache-Control"))
+    if {"no-store", "private", "no-cache"} & directives.keys() or headers.get("Set-Cookie"):
+        return None
+    vary = tuple(sorted(h.strip().lower() for h in (headers.get("Vary") or "").split(",") if h.strip()))
+    if "*" in vary:
+        return None
+
+    ttl = _seconds(directives.get("s-maxage"))  # s-maxage=0 — не кэшировать, даже при max-age
+    if ttl is None:
+        ttl = _seconds(directives.get("max-age"))
+    if ttl is None and headers.get("Expires"):
+        try:
+            expires = parsedate_to_datetime(headers["Expires"]).timestamp()
+            date = parsedate_to_datetime(headers["Date"]).timestamp() if headers.get("Date") else time.time()
+            ttl = max(expires - date, 0.0)
+        except (TypeError, ValueError):
+            ttl = 0.0
+    if not ttl:
+        return None
+    ttl -= _seconds(headers.get("Age")) or 0.0
+    if ttl <= 0:
+        return None
+    return ttl, _seconds(directives.get("stale-while-revalidate")) or 0.0, vary
+
+
+class CachedResponse:
+    __slots__ = ("status", "headers", "body", "stored_at", "fresh_until", "stale_until", "size")
+
+    def __init__(self, status, headers, body, now, ttl, swr):
+        self.status = status
+        self.headers = [(k, v) for k, v in headers if k.lower() not in SKIP_STORED_HEADERS]
+        self.body = body
+        self.stored_at = now
+        self.fresh_until = now + ttl
+        self.stale_until = now + ttl + swr
+        self.size = len(body) + sum(len(k) + len(v) for k, v in self.headers)
+
+    def response_headers(self, state: str, now: float) -> list:
+        return self.headers + [("Age", str(int(now - self.stored_at))), ("X-Cache", state)]
+
+
+class ResponseCache:
+    """LRU по (путь с query, значения Vary-заголовков) с лимитами записей и байт."""
+
+    def __init__(self, max_entries=LB_CACHE_MAX_ENTRIES, max_bytes=LB_CACHE_MAX_BYTES,
+                 max_body=LB_CACHE_MAX_BODY):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.max_body = max_body
+        self._entries = OrderedDict()
+        self._vary = {}  # путь -> имена Vary-заголовков последнего ответа
+        self._variants = {}  # путь -> число записей, чтобы _vary не рос без предела
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.counters = dict.fromkeys(
+            ("hits", "stale_hits", "misses", "coalesced", "stores", "evictions",
+             "uncacheable", "revalidations", "bypass"), 0)
+
+    def count(self, name: str, amount: int = 1):
+        with self._lock:
+            self.counters[name] += amount
+
+    def _key(self, path: str, request_headers, vary=None):
+        vary = self._vary.get(path, ()) if vary is None else vary
+        return (path,) + tuple(request_headers.get(h) or "" for h in vary)
+
+    def lookup(self, path: str, request_headers, now: float | None = None):
+        """(запись, "fresh" | "stale") или (None, None). Просроченное удаляется."""
+        now = now or time.time()
+        with self._lock:
+            key = self._key(path, request_headers)
+            entry = self._entries.get(key)
+            if entry is None:
+                return None, None
+            if now < entry.fresh_until:
+                self._entries.move_to_end(key)
+                return entry, "fresh"
+            if now < entry.stale_until:
+                return entry, "stale"
+            self._remove(key)
+            return None, None
+
+    def store(self, path: str, request_headers, status: int, headers, body: bytes,
+              now: float | None = None) -> bool:
+        """headers — объект с .get() без учёта регистра и .items()."""
+        now = now or time.time()
+        policy = freshness(status, headers, now)
+        if policy is None or len(body) > self.max_body:
+            self.count("uncacheable")
+            return False
+        ttl, swr, vary = policy
+        entry = CachedResponse(status, list(headers.items()), body, now, ttl, swr)
+        with self._lock:
+            key = self._key(path, request_headers, vary)
+            if key in self._entries:
+                self._remove(key)
+            self._vary[path] = vary
+            self._entries[key] = entry
+            self._bytes += entry.size
+            self._variants[path] = self._variants.get(path, 0) + 1
+            self.counters["stores"] += 1
+            while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self.counters["evictions"] += 1
+        return True
+
+    def _remove(self, key):
+        entry = self._entries.pop(key)
+        self._bytes -= entry.size
+        path = key[0]
+        self._variants[path] -= 1
+        if not self._variants[path]:
+            del self._variants[path]
+            self._vary.pop(path, None)
+
+    def stats(self) -> dict:
+        with self._lock:
+            requests = self.counters["hits"] + self.counters["stale_hits"] + self.counters["misses"] \
+                + self.counters["coalesced"]
+            hits = self.counters["hits"] + self.counters["stale_hits"] + self.counters["coalesced"]
+            return {
+                "enabled": True,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes,
+                **self.counters,
+                "hit_ratio": round(hits / requests, 3) if requests else 0.0,
+            }
+
+
+class SingleFlight:
+    """Один лидер на ключ; остальные потоки ждут его завершения."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def begin(self, key):
+        """(True, event) — лидер; (False, event) — ждать event."""
+        with self._lock:
+            event = self._calls.get(key)
+            if event is not None:
+                return False, event
+            event = self._calls[key] = threading.Event()
+            return True, event
+
+    def end(self, key):
+        with self._lock:
+            event = self._calls.pop(key, None)
+        if event is not None:
+            event.set()
+
+
+class AsyncSingleFlight:
+    """То же для asyncio: ожидание без блокировки цикла событий."""
+
+    def __init__(self):
+        self._calls = {}
+
+    def begin(self, key):
+        event = self._calls.get(key)
+        if event is not None:
+            return False, event
+        event = self._calls[key] = asyncio.Event()
+        return True, event
+
+    def end(self, key):
+        event = self._calls.pop(key, None)
+        if event is not None:
+            event.set()
+
+
+cache = ResponseCache() if LB_CACHE_ENABLED else None
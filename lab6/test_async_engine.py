@@ -0,0 +1,111 @@
+# test_async_engine.py
+import asyncio
+import importlib
+
+import pytest
+from aiohttp.test_utils import TestClient, TestServer
+
+from health import RetryBudget
+
+
+@pytest.fixture
+def engine(lb, monkeypatch):
+    """async_engine поверх свежего load_balancer; повторы не упираются в бюджет."""
+    monkeypatch.setattr(lb, "retry_budget", RetryBudget(ratio=1.0))
+    return importlib.import_module("async_engine")
+
+
+@pytest.fixture
+def cached_engine(monkeypatch, request):
+    monkeypatch.setenv("LB_CACHE_ENABLED", "1")
+    return request.getfixturevalue("engine")
+
+
+def run(engine, scenario):
+    """scenario(client) на тестовом сервере async-движка."""
+    async def main():
+        async with TestClient(TestServer(engine.make_app())) as client:
+            return await scenario(client)
+
+    return asyncio.run(main())
+
+
+def test_proxies_request_and_response(engine):
+    async def scenario(client):
+        resp = await client.post("/echo?a=1&a=2", data=b"payload", headers={
+            "X-Custom": "v", "Content-Type": "text/plain", "Keep-Alive": "timeout=1",
+        })
+        return resp.status, await resp.json(), resp.headers
+
+    status, seen, headers = run(engine, scenario)
+    assert status == 200
+    assert (seen["method"], seen["args"], seen["body"]) == ("POST", {"a": ["1", "2"]}, "payload")
+    assert seen["headers"]["X-Custom"] == "v" and "Keep-Alive" not in seen["headers"]
+    assert seen["headers"]["X-Forwarded-For"] == "127.0.0.1"
+    assert headers.getall("Set-Cookie") == ["a=1; Path=/", "b=2; Path=/"]
+    assert "Keep-Alive" not in headers and "Proxy-Authenticate" not in headers
+
+
+def test_admin_paths_go_to_flask_app(engine, backend):
+    async def scenario(client):
+        resp = await client.get("/health")
+        return await resp.json()
+
+    assert [(inst["port"], inst["circuit"]) for inst in run(engine, scenario)] == [(backend.port, "closed")]
+
+
+def test_failover_retries_idempotent_requests_only(engine, backend, free_port):
+    lb = engine.lb
+    lb.registry.add({"ip": "127.0.0.1", "port": free_port})
+
+    async def scenario(client):
+        gets = [(await client.get("/echo")).status for _ in range(4)]
+        posts = [(await client.post("/echo")).status for _ in range(4)]
+        return gets, posts
+
+    gets, posts = run(engine, scenario)
+    assert gets == [200] * 4  # запрос на недоступный инстанс повторён на живом
+    assert sorted(posts) == [200, 200, 503, 503]  # POST не повторяется
+    assert backend.calls["/echo"] == 6
+    # каждый GET на недоступный инстанс — ошибка и повтор, каждый POST — ошибка клиенту
+    errors = lb.metrics.backend_requests.values()[(f"127.0.0.1:{free_port}", "error")]
+    assert lb.retry_budget.retries >= 1 and errors == lb.retry_budget.retries + 2
+
+
+def test_retries_503_on_another_instance(engine, backend, other_backend):
+    engine.lb.registry.add(other_backend.entry)
+
+    async def scenario(client):
+        return [(await client.get(path)).status for path in ("/status/503", "/status/500")]
+
+    # 503 повторяется на другом инстансе (пока есть не опробованные), 500 — нет
+    assert run(engine, scenario) == [503, 500]
+    assert (backend.calls["/status/503"], other_backend.calls["/status/503"]) == (1, 1)
+    assert backend.calls.get("/status/500", 0) + other_backend.calls.get("/status/500", 0) == 1
+
+
+def test_cached_proxy_hit_and_coalescing(cached_engine, backend):
+    async def scenario(client):
+        first = await client.get("/cached")
+        second = await client.get("/cached")
+        burst = await asyncio.gather(*(client.get("/cached?x=1") for _ in range(5)))
+        return ([(r.status, r.headers["X-Cache"], (await r.json())["call"]) for r in (first, second)],
+                sorted(r.headers["X-Cache"] for r in burst))
+
+    served, burst = run(cached_engine, scenario)
+    assert served == [(200, "MISS", 1), (200, "HIT", 1)]
+    assert backend.calls["/cached"] == 2  # по одному запросу на ключ
+    assert burst.count("MISS") == 1
+    stats = cached_engine.lb.response_cache.stats()
+    assert (stats["misses"], stats["stores"]) == (2, 2)
+
+
+def test_cache_bypass_for_authorized_requests(cached_engine, backend):
+    async def scenario(client):
+        for _ in range(2):
+            resp = await client.get("/cached", headers={"Authorization": "Bearer x"})
+            assert "X-Cache" not in resp.headers
+
+    run(cached_engine, scenario)
+    assert backend.calls["/cached"] == 2
+    assert cached_engine.lb.response_cache.stats()["bypass"] == 2
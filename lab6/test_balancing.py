@@ -0,0 +1,97 @@
+# test_balancing.py
+from collections import Counter
+
+from balancing import ConsistentHash, LeastOutstanding, WeightedRoundRobin, make_strategy
+
+
+def instance(port, weight=1):
+    return {"ip": "127.0.0.1", "port": port, "weight": weight}
+
+
+def ports(picks):
+    return [inst["port"] for inst in picks]
+
+
+def test_smooth_weighted_round_robin_sequence():
+    strategy = WeightedRoundRobin()
+    strategy.rebuild([instance(1, 5), instance(2, 1), instance(3, 1)])
+    # как в nginx: тяжёлый инстанс не получает пять запросов подряд
+    assert ports(strategy.pick() for _ in range(7)) == [1, 1, 2, 1, 3, 1, 1]
+    assert ports(strategy.pick() for _ in range(7)) == [1, 1, 2, 1, 3, 1, 1]
+
+
+def test_weighted_round_robin_reduces_weights():
+    strategy = WeightedRoundRobin()
+    strategy.rebuild([instance(1, 4), instance(2, 2)])
+    assert len(strategy._schedule) == 3  # веса 4:2 -> 2:1
+    assert Counter(ports(strategy.pick() for _ in range(300))) == {1: 200, 2: 100}
+    strategy.rebuild([])
+    assert strategy.pick() is None
+
+
+def test_least_outstanding_picks_least_busy():
+    a, b, c = instance(1), instance(2), instance(3)
+    strategy = LeastOutstanding()
+    strategy.rebuild([a, b, c])
+
+    strategy.on_start(a)
+    strategy.on_start(a)
+    strategy.on_start(b)
+    assert strategy.pick() is c
+    strategy.on_start(c)
+    strategy.on_start(c)
+    assert strategy.pick() is b
+    strategy.on_finish(a, 0.1, True)
+    strategy.on_finish(a, 0.1, True)
+    assert strategy.pick() is a
+    assert strategy.in_flight() == {("127.0.0.1", 1): 0, ("127.0.0.1", 2): 1, ("127.0.0.1", 3): 2}
+
+
+def test_least_outstanding_drops_stale_heap_entries():
+    insts = [instance(port) for port in range(1, 5)]
+    strategy = LeastOutstanding()
+    strategy.rebuild(insts)
+    for _ in range(100):
+        for inst in insts:
+            strategy.on_start(inst)
+            strategy.on_finish(inst, 0.01, True)
+    # устаревшие записи выбрасываются при выборе и при перестройке — куча не растёт
+    assert len(strategy._heap) <= 4 * len(insts) + 16
+    strategy.on_start(insts[0])
+    assert strategy.pick() is not insts[0]
+
+    strategy.rebuild(insts[1:])  # инстанс ушёл из пула — его записи в куче не выбираются
+    strategy.on_finish(insts[0], 0.01, True)
+    assert strategy.pick() in insts[1:]
+    assert ("127.0.0.1", 1) not in strategy.in_flight()
+    strategy.rebuild([])
+    assert strategy.pick() is None
+
+
+def test_consistent_hash_moves_only_removed_share():
+    insts = [instance(port) for port in range(1, 6)]
+    strategy = ConsistentHash()
+    strategy.rebuild(insts)
+    keys = [f"client-{i}" for i in range(5000)]
+    before = {key: strategy.pick(key)["port"] for key in keys}
+    assert {strategy.pick(key)["port"] for key in keys[:10]} == {before[key] for key in keys[:10]}
+
+    strategy.rebuild(insts[:4])  # убрали пятый инстанс
+    after = {key: strategy.pick(key)["port"] for key in keys}
+    moved = [key for key in keys if before[key] != after[key]]
+    # переезжают только ключи убранного инстанса (около 1/5), остальные на месте
+    assert all(before[key] == 5 for key in moved)
+    assert 0.12 < len(moved) / len(keys) < 0.28
+
+    strategy.rebuild(insts + [instance(6)])  # добавили шестой — к нему уходит около 1/6
+    grown = {key: strategy.pick(key)["port"] for key in keys}
+    moved = [key for key in keys if before[key] != grown[key]]
+    assert all(grown[key] == 6 for key in moved)
+    assert 0.10 < len(moved) / len(keys) < 0.24
+
+
+def test_consistent_hash_respects_weight():
+    strategy = make_strategy("consistent_hash")
+    strategy.rebuild([instance(1, 3), instance(2, 1)])
+    share = Counter(strategy.pick(f"k{i}")["port"] for i in range(8000))
+    assert 0.65 < share[1] / 8000 < 0.85
@@ -0,0 +1,172 @@
+# test_lb_health.py
+import time
+
+import health
+from health import CircuitBreaker, HealthMonitor, RetryBudget, can_retry
+
+
+def instance(port):
+    return {"ip": "127.0.0.1", "port": port, "weight": 1, "draining": False}
+
+
+def fail(breaker, times, can_eject=lambda: True):
+    return [breaker.record(False, can_eject) for _ in range(times)]
+
+
+def test_breaker_opens_after_consecutive_failures():
+    breaker = CircuitBreaker()
+    assert fail(breaker, 4) == [False] * 4
+    breaker.record(True, lambda: True)  # успех обнуляет счёт подряд
+    assert fail(breaker, 4) == [False] * 4 and breaker.state == CircuitBreaker.CLOSED
+    assert fail(breaker, 1) == [True]
+    assert breaker.state == CircuitBreaker.OPEN and not breaker.admits()
+    assert fail(breaker, 3) == [False] * 3  # исключённый не считает ошибки
+
+
+def test_breaker_half_open_and_backoff(monkeypatch):
+    monkeypatch.setattr(health, "EJECT_MAX_SECONDS", 12)
+    breaker = CircuitBreaker()
+    fail(breaker, health.EJECT_CONSECUTIVE_FAILURES)
+    now = time.monotonic()
+    assert 4.9 < breaker.reopen_at - now <= 5
+
+    assert not breaker.tick(breaker.reopen_at - 0.01)
+    assert breaker.tick(breaker.reopen_at) and breaker.state == CircuitBreaker.HALF_OPEN
+    assert breaker.admits()
+    assert fail(breaker, 1) == [True]  # ошибка пробного запроса — снова исключён, пауза вдвое
+    assert breaker.state == CircuitBreaker.OPEN
+    assert 9.9 < breaker.reopen_at - time.monotonic() <= 10
+
+    breaker.tick(breaker.reopen_at)
+    fail(breaker, 1)
+    assert 11.9 < breaker.reopen_at - time.monotonic() <= 12  # не больше EJECT_MAX_SECONDS
+
+    breaker.tick(breaker.reopen_at)
+    assert not breaker.record(True, lambda: True)
+    assert (breaker.state, breaker.ejections) == (CircuitBreaker.CLOSED, 0)
+
+
+def test_half_open_admits_one_trial(monkeypatch):
+    breaker = CircuitBreaker()
+    assert breaker.allow() and breaker.allow()  # closed — без ограничений
+    fail(breaker, health.EJECT_CONSECUTIVE_FAILURES)
+    assert not breaker.allow()
+
+    breaker.tick(breaker.reopen_at)
+    assert breaker.allow()  # пробный запрос
+    assert not breaker.allow() and not breaker.allow()  # остальные ждут его итога
+    assert fail(breaker, 1) == [True] and breaker.state == CircuitBreaker.OPEN
+    assert not breaker.allow()
+
+    breaker.tick(breaker.reopen_at)
+    assert breaker.allow() and not breaker.allow()
+    breaker.record(True, lambda: True)
+    assert breaker.state == CircuitBreaker.CLOSED and breaker.allow() and breaker.allow()
+
+    monkeypatch.setattr(health, "HALF_OPEN_TRIAL_SECONDS", 0)
+    fail(breaker, health.EJECT_CONSECUTIVE_FAILURES)
+    breaker.tick(breaker.reopen_at)
+    assert breaker.allow() and breaker.allow()  # итог пробного потерян — пускаем следующий
+
+
+def test_pick_skips_busy_half_open_instance(lb, monkeypatch):
+    from balancing import make_strategy
+
+    first, second = instance(1), instance(2)
+    monitor = HealthMonitor(lambda: [first, second], lambda inst: True, lambda: None)
+    strategy = make_strategy("round_robin")
+    strategy.rebuild([first, second])
+    breaker = monitor.breaker(first)
+    fail(breaker, health.EJECT_CONSECUTIVE_FAILURES)
+    breaker.tick(breaker.reopen_at)
+
+    monkeypatch.setattr(lb, "monitor", monitor)
+    picks = [lb.pick_instance(strategy, None, []) for _ in range(4)]
+    assert picks == [first, second, second, second]  # first — только один пробный запрос
+    assert lb.pick_instance(strategy, None, [second]) is None
+
+
+def test_monitor_caps_ejected_share():
+    instances = [instance(port) for port in range(1, 5)]
+    changes = []
+    monitor = HealthMonitor(lambda: instances, lambda inst: True, lambda: changes.append(1))
+    for inst in instances:
+        for _ in range(health.EJECT_CONSECUTIVE_FAILURES):
+            monitor.record(inst, ok=False)
+    # MAX_EJECTION_PERCENT=50: из четырёх исключаются только два
+    assert [monitor.state(inst) for inst in instances] == ["open", "open", "closed", "closed"]
+    assert [monitor.admits(inst) for inst in instances] == [False, False, True, True]
+    assert len(changes) == 2
+
+
+def test_probe_results_stay_out_of_instance_dicts():
+    inst = instance(1)
+    results = iter([False, True, True])
+    changes = []
+    monitor = HealthMonitor(lambda: [inst], lambda _: next(results), lambda: changes.append(1))
+
+    assert monitor.active(inst) and monitor.admits(inst)
+    monitor._check(inst)
+    assert not monitor.active(inst) and not monitor.admits(inst)
+    assert "active" not in inst  # снимок реестра общий — его не меняем
+    monitor._check(inst)
+    assert monitor.active(inst) and len(changes) == 2
+
+    monitor._check(dict(inst))  # та же пара (ip, port) в новой записи — то же состояние
+    assert len(changes) == 2
+    monitor.probe = lambda _: 1 / 0  # исключение проверки — инстанс недоступен
+    monitor._check(inst)
+    assert not monitor.active(inst)
+    monitor.forget(inst)
+    assert monitor.active(inst) and monitor.state(inst) == "closed"
+
+
+def test_monitor_survives_callback_errors(monkeypatch, caplog):
+    monkeypatch.setattr(health, "HEALTH_TICK", 0.005)
+    inst = {**instance(1), "health_interval": 0.01}
+    probes = []
+
+    def probe(_):
+        probes.append(1)
+        return len(probes) % 2 == 0  # каждая проверка меняет состояние
+
+    def on_change():
+        if not done:
+            raise RuntimeError("boom")
+
+    calls = []
+    done = False
+
+    def get_instances():
+        calls.append(1)
+        if len(calls) == 3:
+            raise RuntimeError("registry")
+        return [] if done else [inst]
+
+    monitor = HealthMonitor(get_instances, probe, on_change)
+    breaker = monitor.breaker(inst)
+    fail(breaker, health.EJECT_CONSECUTIVE_FAILURES)
+    breaker.reopen_at = 0  # tick переведёт в half_open и вызовет on_change
+    monitor.start()
+    deadline = time.monotonic() + 2
+    while len(probes) < 5 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert len(probes) >= 5 and monitor._thread.is_alive()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    messages = [r.getMessage() for r in caplog.records]
+    assert "Ошибка цикла проверок здоровья" in messages
+    assert any(m.startswith("Ошибка обработчика смены состояния") for m in messages)
+    done = True  # остановить у потока нечего — оставляем его без работы
+
+
+def test_retry_budget():
+    budget = RetryBudget(ratio=0.5, min_per_second=0, capacity=2)
+    assert not can_retry("GET", 0, budget) and budget.denied == 1
+    for _ in range(10):
+        budget.deposit()  # ведро не больше capacity
+    assert [budget.withdraw() for _ in range(3)] == [True, True, False]
+    budget.deposit()
+    budget.deposit()
+    assert not can_retry("POST", 0, budget)  # неидемпотентный не повторяется
+    assert not can_retry("GET", health.MAX_RETRIES, budget)
+    assert can_retry("GET", 0, budget) and budget.retries == 3
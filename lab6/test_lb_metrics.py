@@ -0,0 +1,61 @@
+# test_lb_metrics.py
+import re
+
+SAMPLE = re.compile(r"^(\w+)(\{[^}]*\})? (\S+)$")
+
+
+def samples(text: str) -> dict:
+    """Строки /metrics без HELP/TYPE: {"имя{метки}": значение}."""
+    values = {}
+    for line in text.splitlines():
+        if line and not line.startswith("#"):
+            name, labels, value = SAMPLE.match(line).groups()
+            values[name + (labels or "")] = float(value)
+    return values
+
+
+def test_histogram_buckets_are_cumulative(lb):
+    hist = lb.metrics.Histogram("t_seconds", "тест", ("backend",), buckets=(0.1, 1.0))
+    for value in (0.05, 0.1, 0.5, 2.0):
+        hist.observe(value, "a")
+    assert hist.render()[2:] == [
+        't_seconds_bucket{backend="a",le="0.1"} 2',  # граница включительно, как le в Prometheus
+        't_seconds_bucket{backend="a",le="1.0"} 3',
+        't_seconds_bucket{backend="a",le="+Inf"} 4',
+        't_seconds_sum{backend="a"} 2.65',
+        't_seconds_count{backend="a"} 4',
+    ]
+    assert hist.quantile(0.5, "a") == 0.1
+    assert hist.quantile(0.75, "a") == 1.0
+    assert hist.quantile(0.5, "b") is None
+
+
+def test_metrics_after_proxied_requests(lb, backend):
+    client = lb.app.test_client()
+    for path in ("/echo", "/echo", "/echo", "/status/404", "/status/500"):
+        client.get(path, buffered=True)
+    values = samples(client.get("/metrics").get_data(as_text=True))
+
+    label = f'backend="127.0.0.1:{backend.port}"'
+    assert values[f'lb_backend_requests_total{{{label},code="200"}}'] == 3
+    assert values[f'lb_backend_requests_total{{{label},code="404"}}'] == 1
+    assert values[f'lb_backend_requests_total{{{label},code="500"}}'] == 1
+    assert values[f"lb_backend_in_flight{{{label}}}"] == 0
+    assert values[f'lb_backend_up{{{label},circuit="closed"}}'] == 1
+    # служебный /metrics в ответы клиентам не попадает
+    assert {key: v for key, v in values.items() if key.startswith("lb_requests_total")} == {
+        'lb_requests_total{code="200"}': 3, 'lb_requests_total{code="404"}': 1,
+        'lb_requests_total{code="500"}': 1,
+    }
+    assert values["lb_retries_total"] == 0
+
+    for name, labels in (("lb_backend_request_duration_seconds", f"{{{label}}}"),
+                         ("lb_request_duration_seconds", "")):
+        prefix = f"{name}_bucket{{{labels[1:-1]}{',' if labels else ''}le="
+        buckets = [v for key, v in values.items() if key.startswith(prefix)]
+        assert buckets == sorted(buckets) and buckets[-1] == 5  # накопительные, последняя — +Inf
+        assert values[f"{name}_count{labels}"] == 5 and values[f"{name}_sum{labels}"] > 0
+
+    summary = lb.metrics.backend_summary(lb.registry.instances[0])
+    assert (summary["requests"], summary["error_percent"], summary["in_flight"]) == (5, 20.0, 0)
+    assert summary["p50_ms"] <= summary["p99_ms"]
@@ -0,0 +1,81 @@
+# test_load_balancer.py
+import pytest
+
+
+def fetch(lb, path, method="GET", **kwargs):
+    """Запрос через балансировщик с телом, прочитанным целиком (поток закрыт)."""
+    return lb.app.test_client().open(path, method=method, buffered=True, **kwargs)
+
+
+@pytest.mark.parametrize("method", ["POST", "PUT", "PATCH", "DELETE"])
+def test_forwards_method_query_body_and_headers(lb, method):
+    resp = fetch(lb, "/echo?a=1&a=2&b=%D1%8F", method, data=b"payload",
+                 headers={"X-Custom": "v", "Content-Type": "text/plain", "X-Forwarded-For": "10.0.0.1"})
+    assert resp.status_code == 200
+    seen = resp.json
+    assert seen["method"] == method
+    assert seen["args"] == {"a": ["1", "2"], "b": ["я"]}
+    assert seen["body"] == "payload"
+    assert seen["headers"]["X-Custom"] == "v"
+    assert seen["headers"]["Content-Type"] == "text/plain"
+    assert seen["headers"]["X-Forwarded-For"] == "10.0.0.1, 127.0.0.1"
+    assert seen["headers"]["X-Forwarded-Host"] == "localhost"
+    assert seen["headers"]["X-Forwarded-Proto"] == "http"
+
+
+def test_passes_status_and_repeated_headers(lb):
+    resp = fetch(lb, "/echo")
+    assert resp.headers.getlist("Set-Cookie") == ["a=1; Path=/", "b=2; Path=/"]
+    assert resp.headers["X-Backend"] == "echo"
+
+    resp = fetch(lb, "/status/418", "POST")
+    assert resp.status_code == 418 and "port" in resp.json
+    assert fetch(lb, "/status/404").status_code == 404
+
+
+def test_strips_hop_by_hop_headers(lb):
+    resp = fetch(lb, "/echo", headers={
+        "Keep-Alive": "timeout=1", "Proxy-Authorization": "Basic eA==", "TE": "trailers",
+        "Trailer": "X-Sum", "Upgrade": "websocket", "X-Kept": "1",
+    })
+    seen = {name.lower() for name in resp.json["headers"]}
+    assert not seen & {"keep-alive", "proxy-authorization", "te", "trailer", "upgrade"}
+    assert "x-kept" in seen
+    assert resp.json["headers"]["Host"] != "localhost"  # Host — инстанса, не балансировщика
+
+    received = {name.lower() for name in resp.headers.keys()}
+    assert not received & {"keep-alive", "proxy-authenticate", "transfer-encoding"}
+
+
+def test_reuses_connection_after_full_body(lb, backend):
+    for _ in range(3):
+        assert fetch(lb, "/echo").status_code == 200
+    assert len(backend.connections) == 1
+    assert lb.metrics.in_flight(lb.registry.instances[0]) == 0
+
+
+def test_client_disconnect_releases_upstream(lb, backend):
+    client = lb.app.test_client()
+    resp = client.get("/stream", buffered=False)
+    assert resp.status_code == 200
+    assert len(next(iter(resp.response))) > 0
+    resp.close()  # клиент ушёл, не дочитав тело
+
+    inst = lb.registry.instances[0]
+    assert lb.metrics.in_flight(inst) == 0
+    assert lb.metrics.backend_requests.values()[(f"127.0.0.1:{backend.port}", "200")] == 1
+    assert backend.stream_closed.wait(5)  # инстанс увидел закрытое соединение
+
+    # недочитанное соединение не вернулось в пул — следующий запрос открывает новое
+    assert fetch(lb, "/echo").status_code == 200
+    assert len(backend.connections) == 2
+
+
+def test_unreachable_instance_is_reported(lb, backend, free_port, monkeypatch):
+    monkeypatch.setattr(lb, "MAX_ATTEMPTS", 1)
+    lb.registry.remove("127.0.0.1", backend.port)
+    lb.registry.add({"ip": "127.0.0.1", "port": free_port})
+    resp = fetch(lb, "/echo", "POST")
+    assert resp.status_code == 503 and resp.json == {"error": "Инстанс недоступен"}
+    assert lb.metrics.backend_requests.values()[(f"127.0.0.1:{free_port}", "error")] == 1
+
@@ -0,0 +1,64 @@
+# test_loadtest.py
+import asyncio
+import importlib
+
+import pytest
+
+METRICS = """\
+# HELP lb_backend_requests_total Ответы инстансов по статусу
+# TYPE lb_backend_requests_total counter
+lb_backend_requests_total{backend="127.0.0.1:5001",code="200"} 6
+lb_backend_requests_total{backend="127.0.0.1:5001",code="404"} 1
+lb_backend_requests_total{backend="127.0.0.1:5002",code="200"} 2
+lb_backend_requests_total{backend="127.0.0.1:5002",code="503"} 1
+lb_backend_requests_total{backend="127.0.0.1:5002",code="timeout"} 1
+lb_backend_in_flight{backend="127.0.0.1:5001"} 0
+lb_requests_total{code="200"} 8
+"""
+
+
+@pytest.fixture
+def loadtest(lb):
+    """loadtest и bench_engines тянут async_engine — импорт в изоляции фикстуры lb."""
+    return importlib.import_module("loadtest")
+
+
+@pytest.fixture
+def bench(loadtest):
+    return importlib.import_module("bench_engines")
+
+
+def test_per_port(loadtest):
+    ports = [5001, 5002, 5003]
+    assert loadtest.per_port([], ports) == {}
+    assert loadtest.per_port(["20", "5003=200"], ports) == {5001: "20", 5002: "20", 5003: "200"}
+    assert loadtest.per_port(["5002=0.3"], ports) == {5002: "0.3"}
+
+
+def test_counts_shares_and_spread(loadtest):
+    before = loadtest.parse_counts(METRICS)
+    # 404 — ответ, не ошибка; 5xx и timeout/error — ошибки
+    assert before == {"127.0.0.1:5001": [7, 0], "127.0.0.1:5002": [4, 2]}
+
+    after = loadtest.parse_counts(
+        METRICS.replace('code="200"} 6', 'code="200"} 16').replace('code="503"} 1', 'code="503"} 6')
+        + 'lb_backend_requests_total{backend="127.0.0.1:5003",code="500"} 5\n'
+    )
+    shares = loadtest.shares(before, after)
+    assert shares == {"127.0.0.1:5001": (10, 0), "127.0.0.1:5002": (5, 5), "127.0.0.1:5003": (5, 5)}
+    assert loadtest.spread(shares) == "5001:50%  5002:25%(err 5)  5003:25%(err 5)"
+    assert loadtest.spread({}) == ""
+
+
+def test_percentile(bench):
+    samples = [float(n) for n in range(1, 101)]
+    assert [bench.percentile(samples, q) for q in (50, 99, 99.9)] == [50, 99, 100]
+    assert bench.percentile([3.0], 0) == bench.percentile([3.0], 100) == 3.0
+
+
+@pytest.mark.parametrize("path, errors", [("/echo", 0), ("/status/500", 12)])
+def test_drive_summary(bench, backend, path, errors):
+    result = asyncio.run(bench.drive(f"http://127.0.0.1:{backend.port}{path}", 12, 4))
+    assert backend.calls[path] == 12  # ровно requests запросов на всех клиентов
+    assert result["errors"] == errors
+    assert result["rps"] > 0 and 0 < result["p50_ms"] <= result["p99_ms"] <= result["p999_ms"]
@@ -0,0 +1,99 @@
+# test_registry.py
+import json
+import time
+
+import pytest
+
+import registry
+from registry import Registry, make_instance
+
+
+@pytest.fixture(autouse=True)
+def fast_drain(monkeypatch):
+    monkeypatch.setattr(registry, "DRAIN_POLL", 0.01)
+
+
+def wait_for(condition, timeout=2):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "не дождались"
+        time.sleep(0.01)
+
+
+def make_registry(tmp_path, entries, **hooks):
+    path = tmp_path / "instances.json"
+    path.write_text(json.dumps(entries), encoding="utf-8")
+    return Registry(str(path), **hooks)
+
+
+def test_remove_drains_before_dropping(tmp_path):
+    busy = {5002: 2}
+    removed, changes = [], []
+    reg = make_registry(tmp_path, [{"ip": "h", "port": 5001}, {"ip": "h", "port": 5002}],
+                        on_change=lambda: changes.append(1), on_removed=removed.append,
+                        in_flight=lambda inst: busy.get(inst["port"], 0))
+    snapshot = reg.instances
+
+    assert reg.remove("h", 5002)
+    draining = reg.find("h", 5002)
+    assert draining["draining"] and not snapshot[1]["draining"]  # старый снимок не изменился
+    assert reg.config() == [{"ip": "h", "port": 5001, "weight": 1}]
+    assert json.loads((tmp_path / "instances.json").read_text()) == reg.config()
+
+    time.sleep(0.05)
+    assert reg.find("h", 5002) is draining and removed == []  # запросы ещё идут
+    busy[5002] = 0
+    wait_for(lambda: removed)
+    assert removed == [draining] and reg.find("h", 5002) is None
+    assert len(changes) == 2
+    assert not reg.remove("h", 5002)
+
+
+def test_drain_timeout(tmp_path, monkeypatch):
+    monkeypatch.setattr(registry, "DRAIN_TIMEOUT", 0.05)
+    removed = []
+    reg = make_registry(tmp_path, [{"ip": "h", "port": 5001}], on_removed=removed.append,
+                        in_flight=lambda inst: 1)  # запрос завис навсегда
+    reg.remove("h", 5001)
+    wait_for(lambda: removed)
+    assert reg.instances == ()
+
+
+def test_add_cancels_drain(tmp_path):
+    busy = [1]
+    removed = []
+    reg = make_registry(tmp_path, [{"ip": "h", "port": 5001}], on_removed=removed.append,
+                        in_flight=lambda inst: busy[0])
+    reg.remove("h", 5001)
+    reg.add({"ip": "h", "port": 5001, "weight": 3})
+    busy[0] = 0
+    time.sleep(0.05)
+    assert removed == []
+    assert reg.instances == (make_instance({"ip": "h", "port": 5001, "weight": 3}),)
+
+
+def test_reload_applies_file(tmp_path):
+    removed = []
+    reg = make_registry(tmp_path, [{"ip": "h", "port": 5001}, {"ip": "h", "port": 5002}],
+                        on_removed=removed.append)
+    unchanged = reg.find("h", 5001)
+    (tmp_path / "instances.json").write_text(json.dumps(
+        [{"ip": "h", "port": 5001}, {"ip": "h", "port": 5003, "weight": 2}]), encoding="utf-8")
+    reg.reload()
+    assert reg.find("h", 5001) is unchanged  # без изменений — та же запись
+    assert reg.find("h", 5003)["weight"] == 2
+    wait_for(lambda: removed)
+    assert [inst["port"] for inst in reg.instances] == [5001, 5003]
+
+    (tmp_path / "instances.json").write_text("{}", encoding="utf-8")
+    reg.reload()  # неверный файл — пул не трогаем
+    assert [inst["port"] for inst in reg.instances] == [5001, 5003]
+
+
+def test_make_instance_validates():
+    assert make_instance({"ip": "h", "port": "80", "health_interval": "2"}) == \
+        {"ip": "h", "port": 80, "weight": 1, "health_interval": 2.0, "draining": False}
+    for entry in ({"ip": "h"}, {"ip": "h", "port": 0}, {"ip": "h", "port": 80, "weight": 0},
+                  {"ip": "h", "port": "x"}):
+        with pytest.raises(ValueError):
+            make_instance(entry)
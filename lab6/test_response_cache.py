@@ -0,0 +1,90 @@
+# test_response_cache.py
+from werkzeug.datastructures import Headers
+
+from response_cache import ResponseCache, SingleFlight, freshness, request_bypasses
+
+
+def policy(**headers):
+    return freshness(200, Headers({name.replace("_", "-"): value for name, value in headers.items()}), 0)
+
+
+def test_freshness_directives():
+    assert policy(cache_control="max-age=60") == (60, 0, ())
+    assert policy(cache_control="s-maxage=30, max-age=60") == (30, 0, ())
+    assert policy(cache_control="s-maxage=0, max-age=60") is None  # общему кэшу — не хранить
+    assert policy(cache_control="max-age=0") is None
+    assert policy(cache_control="max-age=60, stale-while-revalidate=10") == (60, 10, ())
+    assert policy(cache_control="max-age=60", age="45") == (15, 0, ())
+    assert policy(cache_control="max-age=60", age="60") is None
+    assert policy(expires="Thu, 01 Jan 2026 00:01:00 GMT", date="Thu, 01 Jan 2026 00:00:00 GMT") == (60, 0, ())
+    assert policy(expires="вчера") is None
+    assert policy() is None
+
+
+def test_freshness_refusals():
+    for headers in ({"cache_control": "max-age=60, no-store"}, {"cache_control": "private, max-age=60"},
+                    {"cache_control": "no-cache, max-age=60"}, {"cache_control": "max-age=60", "vary": "*"},
+                    {"cache_control": "max-age=60", "set_cookie": "a=1"}):
+        assert policy(**headers) is None, headers
+    assert freshness(500, Headers({"Cache-Control": "max-age=60"}), 0) is None
+    assert policy(cache_control="max-age=60", vary="Accept-Language, accept")[2] == ("accept", "accept-language")
+
+
+def test_request_bypasses():
+    assert not request_bypasses("GET", Headers())
+    assert request_bypasses("POST", Headers())
+    assert request_bypasses("GET", Headers({"Authorization": "Bearer x"}))
+    assert request_bypasses("GET", Headers({"Cache-Control": "no-cache"}))
+    assert request_bypasses("GET", Headers({"Pragma": "no-cache"}))
+
+
+def test_vary_keeps_variants_apart():
+    cache = ResponseCache()
+    vary = Headers({"Cache-Control": "max-age=60", "Vary": "Accept-Language"})
+    assert cache.store("/p", Headers({"Accept-Language": "ru"}), 200, vary, b"privet", now=100)
+    assert cache.store("/p", Headers({"Accept-Language": "en"}), 200, vary, b"hello", now=100)
+
+    assert cache.lookup("/p", Headers({"Accept-Language": "ru"}), now=101)[0].body == b"privet"
+    assert cache.lookup("/p", Headers({"Accept-Language": "en"}), now=101)[0].body == b"hello"
+    assert cache.lookup("/p", Headers(), now=101) == (None, None)
+    assert cache.stats()["entries"] == 2
+
+
+def test_lookup_fresh_stale_expired():
+    cache = ResponseCache()
+    headers = Headers({"Cache-Control": "max-age=10, stale-while-revalidate=5", "Date": "x", "Set-Cookie": ""})
+    cache.store("/p", Headers(), 200, headers, b"body", now=100)
+    entry, state = cache.lookup("/p", Headers(), now=109)
+    assert state == "fresh" and ("Date", "x") not in entry.headers
+    assert entry.response_headers("HIT", 109)[-2:] == [("Age", "9"), ("X-Cache", "HIT")]
+    assert cache.lookup("/p", Headers(), now=112)[1] == "stale"
+    assert cache.lookup("/p", Headers(), now=115) == (None, None)
+    assert cache.stats()["entries"] == 0 and cache.stats()["bytes"] == 0
+
+
+def test_lru_respects_byte_cap():
+    headers = Headers({"Cache-Control": "max-age=60"})
+    size = len(b"x" * 100) + len("Cache-Control") + len("max-age=60")
+    cache = ResponseCache(max_entries=100, max_bytes=3 * size, max_body=200)
+    for path in ("/a", "/b", "/c"):
+        cache.store(path, Headers(), 200, headers, b"x" * 100, now=0)
+    assert cache.stats()["bytes"] == 3 * size
+
+    cache.lookup("/a", Headers(), now=1)  # /a теперь недавний — вытесняется /b
+    cache.store("/d", Headers(), 200, headers, b"x" * 100, now=1)
+    assert [cache.lookup(p, Headers(), now=2)[0] is not None for p in ("/a", "/b", "/c", "/d")] == \
+        [True, False, True, True]
+    assert cache.stats()["evictions"] == 1 and cache.stats()["bytes"] == 3 * size
+
+    assert not cache.store("/big", Headers(), 200, headers, b"x" * 201, now=2)  # больше max_body
+    cache.store("/c", Headers(), 200, headers, b"y" * 10, now=2)  # замена записи пересчитывает байты
+    assert cache.stats()["bytes"] == 2 * size + size - 90
+
+
+def test_single_flight():
+    flights = SingleFlight()
+    leader, event = flights.begin("k")
+    follower, same = flights.begin("k")
+    assert leader and not follower and same is event
+    flights.end("k")
+    assert event.is_set() and flights.begin("k")[0]
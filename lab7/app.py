@@ -1,50 +1,67 @@
 from flask import Flask, request, jsonify
 from flask_limiter import Limiter
 from flask_limiter.util import get_remote_address
-import json
+import math
 import os
+import socket
 
-app = Flask(__name__)
+from storage import LogStore, set_op
+from tiered_store import TieredStore
 
-# Раздел II.3.a — общее ограничение: 100 запросов в сутки
-limiter = Limiter(
-    get_remote_address,
-    app=app,
-    default_limits=["100 per day"]
-)
+app = Flask(__name__)
 
-# Раздел II.1 — Хранилище передаётся словарём data
+# Раздел II.1 — Хранилище data. Движок (KV_ENGINE):
+# log — словарь в памяти + журнал на диске (storage.py), один процесс;
+# shm — общая хэш-таблица в data.shm (shm_store.py), можно несколько
+# процессов-воркеров (KV_WORKERS);
+# tiered — в памяти индекс и LRU значений не больше KV_MEMORY_CAP_MB,
+# остальное на диске: сегмент data.seg + журнал (tiered_store.py)
+KV_ENGINE = os.getenv("KV_ENGINE", "log")
+KV_WORKERS = int(os.getenv("KV_WORKERS", "1"))
 DATA_FILE = "data.json"
-data = {}
+SHM_FILE = "data.shm"
+SEGMENT_FILE = "data.seg"
 
+if KV_ENGINE == "shm":
+    import shm_store  # регистрирует схему kvshm:// для лимитера
 
-# Раздел II.1.a — загрузка данных при старте приложения
+
+# Раздел II.1.a — загрузка данных при старте приложения: снимок data.json + журнал data.log
+# (для shm и tiered — открытие data.shm / data.seg; при первом запуске туда переносится data.json)
 def load_data():
-    global data
-    if os.path.exists(DATA_FILE):
-        with open(DATA_FILE, "r", encoding="utf-8") as f:
-            data = json.load(f)
-    else:
-        with open(DATA_FILE, "w", encoding="utf-8") as f:
-            json.dump({}, f, ensure_ascii=False, indent=4)
-        data = {}
+    if KV_ENGINE == "shm":
+        return shm_store.open_store(SHM_FILE, import_from=DATA_FILE)
+    if KV_ENGINE == "tiered":
+        return TieredStore(SEGMENT_FILE, import_from=DATA_FILE)
+    return LogStore(DATA_FILE)
 
 
-# Раздел II.1.b — сохранение данных после каждой операции
-def save_data():
-    with open(DATA_FILE, "w", encoding="utf-8") as f:
-        json.dump(data, f, ensure_ascii=False, indent=4)
+# Раздел II.1.b — сохранение после каждой операции: запись дописывается в журнал
+# (групповая фиксация, один fsync на пачку одновременных запросов), а снимок
+# data.json пересобирается в фоне, когда журнал разрастается
+data = load_data()
 
+# Раздел II.3.a — общее ограничение: 100 запросов в сутки
+# (для shm счётчики лимитов лежат в том же data.shm — общие для всех воркеров)
+limiter = Limiter(
+    get_remote_address,
+    app=app,
+    default_limits=["100 per day"],
+    storage_uri=f"kvshm://{os.path.abspath(SHM_FILE)}" if KV_ENGINE == "shm" else "memory://",
+)
 
-load_data()
+if KV_ENGINE == "shm":
+    @app.errorhandler(shm_store.StoreFull)
+    def store_full(exc):
+        return jsonify({"error": f"Хранилище заполнено: {exc}"}), 507
 
 
 # Раздел II.2 — Создание API с Flask-Limiter
 
 # Раздел II.3.b — лимит 10 запросов/мин для операций /set
 # Раздел II.2.a — POST /set — сохранить ключ-значение
-@limiter.limit("10 per minute")
 @app.route("/set", methods=["POST"])
+@limiter.limit("10 per minute")
 def set_value():
     body = request.json
     key = body.get("key")
@@ -52,30 +69,32 @@ def set_value():
 
     if key is None or value is None:
         return jsonify({"error": "Передайте key и value"}), 400
+    if not isinstance(key, str):
+        return jsonify({"error": "key должен быть строкой"}), 400
+    ttl = body.get("ttl")
+    if not valid_ttl(ttl):
+        return jsonify({"error": "ttl — число секунд больше нуля"}), 400
 
-    data[key] = value
-    save_data()
+    data.set(key, value, ttl)
     return jsonify({"message": "Сохранено", "saved": {key: value}})
 
 
 # Раздел II.2.b — GET /get/<key> — получить значение по ключу
 @app.route("/get/<key>", methods=["GET"])
 def get_value(key):
-    if key not in data:
+    value = data.get(key)  # None не хранится: /set его не принимает
+    if value is None:
         return jsonify({"error": "Ключ не найден"}), 404
-    return jsonify({"key": key, "value": data[key]})
+    return jsonify({"key": key, "value": value})
 
 
 # Раздел II.3.b — лимит 10 запросов/мин для /delete
 # Раздел II.2.c — DELETE /delete/<key> — удалить ключ
-@limiter.limit("10 per minute")
 @app.route("/delete/<key>", methods=["DELETE"])
+@limiter.limit("10 per minute")
 def delete_value(key):
-    if key not in data:
+    if not data.delete(key):
         return jsonify({"error": "Ключ не существует"}), 404
-
-    del data[key]
-    save_data()
     return jsonify({"message": f"Ключ '{key}' удалён"})
 
 
@@ -85,7 +104,171 @@ def exists_value(key):
     return jsonify({"key": key, "exists": key in data})
 
 
-# Раздел II — запуск приложения
+# Пакетные операции, сканирование по ключам и TTL.
+# Пакет до BATCH_ITEMS_PER_COST элементов стоит лимитеру как один запрос,
+# больше — пропорционально числу элементов (cost), так что пакеты экономят
+# HTTP-запросы, но не обходят лимиты.
+
+MAX_BATCH = int(os.getenv("KV_MAX_BATCH", "1000"))
+BATCH_ITEMS_PER_COST = int(os.getenv("KV_BATCH_ITEMS_PER_COST", "100"))
+SCAN_MAX_LIMIT = int(os.getenv("KV_SCAN_MAX_LIMIT", "1000"))
+
+
+def valid_ttl(ttl):
+    return ttl is None or (isinstance(ttl, (int, float)) and not isinstance(ttl, bool) and ttl > 0)
+
+
+def items_cost(count):
+    return max(1, math.ceil(count / BATCH_ITEMS_PER_COST))
+
+
+def body_cost(field):
+    """Стоимость пакетного запроса по длине списка field в теле."""
+    def cost():
+        body = request.get_json(silent=True)
+        items = body.get(field) if isinstance(body, dict) else None
+        return items_cost(len(items)) if isinstance(items, list) else 1
+    return cost
+
+
+def scan_limit():
+    """limit из строки запроса; None — не целое число."""
+    try:
+        return int(request.args.get("limit", "100"))
+    except ValueError:
+        return None
+
+
+def scan_cost():
+    return items_cost(scan_limit() or 1)
+
+
+def key_list(body):
+    """Список строковых ключей из body["keys"] или текст ошибки."""
+    keys = body.get("keys") if isinstance(body, dict) else None
+    if not isinstance(keys, list) or not keys or not all(isinstance(k, str) for k in keys):
+        return None, "Передайте keys — непустой список строк"
+    if len(keys) > MAX_BATCH:
+        return None, f"Не больше {MAX_BATCH} ключей за запрос"
+    return keys, None
+
+
+# POST /mset — сохранить несколько ключей одной записью журнала
+# {"items": [{"key": ..., "value": ..., "ttl": секунды?}, ...]}
+@app.route("/mset", methods=["POST"])
+@limiter.limit("10 per minute", cost=body_cost("items"))
+def mset_values():
+    body = request.get_json(silent=True)
+    items = body.get("items") if isinstance(body, dict) else None
+    if not isinstance(items, list) or not items:
+        return jsonify({"error": "Передайте items — непустой список"}), 400
+    if len(items) > MAX_BATCH:
+        return jsonify({"error": f"Не больше {MAX_BATCH} элементов за запрос"}), 400
+
+    ops = []
+    for item in items:
+        key = item.get("key") if isinstance(item, dict) else None
+        value = item.get("value") if isinstance(item, dict) else None
+        if not isinstance(key, str) or value is None or not valid_ttl(item.get("ttl")):
+            return jsonify({"error": "Каждый элемент — {key: строка, value, ttl?: секунды}",
+                            "item": item}), 400
+        ops.append(set_op(key, value, item.get("ttl")))
+
+    data.write(ops)
+    return jsonify({"message": "Сохранено", "count": len(ops)})
+
+
+# POST /mget — значения нескольких ключей {"keys": [...]}
+@app.route("/mget", methods=["POST"])
+@limiter.limit("100 per day", cost=body_cost("keys"))
+def mget_values():
+    keys, error = key_list(request.get_json(silent=True))
+    if error:
+        return jsonify({"error": error}), 400
+    values = data.mget(keys)
+    return jsonify({"values": values, "missing": [k for k in keys if k not in values]})
+
+
+# POST /mdelete — удалить несколько ключей одной записью журнала {"keys": [...]}
+@app.route("/mdelete", methods=["POST"])
+@limiter.limit("10 per minute", cost=body_cost("keys"))
+def mdelete_values():
+    keys, error = key_list(request.get_json(silent=True))
+    if error:
+        return jsonify({"error": error}), 400
+    deleted = data.mdelete(keys)
+    removed = set(deleted)
+    return jsonify({"deleted": deleted, "missing": [k for k in keys if k not in removed]})
+
+
+# GET /scan?prefix=&start=&end=&after=&limit= — ключи по возрастанию:
+# с префиксом prefix, в диапазоне [start, end); after — продолжить после
+# этого ключа (значение next из предыдущего ответа)
+@app.route("/scan", methods=["GET"])
+@limiter.limit("100 per day", cost=scan_cost)
+def scan_values():
+    limit = scan_limit()
+    if limit is None or not 0 < limit <= SCAN_MAX_LIMIT:
+        return jsonify({"error": f"limit — от 1 до {SCAN_MAX_LIMIT}"}), 400
+    start = request.args.get("start")
+    after = request.args.get("after")
+    if after is not None:
+        start = max(start or "", after + "\0")  # следующий ключ после after
+    items = data.scan(request.args.get("prefix", ""), start, request.args.get("end"), limit)
+    return jsonify({
+        "items": [{"key": key, "value": value} for key, value in items],
+        "next": items[-1][0] if len(items) == limit else None,
+    })
+
+
+# GET /ttl/<key> — сколько секунд осталось жить ключу (null — бессрочный)
+@app.route("/ttl/<key>", methods=["GET"])
+def ttl_value(key):
+    if key not in data:
+        return jsonify({"error": "Ключ не найден"}), 404
+    ttl = data.ttl(key)
+    return jsonify({"key": key, "ttl": round(ttl, 3) if ttl is not None else None})
+
+
+# GET /stats — состояние хранилища: число ключей, размер журнала; для tiered —
+# попадания/промахи LRU, вытеснения и занятая значениями память
+@app.route("/stats", methods=["GET"])
+def stats():
+    stats = data.stats() if hasattr(data, "stats") else {"keys": len(data)}
+    return jsonify({"engine": KV_ENGINE, **stats})
+
+
+# Раздел II — запуск приложения.
+# KV_WORKERS > 1 (только с KV_ENGINE=shm): общий слушающий сокет и N процессов,
+# каждый со своим werkzeug-сервером — данные и лимиты у них общие через data.shm
+def run_workers(port, workers):
+    from werkzeug.serving import make_server
+
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind(("127.0.0.1", port))
+    sock.listen(1024)
+    children = []
+    for _ in range(workers):
+        pid = os.fork()
+        if pid == 0:
+            make_server("127.0.0.1", port, app, threaded=True, fd=sock.fileno()).serve_forever()
+            os._exit(0)
+        children.append(pid)
+    try:
+        for pid in children:
+            os.waitpid(pid, 0)
+    except KeyboardInterrupt:
+        for pid in children:
+            os.kill(pid, 15)
+
+
 if __name__ == "__main__":
-    print("Key-Value хранилище запущено на порту 5000")
-    app.run(port=5000)
+    port = int(os.getenv("KV_PORT", "5000"))
+    print(f"Key-Value хранилище запущено на порту {port}")
+    if KV_WORKERS > 1:
+        if KV_ENGINE != "shm":
+            raise SystemExit("KV_WORKERS > 1 требует KV_ENGINE=shm: у каждого процесса был бы свой data")
+        run_workers(port, KV_WORKERS)
+    else:
+        app.run(port=port)
@@ -0,0 +1,557 @@
+# shm_store.py
+"""
+Общее для нескольких процессов хранилище: хэш-таблица в файле, отображённом
+в память (mmap, MAP_SHARED). Включается KV_ENGINE=shm; файл — data.shm.
+
+Раскладка файла:
+- страница заголовка: геометрия, указатель свободного места области
+  переполнения и головы списков свободных блоков по классам размеров;
+- метаданные полос: версия (seqlock) и число ключей;
+- таблица: SHM_STRIPES полос по slots_per_stripe слотов размера SLOT_SIZE.
+  Ключ попадает в полосу по хэшу и ищется линейным пробированием внутри неё.
+  Ключ и значение (JSON) лежат прямо в слоте, если помещаются, иначе — в
+  блоке области переполнения (классы 64 Б, 128 Б, ... — степени двойки,
+  освобождённые блоки уходят в список своего класса);
+- область переполнения.
+
+Блокировки мелкие: у каждой полосы своя (threading.Lock внутри процесса +
+fcntl.lockf на байт между процессами), у распределителя блоков — своя.
+Чтение без блокировок: читатель берёт версию полосы, копирует слот и
+сверяет версию — если писатель успел её сменить (писатель делает версию
+нечётной на время изменения), чтение повторяется. Пакет (write/mset)
+блокирует все свои полосы по возрастанию номера — атомарен для писателей.
+
+Счётчики Flask-Limiter хранятся в той же таблице, в отдельном пространстве
+имён (SharedLimiterStorage, URI kvshm://путь) — лимиты общие для всех
+процессов.
+
+Ограничения: размер таблицы задаётся при создании файла и не растёт
+(StoreFull, когда полоса или область переполнения заполнены); scan
+просматривает всю таблицу; устойчивость к сбоям — как у страничного кэша
+ОС (msync при закрытии), журнала здесь нет. Только Unix (fcntl).
+"""
+import fcntl
+import hashlib
+import json
+import mmap
+import os
+import struct
+import threading
+import time
+import urllib.parse
+
+from limits.storage import Storage
+
+from storage import read_data
+
+SHM_STRIPES = int(os.getenv("KV_SHM_STRIPES", "256"))
+SHM_SLOTS = int(os.getenv("KV_SHM_SLOTS", "65536"))          # слотов всего
+SLOT_SIZE = int(os.getenv("KV_SHM_SLOT_SIZE", "128"))
+OVERFLOW_MB = int(os.getenv("KV_SHM_OVERFLOW_MB", "64"))
+REAP_INTERVAL = float(os.getenv("KV_REAP_INTERVAL", "1"))
+REAP_STRIPES = int(os.getenv("KV_SHM_REAP_STRIPES", "16"))    # полос за один проход сборщика
+
+MAGIC = b"KVSHM001"
+PAGE = 4096
+HEADER = struct.Struct("<8sIIIQQQ")  # magic, stripes, slots_per_stripe, slot_size, table, overflow, overflow_size
+BUMP_OFFSET = 64                      # Q: занято в области переполнения
+FREE_OFFSET = 72                      # Q × NCLASSES: головы списков свободных блоков
+NCLASSES = 21                         # 64 Б .. 64 МБ
+MIN_BLOCK = 64
+META = struct.Struct("<QQ")           # версия полосы, число ключей
+SLOT = struct.Struct("<BBHIQdQI4x")   # state, ns, key_len, val_len, hash, expires_at, block, block_size
+U64 = struct.Struct("<Q")
+
+EMPTY, USED, DELETED = 0, 1, 2
+NS_DATA, NS_LIMITS = 0, 1
+
+LOCK_BASE = 1 << 40   # байты для fcntl-блокировок — за пределами данных
+ALLOC_LOCK = LOCK_BASE - 1
+INIT_LOCK = LOCK_BASE - 2
+SPIN_LIMIT = 10000    # столько раз подряд видим нечётную версию — проверяем, жив ли писатель
+
+_RETRY = object()
+
+
+class StoreFull(Exception):
+    """В полосе или в области переполнения нет места."""
+
+
+def key_hash(ns: int, key: bytes) -> int:
+    return int.from_bytes(hashlib.blake2b(bytes((ns,)) + key, digest_size=8).digest(), "little")
+
+
+def encode(value) -> bytes:
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+class SharedStore:
+    def __init__(self, path="data.shm", import_from=None):
+        self.path = path
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        fcntl.lockf(self._fd, fcntl.LOCK_EX, 1, INIT_LOCK)
+        try:
+            created = os.fstat(self._fd).st_size == 0
+            if created:
+                self._create()
+            self.mm = mmap.mmap(self._fd, 0)
+            magic, stripes, per_stripe, slot_size, table, overflow, overflow_size = HEADER.unpack_from(self.mm, 0)
+            if magic != MAGIC:
+                raise ValueError(f"{path}: не файл хранилища")
+            self.stripes, self.per_stripe, self.slot_size = stripes, per_stripe, slot_size
+            self.table, self.overflow, self.overflow_size = table, overflow, overflow_size
+            self.inline = slot_size - SLOT.size
+            self._init_thread_locks()
+            if created and import_from:
+                self._import(import_from)
+        finally:
+            fcntl.lockf(self._fd, fcntl.LOCK_UN, 1, INIT_LOCK)
+        self._reap_cursor = 0
+        self._closed = False
+        _open_stores.append(self)
+        self._reaper = threading.Thread(target=self._reap_loop, name="kv-shm-reaper", daemon=True)
+        self._reaper.start()
+
+    def _create(self):
+        per_stripe = max(SHM_SLOTS // SHM_STRIPES, 1)
+        meta_size = -(-SHM_STRIPES * META.size // PAGE) * PAGE
+        table = PAGE + meta_size
+        overflow = table + SHM_STRIPES * per_stripe * SLOT_SIZE
+        overflow_size = OVERFLOW_MB * 1024 * 1024
+        os.ftruncate(self._fd, overflow + overflow_size)  # файл разреженный — место занимается по мере записи
+        os.pwrite(self._fd, HEADER.pack(MAGIC, SHM_STRIPES, per_stripe, SLOT_SIZE, table, overflow,
+                                        overflow_size), 0)
+
+    def _import(self, snapshot_path):
+        """Первый запуск: перенести данные LogStore — снимок data.json и журнал data.log."""
+        data, expires = read_data(snapshot_path)
+        for key, value in data.items():
+            self.write([["set", key, value, expires.get(key)]])
+
+    def _init_thread_locks(self):
+        # после fork блокировки потоков могли остаться захваченными — создаём заново
+        self._stripe_locks = [threading.Lock() for _ in range(self.stripes)]
+        self._alloc_lock = threading.Lock()
+
+    # --- полосы, версии, блокировки ---
+
+    def _position(self, h: int):
+        return h % self.stripes, (h >> 32) % self.per_stripe
+
+    def _meta(self, stripe: int) -> int:
+        return PAGE + stripe * META.size
+
+    def _version(self, stripe: int) -> int:
+        return U64.unpack_from(self.mm, self._meta(stripe))[0]
+
+    def _bump(self, stripe: int):
+        off = self._meta(stripe)
+        U64.pack_into(self.mm, off, U64.unpack_from(self.mm, off)[0] + 1)
+
+    def _count(self, stripe: int, delta: int):
+        off = self._meta(stripe) + 8
+        U64.pack_into(self.mm, off, U64.unpack_from(self.mm, off)[0] + delta)
+
+    def _lock(self, stripes):
+        stripes = sorted(set(stripes))
+        for stripe in stripes:
+            self._stripe_locks[stripe].acquire()
+            fcntl.lockf(self._fd, fcntl.LOCK_EX, 1, LOCK_BASE + stripe)
+            if self._version(stripe) & 1:
+                self._bump(stripe)  # писатель умер посреди изменения — версию выравниваем
+            self._bump(stripe)
+        return stripes
+
+    def _unlock(self, stripes):
+        for stripe in reversed(stripes):
+            self._bump(stripe)
+            fcntl.lockf(self._fd, fcntl.LOCK_UN, 1, LOCK_BASE + stripe)
+            self._stripe_locks[stripe].release()
+
+    def _read(self, stripe: int, reader):
+        """reader() без блокировки, с повтором, если полосу в это время меняли."""
+        spins = 0
+        while True:
+            before = self._version(stripe)
+            if before & 1:
+                spins += 1
+                if spins >= SPIN_LIMIT:
+                    self._unlock(self._lock([stripe]))  # захватили — значит писателя нет
+                    spins = 0
+                time.sleep(0)
+                continue
+            try:
+                result = reader()
+            except (struct.error, ValueError, IndexError, UnicodeDecodeError):
+                result = _RETRY  # прочитали полузаписанное — повторим
+            if result is not _RETRY and self._version(stripe) == before:
+                return result
+
+    # --- слоты ---
+
+    def _slot_offset(self, stripe: int, index: int) -> int:
+        return self.table + (stripe * self.per_stripe + index) * self.slot_size
+
+    def _payload(self, off: int, block: int) -> int:
+        return block or off + SLOT.size
+
+    def _lookup(self, ns: int, key: bytes, h: int):
+        """(смещение слота с ключом или None, смещение свободного слота для вставки или None)."""
+        stripe, start = self._position(h)
+        free = None
+        mm = self.mm
+        for step in range(self.per_stripe):
+            off = self._slot_offset(stripe, (start + step) % self.per_stripe)
+            state, slot_ns, key_len, _, slot_hash, _, block, _ = SLOT.unpack_from(mm, off)
+            if state == EMPTY:
+                return None, free if free is not None else off
+            if state == DELETED:
+                if free is None:
+                    free = off
+            elif slot_hash == h and slot_ns == ns and key_len == len(key):
+                payload = self._payload(off, block)
+                if mm[payload:payload + key_len] == key:
+                    return off, None
+        return None, free
+
+    def _get(self, ns: int, key: str):
+        """(значение в байтах, expires_at) или None."""
+        key_b = key.encode("utf-8")
+        h = key_hash(ns, key_b)
+
+        def reader():
+            off, _ = self._lookup(ns, key_b, h)
+            if off is None:
+                return None
+            _, _, key_len, val_len, _, expires_at, block, _ = SLOT.unpack_from(self.mm, off)
+            start = self._payload(off, block) + key_len
+            return bytes(self.mm[start:start + val_len]), expires_at
+
+        return self._read(self._position(h)[0], reader)
+
+    def _put(self, ns: int, key: bytes, h: int, value: bytes, expires_at: float):
+        """Записать ключ (полоса заблокирована)."""
+        off, free = self._lookup(ns, key, h)
+        payload = key + value
+        if off is not None:
+            _, _, _, _, _, _, old_block, old_size = SLOT.unpack_from(self.mm, off)
+        else:
+            if free is None:
+                raise StoreFull("Полоса хэш-таблицы заполнена")
+            off, old_block, old_size = free, 0, 0
+
+        if len(payload) <= self.inline:
+            block, size = 0, 0
+        elif old_block and len(payload) <= old_size:
+            block, size = old_block, old_size
+        else:
+            block, size = self._alloc(len(payload))
+        start = self._payload(off, block)
+        self.mm[start:start + len(payload)] = payload
+        SLOT.pack_into(self.mm, off, USED, ns, len(key), len(value), h, expires_at or 0.0, block, size)
+        if old_block and old_block != block:
+            self._free(old_block, old_size)
+        if free is not None and ns == NS_DATA:
+            self._count(self._position(h)[0], 1)
+
+    def _remove(self, ns: int, key: bytes, h: int) -> bool:
+        """Удалить ключ (полоса заблокирована)."""
+        off, _ = self._lookup(ns, key, h)
+        if off is None:
+            return False
+        _, _, _, _, _, _, block, size = SLOT.unpack_from(self.mm, off)
+        if block:
+            self._free(block, size)
+        stripe, _ = self._position(h)
+        index = (off - self._slot_offset(stripe, 0)) // self.slot_size
+        following = self._slot_offset(stripe, (index + 1) % self.per_stripe)
+        if self.mm[following] == EMPTY:
+            # цепочка пробирования здесь обрывается — удалённые слоты перед ней можно освободить
+            self.mm[off] = EMPTY
+            for step in range(1, self.per_stripe):
+                prev = self._slot_offset(stripe, (index - step) % self.per_stripe)
+                if self.mm[prev] != DELETED:
+                    break
+                self.mm[prev] = EMPTY
+        else:
+            self.mm[off] = DELETED
+        if ns == NS_DATA:
+            self._count(stripe, -1)
+        return True
+
+    # --- область переполнения ---
+
+    def _alloc(self, size: int):
+        cls = max(size - 1, MIN_BLOCK - 1).bit_length() - MIN_BLOCK.bit_length() + 1
+        if cls >= NCLASSES:
+            raise StoreFull("Значение слишком большое")
+        block_size = MIN_BLOCK << cls
+        head_off = FREE_OFFSET + cls * 8
+        with self._alloc_lock:
+            fcntl.lockf(self._fd, fcntl.LOCK_EX, 1, ALLOC_LOCK)
+            try:
+                head = U64.unpack_from(self.mm, head_off)[0]
+                if head:
+                    U64.pack_into(self.mm, head_off, U64.unpack_from(self.mm, head)[0])
+                    return head, block_size
+                used = U64.unpack_from(self.mm, BUMP_OFFSET)[0]
+                if used + block_size > self.overflow_size:
+                    raise StoreFull("Область переполнения заполнена")
+                U64.pack_into(self.mm, BUMP_OFFSET, used + block_size)
+                return self.overflow + used, block_size
+            finally:
+                fcntl.lockf(self._fd, fcntl.LOCK_UN, 1, ALLOC_LOCK)
+
+    def _free(self, block: int, block_size: int):
+        head_off = FREE_OFFSET + (block_size.bit_length() - MIN_BLOCK.bit_length()) * 8
+        with self._alloc_lock:
+            fcntl.lockf(self._fd, fcntl.LOCK_EX, 1, ALLOC_LOCK)
+            try:
+                U64.pack_into(self.mm, block, U64.unpack_from(self.mm, head_off)[0])
+                U64.pack_into(self.mm, head_off, block)
+            finally:
+                fcntl.lockf(self._fd, fcntl.LOCK_UN, 1, ALLOC_LOCK)
+
+    # --- API хранилища (как у storage.LogStore) ---
+
+    def get(self, key, default=None):
+        found = self._get(NS_DATA, key)
+        if found is None or (found[1] and found[1] <= time.time()):
+            return default
+        return json.loads(found[0])
+
+    def __contains__(self, key):
+        found = self._get(NS_DATA, key)
+        return found is not None and not (found[1] and found[1] <= time.time())
+
+    def __len__(self):
+        return sum(U64.unpack_from(self.mm, self._meta(s) + 8)[0] for s in range(self.stripes))
+
+    def ttl(self, key):
+        found = self._get(NS_DATA, key)
+        if found is None or not found[1]:
+            return None
+        return max(found[1] - time.time(), 0.0)
+
+    def mget(self, keys) -> dict:
+        values = {}
+        for key in keys:
+            value = self.get(key)
+            if value is not None:
+                values[key] = value
+        return values
+
+    def _stripe_items(self, stripe: int, ns: int) -> list:
+        """[(ключ, значение в байтах, expires_at)] полосы — согласованный снимок."""
+        mm = self.mm
+
+        def reader():
+            items = []
+            for index in range(self.per_stripe):
+                off = self._slot_offset(stripe, index)
+                state, slot_ns, key_len, val_len, _, expires_at, block, _ = SLOT.unpack_from(mm, off)
+                if state == USED and slot_ns == ns:
+                    start = self._payload(off, block)
+                    items.append((bytes(mm[start:start + key_len]), bytes(mm[start + key_len:start + key_len + val_len]),
+                                  expires_at))
+            return items
+
+        return self._read(stripe, reader)
+
+    def scan(self, prefix="", start=None, end=None, limit=100) -> list:
+        """Как LogStore.scan, но полным просмотром таблицы (общего индекса ключей нет)."""
+        now = time.time()
+        lower = max(prefix, start) if start is not None else prefix
+        found = []
+        for stripe in range(self.stripes):
+            for key_b, value_b, expires_at in self._stripe_items(stripe, NS_DATA):
+                key = key_b.decode("utf-8")
+                if (key.startswith(prefix) and key >= lower and (end is None or key < end)
+                        and not (expires_at and expires_at <= now)):
+                    found.append((key, value_b))
+        found.sort(key=lambda item: item[0])
+        return [(key, json.loads(value_b)) for key, value_b in found[:limit]]
+
+    def set(self, key, value, ttl=None):
+        self.write([["set", key, value, time.time() + ttl if ttl is not None else None]])
+
+    def write(self, ops: list):
+        """Пакет set/del; все его полосы заблокированы на время записи."""
+        prepared = []
+        for op in ops:
+            key = op[1].encode("utf-8")
+            h = key_hash(NS_DATA, key)
+            value = encode(op[2]) if op[0] == "set" else None
+            expires_at = op[3] if op[0] == "set" and len(op) > 3 else None
+            prepared.append((op[0], key, h, value, expires_at))
+        stripes = self._lock(self._position(h)[0] for _, _, h, _, _ in prepared)
+        try:
+            for kind, key, h, value, expires_at in prepared:
+                if kind == "set":
+                    self._put(NS_DATA, key, h, value, expires_at)
+                else:
+                    self._remove(NS_DATA, key, h)
+        finally:
+            self._unlock(stripes)
+
+    def delete(self, key) -> bool:
+        return bool(self.mdelete([key]))
+
+    def mdelete(self, keys) -> list:
+        keys = list(dict.fromkeys(keys))
+        encoded = [(key, key.encode("utf-8")) for key in keys]
+        hashes = [key_hash(NS_DATA, key_b) for _, key_b in encoded]
+        stripes = self._lock(self._position(h)[0] for h in hashes)
+        now = time.time()
+        deleted = []
+        try:
+            for (key, key_b), h in zip(encoded, hashes):
+                off, _ = self._lookup(NS_DATA, key_b, h)
+                if off is None:
+                    continue
+                expires_at = SLOT.unpack_from(self.mm, off)[5]
+                self._remove(NS_DATA, key_b, h)
+                if not (expires_at and expires_at <= now):
+                    deleted.append(key)
+        finally:
+            self._unlock(stripes)
+        return deleted
+
+    # --- счётчики лимитера ---
+
+    def incr(self, key: str, expiry: float, amount: int = 1) -> int:
+        key_b = key.encode("utf-8")
+        h = key_hash(NS_LIMITS, key_b)
+        stripes = self._lock([self._position(h)[0]])
+        try:
+            now = time.time()
+            off, _ = self._lookup(NS_LIMITS, key_b, h)
+            count, expires_at = 0, now + expiry
+            if off is not None:
+                _, _, key_len, val_len, _, slot_expires, block, _ = SLOT.unpack_from(self.mm, off)
+                if slot_expires > now:
+                    start = self._payload(off, block) + key_len
+                    count, expires_at = int(self.mm[start:start + val_len]), slot_expires
+            count += amount
+            self._put(NS_LIMITS, key_b, h, str(count).encode(), expires_at)
+            return count
+        finally:
+            self._unlock(stripes)
+
+    def counter(self, key: str):
+        """(значение, expires_at) счётчика; истёкший — (0, None)."""
+        found = self._get(NS_LIMITS, key)
+        if found is None or found[1] <= time.time():
+            return 0, None
+        return int(found[0]), found[1]
+
+    def clear_counter(self, key: str):
+        key_b = key.encode("utf-8")
+        h = key_hash(NS_LIMITS, key_b)
+        stripes = self._lock([self._position(h)[0]])
+        try:
+            self._remove(NS_LIMITS, key_b, h)
+        finally:
+            self._unlock(stripes)
+
+    def reset_counters(self) -> int:
+        cleared = 0
+        for stripe in range(self.stripes):
+            for key_b, _, _ in self._stripe_items(stripe, NS_LIMITS):
+                self.clear_counter(key_b.decode("utf-8"))
+                cleared += 1
+        return cleared
+
+    # --- истечение сроков ---
+
+    def reap(self, stripes=None) -> int:
+        """
+        Удалить истёкшие ключи и счётчики в следующих REAP_STRIPES полосах
+        (по кругу) — за несколько проходов сборщик обходит всю таблицу.
+        """
+        removed = 0
+        now = time.time()
+        for _ in range(stripes or REAP_STRIPES):
+            stripe = self._reap_cursor
+            self._reap_cursor = (stripe + 1) % self.stripes
+            for ns in (NS_DATA, NS_LIMITS):
+                expired = [key_b for key_b, _, expires_at in self._stripe_items(stripe, ns)
+                           if expires_at and expires_at <= now]
+                if not expired:
+                    continue
+                self._lock([stripe])
+                try:
+                    for key_b in expired:
+                        h = key_hash(ns, key_b)
+                        off, _ = self._lookup(ns, key_b, h)
+                        if off is not None and 0 < SLOT.unpack_from(self.mm, off)[5] <= now:
+                            removed += self._remove(ns, key_b, h)
+                finally:
+                    self._unlock([stripe])
+        return removed
+
+    def _reap_loop(self):
+        while True:
+            time.sleep(REAP_INTERVAL)
+            if self._closed:
+                return  # отображение уже закрыто
+            self.reap()
+
+    def close(self):
+        self._closed = True
+        _open_stores.remove(self)
+        self.mm.flush()
+        self.mm.close()
+        os.close(self._fd)
+
+
+_open_stores = []
+
+
+def _after_fork():
+    for store in _open_stores:
+        store._init_thread_locks()
+
+
+os.register_at_fork(after_in_child=_after_fork)
+
+
+def open_store(path, import_from=None) -> SharedStore:
+    """Одно отображение файла на процесс — его же использует и лимитер."""
+    path = os.path.abspath(path)
+    for store in _open_stores:
+        if store.path == path:
+            return store
+    return SharedStore(path, import_from)
+
+
+class SharedLimiterStorage(Storage):
+    """Хранилище счётчиков Flask-Limiter в SharedStore: Limiter(storage_uri="kvshm://data.shm")."""
+    STORAGE_SCHEME = ["kvshm"]
+
+    def __init__(self, uri: str, wrap_exceptions: bool = False, **options):
+        super().__init__(uri, wrap_exceptions, **options)
+        parsed = urllib.parse.urlparse(uri)
+        self.store = open_store(parsed.netloc + parsed.path)
+
+    @property
+    def base_exceptions(self):
+        return StoreFull, OSError
+
+    def incr(self, key: str, expiry: int, amount: int = 1) -> int:
+        return self.store.incr(key, expiry, amount)
+
+    def get(self, key: str) -> int:
+        return self.store.counter(key)[0]
+
+    def get_expiry(self, key: str) -> float:
+        return self.store.counter(key)[1] or time.time()
+
+    def check(self) -> bool:
+        return True
+
+    def reset(self) -> int:
+        return self.store.reset_counters()
+
+    def clear(self, key: str) -> None:
+        self.store.clear_counter(key)
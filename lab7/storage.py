@@ -0,0 +1,461 @@
+# storage.py
+"""
+Хранилище ключ-значение: снимок + журнал предзаписи (WAL).
+
+- Снимок — data.json (тот же файл, что раньше), журнал — data.log рядом.
+  Каждая запись журнала — одна строка «crc32 JSON» со списком операций
+  [["set", key, value, expires_at?], ["del", key]]: пакет операций
+  применяется целиком или не применяется вовсе.
+- Ключи дополнительно лежат в отсортированном списке — сканирование по
+  префиксу и диапазону стоит O(log n + размер ответа).
+- TTL: срок хранится абсолютным временем (expires_at, Unix-секунды) в записи
+  set. Просроченный ключ сразу не виден при чтении (ленивая проверка), а
+  удаляет его фоновый поток: раз в REAP_INTERVAL секунд снимает с вершины
+  min-кучи сроков то, что истекло, и пишет удаление одной записью журнала.
+- Запись стоит O(размер записи): строка дописывается в конец журнала, а не
+  переписывается весь файл.
+- Групповая фиксация: поток записи собирает строки, пришедшие в течение
+  GROUP_COMMIT_MS, пишет их одним write и делает один fsync на всех;
+  вызывающий поток возвращается, когда его запись на диске.
+- Старт: снимок + журнал (недописанный хвост после сбоя отбрасывается по
+  контрольной сумме).
+- Уплотнение в фоне: когда журнал больше COMPACT_MIN_BYTES и больше
+  COMPACT_RATIO размеров снимка, журнал переименовывается в data.log.old,
+  новые записи идут в свежий data.log, снимок пишется во временный файл,
+  fsync, rename поверх data.json — и только потом data.log.old удаляется.
+  Сбой на любом шаге оставляет на диске полный набор данных.
+"""
+import heapq
+import json
+import os
+import threading
+import time
+import zlib
+from bisect import bisect_left, insort
+
+GROUP_COMMIT_MS = float(os.getenv("KV_GROUP_COMMIT_MS", "2"))
+LOG_FSYNC = os.getenv("KV_LOG_FSYNC", "1") == "1"
+COMPACT_MIN_BYTES = int(os.getenv("KV_COMPACT_MIN_BYTES", str(1024 * 1024)))
+COMPACT_RATIO = float(os.getenv("KV_COMPACT_RATIO", "2"))
+REAP_INTERVAL = float(os.getenv("KV_REAP_INTERVAL", "1"))
+REAP_BATCH = int(os.getenv("KV_REAP_BATCH", "1000"))
+
+# снимок всегда пишется как {SNAPSHOT_MARK: 2, "data": {...}, "expires": {...}};
+# словарь без метки — старый формат (только данные), его только читаем
+SNAPSHOT_MARK = "__kv_snapshot__"
+
+
+def encode_value(value) -> bytes:
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def encode_record(ops: list, spans: list = None) -> bytes:
+    """
+    Строка журнала. spans, если передан, получает (смещение, длина) значения
+    каждой set-операции внутри строки — по ним tiered_store читает значения
+    прямо из журнала. Байты строки в обоих случаях одинаковые.
+    """
+    if spans is None:
+        payload = encode_value(ops)
+    else:
+        parts, position = [b"["], 10  # 8 знаков crc, пробел и "["
+        for index, op in enumerate(ops):
+            if index:
+                parts.append(b",")
+                position += 1
+            if op[0] == "set":
+                head = b'["set",' + encode_value(op[1]) + b","
+                value = encode_value(op[2])
+                spans.append((position + len(head), len(value)))
+                piece = head + value + b"".join(b"," + encode_value(extra) for extra in op[3:]) + b"]"
+            else:
+                piece = encode_value(op)
+            parts.append(piece)
+            position += len(piece)
+        parts.append(b"]")
+        payload = b"".join(parts)
+    return b"%08x " % zlib.crc32(payload) + payload + b"\n"
+
+
+def decode_record(line: bytes):
+    """Операции записи или None, если строка оборвана или повреждена."""
+    if not line.endswith(b"\n") or len(line) < 10 or line[8:9] != b" ":
+        return None
+    payload = line[9:-1]
+    try:
+        if int(line[:8], 16) != zlib.crc32(payload):
+            return None
+        return json.loads(payload)
+    except ValueError:
+        return None
+
+
+def fsync_dir(path: str):
+    """fsync каталога — чтобы rename и создание файлов пережили сбой питания."""
+    try:
+        fd = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY)
+    except OSError:
+        return  # на Windows каталог не открыть — там rename и так надёжен
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def read_log(path):
+    """(операции, строка) по порядку; на оборванной или повреждённой строке чтение останавливается."""
+    if not os.path.exists(path):
+        return
+    with open(path, "rb") as f:
+        for line in f:
+            ops = decode_record(line)
+            if ops is None:
+                return
+            yield ops, line
+
+
+def read_snapshot(snapshot_path) -> tuple[dict, dict]:
+    """(data, expires) из снимка; нет файла — пусто."""
+    if not os.path.exists(snapshot_path):
+        return {}, {}
+    with open(snapshot_path, "r", encoding="utf-8") as f:
+        snapshot = json.load(f)
+    # пользовательский ключ SNAPSHOT_MARK в старом формате не путаем с меткой
+    if snapshot.keys() == {SNAPSHOT_MARK, "data", "expires"} and snapshot[SNAPSHOT_MARK] == 2:
+        return snapshot["data"], snapshot["expires"]
+    return snapshot, {}
+
+
+def read_data(snapshot_path="data.json") -> tuple[dict, dict]:
+    """
+    Данные LogStore (снимок + журналы) только на чтение — для переноса в
+    другой движок: без потоков, без обрезки хвоста, без записи на диск.
+    """
+    data, expires = read_snapshot(snapshot_path)
+    log_path = os.path.splitext(snapshot_path)[0] + ".log"
+    for path in (log_path + ".old", log_path):
+        for ops, _ in read_log(path):
+            for op in ops:
+                key = op[1]
+                if op[0] == "set":
+                    data[key] = op[2]
+                    if len(op) > 3 and op[3] is not None:
+                        expires[key] = op[3]
+                    else:
+                        expires.pop(key, None)
+                elif op[0] == "del":
+                    data.pop(key, None)
+                    expires.pop(key, None)
+    return data, expires
+
+
+def set_op(key, value, ttl=None) -> list:
+    """Операция set; ttl — секунды жизни ключа (None — бессрочно)."""
+    if ttl is None:
+        return ["set", key, value]
+    return ["set", key, value, time.time() + ttl]
+
+
+class LogStore:
+    """Словарь в памяти, изменения которого журналируются на диск."""
+
+    def __init__(self, snapshot_path="data.json", log_path=None):
+        self.snapshot_path = snapshot_path
+        self.log_path = log_path or os.path.splitext(snapshot_path)[0] + ".log"
+        self.old_log_path = self.log_path + ".old"
+        self.data = {}
+        self.expires = {}   # ключ -> expires_at
+        self._keys = []     # отсортированные ключи
+        self._expiry_heap = []  # (expires_at, ключ); устаревшие записи пропускаются при снятии
+        self._lock = threading.Lock()          # данные и порядок строк журнала
+        self._log_lock = threading.Lock()      # файл журнала: запись против переключения
+        self._cond = threading.Condition(threading.Lock())  # очередь групповой фиксации
+        self._pending = []
+        self._queued_seq = 0
+        self._durable_seq = 0
+        self._error = None
+        self._compacting = False
+        self._closed = False
+        self._recover()
+        self._log = open(self.log_path, "ab")
+        self._log_bytes = self._log.tell()
+        self._writer = threading.Thread(target=self._write_loop, name="kv-wal", daemon=True)
+        self._writer.start()
+        self._reaper = threading.Thread(target=self._reap_loop, name="kv-reaper", daemon=True)
+        self._reaper.start()
+
+    # --- чтение ---
+
+    def _expired(self, key, now=None) -> bool:
+        expires_at = self.expires.get(key)
+        return expires_at is not None and expires_at <= (now or time.time())
+
+    def get(self, key, default=None):
+        value = self.data.get(key, default)
+        return default if self._expired(key) else value
+
+    def __contains__(self, key):
+        return key in self.data and not self._expired(key)
+
+    def __len__(self):
+        return len(self.data)
+
+    def ttl(self, key):
+        """Секунд до истечения; None — ключ бессрочный (или его нет)."""
+        expires_at = self.expires.get(key)
+        return None if expires_at is None else max(expires_at - time.time(), 0.0)
+
+    def mget(self, keys) -> dict:
+        """Значения существующих ключей из keys."""
+        now = time.time()
+        return {key: self.data[key] for key in keys if key in self.data and not self._expired(key, now)}
+
+    def scan(self, prefix="", start=None, end=None, limit=100) -> list:
+        """
+        [(ключ, значение)] по возрастанию ключа: ключи с префиксом prefix
+        в диапазоне [start, end), не больше limit.
+        """
+        now = time.time()
+        lower = max(prefix, start) if start is not None else prefix
+        items = []
+        with self._lock:
+            keys = self._keys
+            for index in range(bisect_left(keys, lower), len(keys)):
+                key = keys[index]
+                if not key.startswith(prefix) or (end is not None and key >= end):
+                    break
+                if not self._expired(key, now):
+                    items.append((key, self.data[key]))
+                    if len(items) >= limit:
+                        break
+        return items
+
+    # --- запись ---
+
+    def set(self, key, value, ttl=None):
+        self.write([set_op(key, value, ttl)])
+
+    def delete(self, key) -> bool:
+        """False — ключа не было (в журнал ничего не пишется)."""
+        return bool(self.mdelete([key]))
+
+    def mdelete(self, keys) -> list:
+        """Удалить существующие ключи одной записью; возвращает удалённые."""
+        with self._lock:
+            present = [key for key in dict.fromkeys(keys) if key in self]
+            if not present:
+                return []
+            seq = self._enqueue([["del", key] for key in present])
+        self._wait(seq)
+        return present
+
+    def write(self, ops: list):
+        """Применить пакет операций и дождаться, пока он окажется на диске."""
+        with self._lock:
+            seq = self._enqueue(ops)
+        self._wait(seq)
+
+    def _enqueue(self, ops) -> int:
+        """Применить в памяти и поставить строку в очередь (под self._lock — порядок как в памяти)."""
+        record = encode_record(ops)
+        with self._cond:
+            if self._error is not None:
+                raise OSError("Журнал недоступен") from self._error
+            self._apply(ops)
+            self._pending.append(record)
+            self._queued_seq += 1
+            self._cond.notify_all()
+            return self._queued_seq
+
+    def _wait(self, seq: int):
+        with self._cond:
+            while self._durable_seq < seq and self._error is None:
+                self._cond.wait()
+            if self._durable_seq < seq:
+                raise OSError("Запись в журнал не удалась") from self._error
+        self._maybe_compact()
+
+    def _apply(self, ops, places=None):
+        """places — по одному на set-операцию: где значение лежит в журнале (для tiered_store)."""
+        places = iter(places or ())
+        for op in ops:
+            key = op[1]
+            if op[0] == "set":
+                if key not in self.data:
+                    insort(self._keys, key)
+                self._put(key, op[2], next(places, None))
+                expires_at = op[3] if len(op) > 3 else None
+                if expires_at is None:
+                    self.expires.pop(key, None)
+                else:
+                    self.expires[key] = expires_at
+                    heapq.heappush(self._expiry_heap, (expires_at, key))
+                    if len(self._expiry_heap) > 2 * len(self.expires) + 1024:
+                        # перезаписанные сроки копятся в куче — пересобираем по актуальным
+                        self._expiry_heap = [(t, k) for k, t in self.expires.items()]
+                        heapq.heapify(self._expiry_heap)
+            elif op[0] == "del" and key in self.data:
+                del self._keys[bisect_left(self._keys, key)]
+                del self.data[key]
+                self.expires.pop(key, None)
+
+    def _put(self, key, value, place):
+        self.data[key] = value
+
+    def _reap_loop(self):
+        while not self._closed:
+            time.sleep(REAP_INTERVAL)
+            try:
+                self.reap()
+            except OSError:
+                pass  # журнал недоступен — ключи и так не видны при чтении
+
+    def reap(self, now=None) -> int:
+        """Удалить истёкшие ключи (не больше REAP_BATCH за раз); возвращает их число."""
+        now = now or time.time()
+        heap = self._expiry_heap
+        with self._lock:
+            expired = []
+            while heap and heap[0][0] <= now and len(expired) < REAP_BATCH:
+                expires_at, key = heapq.heappop(heap)
+                if self.expires.get(key) == expires_at:  # иначе срок уже продлён или ключ удалён
+                    expired.append(key)
+            if not expired:
+                return 0
+            seq = self._enqueue([["del", key] for key in expired])
+        self._wait(seq)
+        return len(expired)
+
+    def _write_loop(self):
+        while True:
+            with self._cond:
+                while not self._pending and not self._closed:
+                    self._cond.wait()
+                if not self._pending and self._closed:
+                    return
+                # окно группировки: даём догнать тем, кто пишет одновременно
+                self._cond.wait(GROUP_COMMIT_MS / 1000)
+            try:
+                with self._log_lock:
+                    self._flush_pending()
+            except OSError:
+                return
+
+    def _flush_pending(self):
+        """
+        Записать очередь одним write и fsync (под self._log_lock, но не под
+        self._lock — запись в память не ждёт диска).
+        """
+        with self._cond:
+            batch, self._pending = self._pending, []
+            last = self._queued_seq
+        try:
+            if batch:
+                chunk = b"".join(batch)
+                self._log.write(chunk)
+                self._log.flush()
+                if LOG_FSYNC:
+                    os.fsync(self._log.fileno())
+                self._log_bytes += len(chunk)
+        except OSError as exc:
+            with self._cond:
+                self._error = exc
+                self._cond.notify_all()
+            raise
+        with self._cond:
+            self._durable_seq = max(self._durable_seq, last)
+            self._cond.notify_all()
+
+    # --- восстановление ---
+
+    def _replay(self, path):
+        """Применить журнал; оборванный хвост обрезается."""
+        if not os.path.exists(path):
+            return
+        good = 0
+        for ops, line in read_log(path):
+            self._apply(ops)
+            good += len(line)
+        if good != os.path.getsize(path):
+            with open(path, "r+b") as f:
+                f.truncate(good)
+
+    def _recover(self):
+        if os.path.exists(self.snapshot_path):
+            self.data, self.expires = read_snapshot(self.snapshot_path)
+            self._keys = sorted(self.data)
+            self._expiry_heap = [(expires_at, key) for key, expires_at in self.expires.items()]
+            heapq.heapify(self._expiry_heap)
+        self._replay(self.old_log_path)
+        self._replay(self.log_path)
+        if os.path.exists(self.old_log_path):
+            # уплотнение прервалось — доводим: снимок со всеми данными, затем оба журнала не нужны
+            self._write_snapshot(self.data, self.expires)
+            os.remove(self.old_log_path)
+            if os.path.exists(self.log_path):
+                os.truncate(self.log_path, 0)
+        elif not os.path.exists(self.snapshot_path):
+            self._write_snapshot({}, {})
+
+    # --- уплотнение ---
+
+    def _write_snapshot(self, data, expires):
+        snapshot = {SNAPSHOT_MARK: 2, "data": data, "expires": expires}
+        tmp = self.snapshot_path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(snapshot, f, ensure_ascii=False, separators=(",", ":"))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.snapshot_path)
+        fsync_dir(self.snapshot_path)
+
+    def _maybe_compact(self):
+        if self._compacting or self._log_bytes < COMPACT_MIN_BYTES:
+            return
+        try:
+            snapshot_bytes = os.path.getsize(self.snapshot_path)
+        except OSError:
+            snapshot_bytes = 0
+        if self._log_bytes < COMPACT_RATIO * snapshot_bytes:
+            return
+        with self._lock:
+            if self._compacting:
+                return
+            self._compacting = True
+        threading.Thread(target=self.compact, name="kv-compact", daemon=True).start()
+
+    def _rotate_log(self):
+        """
+        data.log -> data.log.old, дальше пишем в новый data.log (под self._lock
+        и self._log_lock). Очередь сначала дописывается в старый файл: всё,
+        что применено в памяти до переключения, лежит в data.log.old.
+        """
+        self._flush_pending()
+        self._log.close()
+        os.replace(self.log_path, self.old_log_path)
+        self._log = open(self.log_path, "ab")
+        self._log_bytes = 0
+        fsync_dir(self.log_path)
+
+    def compact(self):
+        """Записать свежий снимок и отбросить журнал, который в нём учтён."""
+        self._compacting = True
+        try:
+            with self._lock, self._log_lock:
+                # всё, что уже в журнале, попадает в копию; дальше пишем в новый файл
+                self._rotate_log()
+                data, expires = dict(self.data), dict(self.expires)
+            self._write_snapshot(data, expires)
+            os.remove(self.old_log_path)
+        finally:
+            self._compacting = False
+
+    def stats(self) -> dict:
+        return {"keys": len(self.data), "log_bytes": self._log_bytes}
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._writer.join()
+        self._log.close()
@@ -0,0 +1,136 @@
+# test_app.py
+import importlib
+import os
+import sys
+import time
+
+import pytest
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    """
+    Свежий app.py (и лимиты, и data) в пустой папке — data.json репозитория не
+    трогаем. Модуль "app" есть и в rgz: при запуске из корня репозитория
+    импортируем именно этот, а чужой в sys.modules после теста возвращаем.
+    """
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("KV_ENGINE", "log")
+    monkeypatch.syspath_prepend(os.path.dirname(os.path.abspath(__file__)))
+    monkeypatch.delitem(sys.modules, "app", raising=False)
+    module = importlib.import_module("app")
+    yield module.app.test_client()
+    module.data.close()
+
+
+def items(count, prefix="k"):
+    return [{"key": f"{prefix}{i:04d}", "value": i} for i in range(count)]
+
+
+def test_mset_mget_mdelete(client):
+    resp = client.post("/mset", json={"items": [
+        {"key": "a", "value": {"x": 1}}, {"key": "b", "value": [2]}, {"key": "t", "value": 3, "ttl": 60},
+    ]})
+    assert resp.status_code == 200 and resp.json["count"] == 3
+
+    resp = client.post("/mget", json={"keys": ["a", "b", "nope"]})
+    assert resp.json == {"values": {"a": {"x": 1}, "b": [2]}, "missing": ["nope"]}
+
+    resp = client.post("/mdelete", json={"keys": ["a", "nope", "a"]})
+    assert resp.json == {"deleted": ["a"], "missing": ["nope"]}
+    assert client.get("/exists/a").json["exists"] is False
+
+
+@pytest.mark.parametrize("body", [
+    {},
+    {"items": []},
+    {"items": "a"},
+    {"items": [{"key": 1, "value": 1}]},
+    {"items": [{"key": "a"}]},
+    {"items": [{"key": "a", "value": 1, "ttl": 0}]},
+    {"items": [{"key": "a", "value": 1, "ttl": True}]},
+    {"items": [{"key": "a", "value": 1, "ttl": "10"}]},
+])
+def test_mset_rejects_bad_items(client, body):
+    assert client.post("/mset", json=body).status_code == 400
+    assert client.post("/mget", json={"keys": ["a"]}).json["missing"] == ["a"]  # ничего не записано
+
+
+def test_batch_size_limit(client, monkeypatch):
+    monkeypatch.setattr(sys.modules["app"], "MAX_BATCH", 5)  # иначе 1001 элемент упрётся в лимит раньше
+    assert client.post("/mset", json={"items": items(6)}).status_code == 400
+    assert client.post("/mget", json={"keys": [f"k{i}" for i in range(6)]}).status_code == 400
+    assert client.post("/mdelete", json={"keys": []}).status_code == 400
+    assert client.post("/mget", json={"keys": ["a", 1]}).status_code == 400
+
+
+def test_batch_cost_counts_against_limit(client):
+    # 10 в минуту; пакет из 250 элементов стоит 3, из 100 — как один запрос
+    for _ in range(3):
+        assert client.post("/mset", json={"items": items(250)}).status_code == 200
+    assert client.post("/mset", json={"items": items(250)}).status_code == 429
+    assert client.post("/mset", json={"items": items(1)}).status_code == 429
+
+
+def test_small_batch_costs_one_request(client):
+    for _ in range(3):
+        assert client.post("/mset", json={"items": items(250)}).status_code == 200
+    assert client.post("/mset", json={"items": items(100)}).status_code == 200
+    assert client.post("/mset", json={"items": items(1)}).status_code == 429
+
+
+def test_scan_pages_with_after_cursor(client):
+    client.post("/mset", json={"items": items(5, "u:") + items(2, "v:")})
+
+    page = client.get("/scan?prefix=u:&limit=2").json
+    assert [item["key"] for item in page["items"]] == ["u:0000", "u:0001"]
+    assert page["next"] == "u:0001"
+
+    keys = [item["key"] for item in page["items"]]
+    while page["next"]:
+        page = client.get(f"/scan?prefix=u:&limit=2&after={page['next']}").json
+        keys += [item["key"] for item in page["items"]]
+    assert keys == [f"u:{i:04d}" for i in range(5)]
+    assert page["next"] is None
+
+    page = client.get("/scan?start=u:0003&end=v:0001").json
+    assert [item["key"] for item in page["items"]] == ["u:0003", "u:0004", "v:0000"]
+    assert page["items"][0]["value"] == 3
+
+
+@pytest.mark.parametrize("limit", ["0", "-1", "1001", "x"])
+def test_scan_rejects_bad_limit(client, limit):
+    assert client.get(f"/scan?limit={limit}").status_code == 400
+
+
+def test_ttl_endpoint_and_expiry(client):
+    client.post("/set", json={"key": "plain", "value": 1})
+    client.post("/set", json={"key": "short", "value": 2, "ttl": 0.05})
+    client.post("/set", json={"key": "long", "value": 3, "ttl": 100})
+
+    assert client.get("/ttl/plain").json == {"key": "plain", "ttl": None}
+    assert 99 < client.get("/ttl/long").json["ttl"] <= 100
+    assert client.get("/ttl/nope").status_code == 404
+
+    time.sleep(0.1)
+    assert client.get("/get/short").status_code == 404
+    assert client.get("/ttl/short").status_code == 404
+
+
+@pytest.mark.parametrize("body", [
+    {"key": "a", "value": 1, "ttl": 0},
+    {"key": "a", "value": 1, "ttl": -5},
+    {"key": "a", "value": 1, "ttl": False},
+    {"key": "a", "value": 1, "ttl": "5"},
+    {"key": 5, "value": 1},
+    {"key": "a"},
+])
+def test_set_validation(client, body):
+    assert client.post("/set", json=body).status_code == 400
+    assert client.get("/exists/a").json["exists"] is False
+
+
+def test_set_limit_is_enforced(client):
+    for i in range(10):
+        assert client.post("/set", json={"key": f"k{i}", "value": i}).status_code == 200
+    assert client.post("/set", json={"key": "k10", "value": 10}).status_code == 429
@@ -0,0 +1,233 @@
+# test_shm_store.py
+import multiprocessing
+import os
+import time
+
+from limits import parse
+from limits.strategies import FixedWindowRateLimiter
+
+import shm_store
+from shm_store import BUMP_OFFSET, NS_DATA, U64, SharedLimiterStorage, SharedStore, key_hash
+from storage import LogStore
+
+
+def test_import_takes_snapshot_and_log(tmp_path):
+    source = LogStore(str(tmp_path / "data.json"))
+    for i in range(10):
+        source.set(f"k{i}", {"n": i}, ttl=100 if i == 3 else None)
+    source.delete("k5")
+    source.close()
+    files = {name: os.path.getsize(tmp_path / name) for name in os.listdir(tmp_path)}
+
+    store = SharedStore(str(tmp_path / "data.shm"), import_from=str(tmp_path / "data.json"))
+    try:
+        # почти всё живёт в data.log — снимок пуст, пока журнал не уплотнён
+        assert len(store) == 9
+        assert store.get("k9") == {"n": 9}
+        assert "k5" not in store
+        assert 0 < store.ttl("k3") <= 100 and store.ttl("k4") is None
+    finally:
+        store.close()
+    # источник только читается
+    assert {name: os.path.getsize(tmp_path / name) for name in files} == files
+
+
+def open_store(tmp_path):
+    return SharedStore(str(tmp_path / "data.shm"))
+
+
+def run_in_child(target, *args):
+    """target(*args) в дочернем процессе (fork); код выхода 0 — успех."""
+    process = multiprocessing.get_context("fork").Process(target=target, args=args)
+    process.start()
+    process.join(10)
+    if process.is_alive():
+        process.kill()
+        process.join()
+    return process.exitcode
+
+
+def test_read_retries_when_stripe_changes(tmp_path):
+    store = open_store(tmp_path)
+    try:
+        store.set("k", 1)
+        stripe = store._position(key_hash(NS_DATA, b"k"))[0]
+        calls = []
+
+        def reader():
+            calls.append(1)
+            if len(calls) == 1:
+                store._unlock(store._lock([stripe]))  # писатель успел поменять полосу
+            return len(calls)
+
+        assert store._read(stripe, reader) == 2
+    finally:
+        store.close()
+
+
+def test_read_recovers_after_dead_writer(tmp_path, monkeypatch):
+    monkeypatch.setattr(shm_store, "SPIN_LIMIT", 10)
+    store = open_store(tmp_path)
+    try:
+        store.set("k", {"v": 1})
+        stripe = store._position(key_hash(NS_DATA, b"k"))[0]
+        store._bump(stripe)  # версия нечётная — будто писатель умер посреди изменения
+        assert store.get("k") == {"v": 1}
+        assert store._version(stripe) % 2 == 0
+    finally:
+        store.close()
+
+
+def _rewrite_pairs(path, rounds):
+    store = SharedStore(path)
+    for i in range(rounds):
+        # размер меняется — значение переезжает между слотом и блоками разных классов
+        store.set("pair", {"a": i, "b": i, "pad": "x" * (i % 7 * 100)})
+    store.close()
+
+
+def test_readers_never_see_torn_values(tmp_path):
+    store = open_store(tmp_path)
+    try:
+        store.set("pair", {"a": -1, "b": -1, "pad": ""})
+        process = multiprocessing.get_context("fork").Process(
+            target=_rewrite_pairs, args=(store.path, 3000))
+        process.start()
+        seen = set()
+        while process.is_alive():
+            value = store.get("pair")
+            assert value["a"] == value["b"]
+            seen.add(value["a"])
+        process.join()
+        assert process.exitcode == 0
+        assert store.get("pair")["a"] == 2999 and len(seen) > 1
+    finally:
+        store.close()
+
+
+def _count_and_write(store, n, rounds):
+    for i in range(rounds):
+        store.incr("hits", 60)
+        store.write([["set", f"p{n}-{i}", i], ["set", "shared", [n, i]]])
+
+
+def test_processes_share_counters_and_stripes(tmp_path, monkeypatch):
+    monkeypatch.setattr(shm_store, "SHM_STRIPES", 4)  # мало полос — процессы конкурируют за них
+    monkeypatch.setattr(shm_store, "SHM_SLOTS", 1024)
+    store = open_store(tmp_path)
+    try:
+        ctx = multiprocessing.get_context("fork")
+        processes = [ctx.Process(target=_count_and_write, args=(store, n, 100)) for n in range(4)]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join(30)
+        assert [process.exitcode for process in processes] == [0] * 4
+        assert store.counter("hits")[0] == 400
+        assert len(store) == 401
+        assert store.get("shared")[1] == 99
+    finally:
+        store.close()
+
+
+def _set_key(store):
+    store.set("k", "from child")
+
+
+def test_fork_resets_thread_locks(tmp_path):
+    store = open_store(tmp_path)
+    try:
+        stripe = store._position(key_hash(NS_DATA, b"k"))[0]
+        lock = store._stripe_locks[stripe]
+        with lock:  # другой поток родителя держит полосу в момент fork
+            assert run_in_child(_set_key, store) == 0
+        assert store.get("k") == "from child"
+    finally:
+        store.close()
+
+
+def test_overflow_blocks_are_reused(tmp_path):
+    store = open_store(tmp_path)
+    try:
+        big = "x" * 300  # в слот не помещается — блок класса 512 Б
+        store.set("a", big)
+        used = U64.unpack_from(store.mm, BUMP_OFFSET)[0]
+        assert used == 512
+
+        store.set("a", "y" * 250)  # помещается в тот же блок
+        assert U64.unpack_from(store.mm, BUMP_OFFSET)[0] == used
+        store.delete("a")
+        store.set("b", big)  # блок взят из списка свободных
+        assert U64.unpack_from(store.mm, BUMP_OFFSET)[0] == used
+        assert store.get("b") == big
+
+        store.set("b", "z" * 700)  # класс 1024 Б — новый блок, старый свободен
+        assert U64.unpack_from(store.mm, BUMP_OFFSET)[0] == used + 1024
+        store.set("c", big)
+        assert U64.unpack_from(store.mm, BUMP_OFFSET)[0] == used + 1024
+        assert (store.get("b"), store.get("c")) == ("z" * 700, big)
+    finally:
+        store.close()
+
+
+def test_remove_clears_tombstones_before_empty_slot(tmp_path, monkeypatch):
+    monkeypatch.setattr(shm_store, "SHM_STRIPES", 1)
+    monkeypatch.setattr(shm_store, "SHM_SLOTS", 16)
+    store = open_store(tmp_path)
+    try:
+        # три ключа с одной стартовой позицией — цепочка пробирования из трёх слотов
+        by_start = {}
+        for i in range(1000):
+            key = f"k{i}"
+            by_start.setdefault(store._position(key_hash(NS_DATA, key.encode()))[1], []).append(key)
+        start, keys = next((s, k[:3]) for s, k in by_start.items() if len(k) >= 3)
+        a, b, c = keys
+        store.write([["set", key, key] for key in keys])
+        states = lambda: [store.mm[store._slot_offset(0, (start + i) % 16)] for i in range(3)]
+        assert states() == [shm_store.USED] * 3
+
+        store.delete(b)
+        assert states() == [shm_store.USED, shm_store.DELETED, shm_store.USED]
+        assert store.get(c) == c  # поиск проходит через удалённый слот
+        store.delete(a)
+        assert states() == [shm_store.DELETED, shm_store.DELETED, shm_store.USED]
+        store.delete(c)  # за c пусто — цепочка освобождается целиком
+        assert states() == [shm_store.EMPTY] * 3
+        assert len(store) == 0
+    finally:
+        store.close()
+
+
+def test_limiter_storage_counters(tmp_path):
+    path = str(tmp_path / "data.shm")
+    storage = SharedLimiterStorage("kvshm://" + path)
+    try:
+        assert storage.store is SharedLimiterStorage("kvshm://" + path).store  # одно отображение на процесс
+        storage.store.set("hits", "data")  # ключ данных с тем же именем — другое пространство имён
+        assert (storage.incr("hits", 60), storage.incr("hits", 60, amount=3)) == (1, 4)
+        assert storage.get("hits") == 4 and storage.get("nope") == 0
+        assert time.time() < storage.get_expiry("hits") <= time.time() + 60
+
+        storage.incr("short", 0.05)
+        time.sleep(0.1)
+        assert storage.get("short") == 0
+        assert storage.incr("short", 60) == 1  # окно истекло — счёт заново
+
+        limiter = FixedWindowRateLimiter(storage)
+        limit = parse("2/minute")
+        assert [limiter.hit(limit, "ip") for _ in range(3)] == [True, True, False]
+        assert run_in_child(_hit, storage, limit) == 0
+        assert limiter.get_window_stats(limit, "ip").remaining == 0
+
+        storage.clear("hits")
+        assert storage.get("hits") == 0
+        assert storage.reset() == 2
+        assert storage.get("short") == 0 and storage.store.get("hits") == "data"
+    finally:
+        storage.store.close()
+
+
+def _hit(storage, limit):
+    # другой процесс видит тот же счётчик — лимит уже исчерпан
+    if FixedWindowRateLimiter(storage).hit(limit, "ip"):
+        raise SystemExit(1)
@@ -0,0 +1,191 @@
+# test_storage.py
+import json
+import os
+import threading
+import time
+
+from storage import LogStore, encode_record, read_data, set_op
+
+
+def open_store(tmp_path):
+    return LogStore(str(tmp_path / "data.json"))
+
+
+def test_replay_truncates_torn_tail(tmp_path):
+    store = open_store(tmp_path)
+    store.set("a", 1)
+    store.write([["set", "b", 2], ["set", "c", 3]])
+    store.close()
+    good = os.path.getsize(store.log_path)
+    with open(store.log_path, "ab") as f:
+        record = encode_record([["set", "d", 4], ["del", "a"]])
+        f.write(record[:-5])  # пакет оборван на середине — не применяется целиком
+
+    store = open_store(tmp_path)
+    try:
+        assert os.path.getsize(store.log_path) == good
+        assert (store.get("a"), store.get("d"), len(store)) == (1, None, 3)
+        store.set("e", 5)  # пишется сразу после последней целой строки
+    finally:
+        store.close()
+
+    store = open_store(tmp_path)
+    try:
+        assert store.get("e") == 5 and len(store) == 4
+    finally:
+        store.close()
+
+
+def test_corrupted_record_stops_replay(tmp_path):
+    store = open_store(tmp_path)
+    store.set("a", 1)
+    store.set("b", 2)
+    store.close()
+    with open(store.log_path, "r+b") as f:
+        lines = f.read().splitlines(keepends=True)
+        f.seek(len(lines[0]) + 20)
+        f.write(b"X")  # контрольная сумма второй строки не сходится
+
+    store = open_store(tmp_path)
+    try:
+        assert (store.get("a"), store.get("b")) == (1, None)
+    finally:
+        store.close()
+
+
+def test_recovery_after_crash_between_rotate_and_snapshot(tmp_path):
+    store = open_store(tmp_path)
+    store.set("a", 1)
+    store.set("b", 2, ttl=100)
+    store.close()
+    # сбой после переключения журнала: снимок ещё старый (пустой), всё — в data.log.old
+    os.replace(store.log_path, store.old_log_path)
+    with open(store.log_path, "wb") as f:
+        f.write(encode_record([["set", "c", 3], ["del", "a"]]))
+
+    store = open_store(tmp_path)
+    try:
+        assert not os.path.exists(store.old_log_path)
+        assert os.path.getsize(store.log_path) == 0
+        assert store.scan() == [("b", 2), ("c", 3)]
+        assert 0 < store.ttl("b") <= 100
+    finally:
+        store.close()
+    with open(tmp_path / "data.json", encoding="utf-8") as f:
+        snapshot = json.load(f)
+    assert snapshot["data"] == {"b": 2, "c": 3} and set(snapshot["expires"]) == {"b"}
+
+
+def test_compaction_under_concurrent_writes(tmp_path):
+    store = open_store(tmp_path)
+    expected, lock, stop = {}, threading.Lock(), threading.Event()
+
+    def writer(n):
+        i = 0
+        while not stop.is_set():
+            key = f"w{n}-{i % 20}"
+            with lock:  # порядок в expected совпадает с порядком в журнале
+                store.set(key, i)
+                expected[key] = i
+            i += 1
+
+    threads = [threading.Thread(target=writer, args=(n,)) for n in range(4)]
+    for thread in threads:
+        thread.start()
+    try:
+        for _ in range(3):
+            time.sleep(0.05)
+            store.compact()
+    finally:
+        stop.set()
+        for thread in threads:
+            thread.join()
+    assert store.data == expected
+    store.close()
+    assert not os.path.exists(store.old_log_path)
+
+    store = open_store(tmp_path)
+    try:
+        assert store.data == expected
+    finally:
+        store.close()
+    assert read_data(str(tmp_path / "data.json")) == (expected, {})
+
+
+def test_snapshot_mark_as_user_key(tmp_path):
+    store = open_store(tmp_path)
+    store.set("__kv_snapshot__", 1)
+    store.set("data", 2)
+    store.compact()
+    store.close()
+
+    store = open_store(tmp_path)
+    try:
+        assert (store.get("__kv_snapshot__"), store.get("data"), len(store)) == (1, 2, 2)
+    finally:
+        store.close()
+
+
+def test_legacy_snapshot_without_mark(tmp_path):
+    with open(tmp_path / "data.json", "w", encoding="utf-8") as f:
+        json.dump({"a": 1, "__kv_snapshot__": 2}, f)
+    store = open_store(tmp_path)
+    try:
+        assert (store.get("a"), store.get("__kv_snapshot__"), store.ttl("a")) == (1, 2, None)
+    finally:
+        store.close()
+
+
+def test_expired_keys_are_reaped_after_restart(tmp_path):
+    store = open_store(tmp_path)
+    store.write([set_op("short", 1, ttl=0.05), set_op("long", 2, ttl=100), set_op("plain", 3)])
+    store.close()
+    time.sleep(0.1)
+
+    store = open_store(tmp_path)
+    try:
+        assert "short" not in store and store.get("short") is None  # уже не виден до сборки
+        assert len(store) == 3
+        assert store.reap() == 1
+        assert len(store) == 2 and store.reap() == 0
+        assert store.ttl("plain") is None and 99 < store.ttl("long") <= 100
+    finally:
+        store.close()
+
+    store = open_store(tmp_path)
+    try:
+        # удаление записано в журнал — после перезапуска ключа нет совсем
+        assert len(store) == 2 and store.expires.keys() == {"long"}
+    finally:
+        store.close()
+
+
+def test_rewritten_ttl_is_not_reaped(tmp_path):
+    store = open_store(tmp_path)
+    try:
+        store.set("k", 1, ttl=0.01)
+        store.set("k", 2)  # без срока — старая запись в куче устарела
+        time.sleep(0.02)
+        assert store.reap() == 0 and store.get("k") == 2
+    finally:
+        store.close()
+
+
+def test_scan_bounds(tmp_path):
+    store = open_store(tmp_path)
+    try:
+        store.write([set_op(key, key.upper()) for key in ["a", "b1", "b2", "b3", "ba", "c", "bz"]])
+        store.set("b4", "gone", ttl=0.01)
+        time.sleep(0.02)
+
+        keys = lambda **kwargs: [key for key, _ in store.scan(**kwargs)]
+        assert keys(prefix="b") == ["b1", "b2", "b3", "ba", "bz"]  # просроченный b4 пропущен
+        assert keys(prefix="b", limit=2) == ["b1", "b2"]
+        assert keys(prefix="b", start="b2", end="bz") == ["b2", "b3", "ba"]
+        assert keys(start="b", end="b3") == ["b1", "b2"]
+        assert keys(prefix="b", start="a") == ["b1", "b2", "b3", "ba", "bz"]  # start до префикса
+        assert keys(prefix="b", start="b2" + "\0") == ["b3", "ba", "bz"]  # курсор after=b2
+        assert keys(prefix="d") == [] and keys(start="z") == []
+        assert store.scan(prefix="c") == [("c", "C")]
+    finally:
+        store.close()
@@ -0,0 +1,151 @@
+# test_tiered_store.py
+import os
+import time
+
+from storage import LogStore, encode_record
+from tiered_store import LogFile, TieredStore
+
+
+def open_store(tmp_path, cap=1000, **kwargs):
+    return TieredStore(str(tmp_path / "data.seg"), memory_cap=cap, **kwargs)
+
+
+def test_lru_keeps_resident_bytes_under_cap(tmp_path):
+    store = open_store(tmp_path, cap=1000)
+    try:
+        for i in range(100):
+            store.set(f"k{i:03d}", "x" * 50)
+        store.get("k099")  # запись дошла до диска — теперь значения можно вытеснять
+        stats = store.stats()
+        assert stats["resident_bytes"] <= 1000 and stats["evictions"] > 0
+        assert stats["hot_keys"] < 100
+
+        assert store.get("k000") == "x" * 50  # холодный ключ читается с диска
+        misses = store.stats()["misses"]
+        assert store.get("k000") == "x" * 50  # и после этого он горячий
+        assert store.stats()["misses"] == misses
+        assert store.stats()["hits"] >= 1
+    finally:
+        store.close()
+
+
+def test_unflushed_values_are_not_evicted(tmp_path):
+    store = open_store(tmp_path, cap=100)
+    try:
+        with store._log_lock:  # поток записи стоит — строки остаются в очереди
+            with store._lock:
+                seq = store._enqueue([["set", f"k{i}", "y" * 60] for i in range(5)])
+            assert store.stats()["resident_bytes"] >= 5 * 62
+            assert store.stats()["evictions"] == 0
+            assert store.get("k0") == "y" * 60
+        store._wait(seq)
+        store.set("other", 1)  # следующая запись вытесняет уже записанное
+        assert store.stats()["resident_bytes"] <= 100
+        assert [store.get(f"k{i}") for i in range(5)] == ["y" * 60] * 5
+    finally:
+        store.close()
+
+
+def test_compaction_relocates_only_unchanged_keys(tmp_path):
+    store = open_store(tmp_path, cap=10)
+    try:
+        store.write([["set", "a", 1], ["set", "b", 2], ["set", "c", 3]])
+        with store._lock, store._log_lock:
+            store._rotate_log()
+            keys, places, expires = list(store._keys), dict(store.data.index), dict(store.expires)
+        store.set("a", 10)  # перезаписан во время уплотнения
+        store.delete("c")
+        store._rewrite_segment(keys, places, expires)
+        os.remove(store.old_log_path)
+
+        index = store.data.index
+        assert index["b"][0] is store._segment
+        assert index["a"][0] is store._log_source
+        assert "c" not in index
+        assert (store.get("a"), store.get("b"), store.get("c")) == (10, 2, None)
+    finally:
+        store.close()
+
+    store = open_store(tmp_path)
+    try:
+        assert store.scan() == [("a", 10), ("b", 2)]
+    finally:
+        store.close()
+
+
+def test_background_compaction_keeps_values(tmp_path):
+    store = open_store(tmp_path, cap=200)
+    try:
+        for i in range(50):
+            store.set(f"k{i}", [i] * 10)
+        store.compact()
+        assert os.path.getsize(store.log_path) == 0
+        assert not os.path.exists(store.old_log_path)
+        assert all(store.data.index[f"k{i}"][0] is store._segment for i in range(50))
+        assert [store.get(f"k{i}") for i in range(50)] == [[i] * 10 for i in range(50)]
+    finally:
+        store.close()
+
+
+def test_recovery_finishes_interrupted_compaction(tmp_path):
+    store = open_store(tmp_path)
+    store.write([["set", "a", 1], ["set", "b", {"x": [1, 2]}]])
+    store.set("t", "ttl", ttl=100)
+    store.close()
+    # сбой после переключения журнала: data.seg.log.old — всё старое, в новом журнале — свежее
+    os.replace(store.log_path, store.old_log_path)
+    with open(store.log_path, "wb") as f:
+        f.write(encode_record([["set", "c", 3], ["del", "a"]]))
+        f.write(b"0000 [[\"set\"")  # оборванная строка
+
+    store = open_store(tmp_path)
+    try:
+        assert not os.path.exists(store.old_log_path)
+        assert os.path.getsize(store.log_path) == 0
+        assert store.scan() == [("b", {"x": [1, 2]}), ("c", 3), ("t", "ttl")]
+        assert 0 < store.ttl("t") <= 100
+        assert all(where[0] is store._segment for where in store.data.index.values())
+        store.set("d", 4)
+    finally:
+        store.close()
+
+    store = open_store(tmp_path)
+    try:
+        assert store.get("d") == 4 and len(store) == 4
+    finally:
+        store.close()
+
+
+def test_replay_reads_values_from_log_offsets(tmp_path):
+    store = open_store(tmp_path)
+    store.write([["set", "a", "значение"], ["set", "b", [1, 2.5]]])
+    store.close()
+
+    store = open_store(tmp_path, cap=0)  # ничего не держим в памяти — всё читается из журнала
+    try:
+        assert isinstance(store.data.index["a"][0], LogFile)
+        assert (store.get("a"), store.get("b")) == ("значение", [1, 2.5])
+    finally:
+        store.close()
+
+
+def test_import_reads_log_engine_without_touching_it(tmp_path, monkeypatch):
+    monkeypatch.setattr("storage.REAP_INTERVAL", 0.01)
+    source = LogStore(str(tmp_path / "data.json"))
+    source.set("a", 1)
+    source.set("gone", 2, ttl=0.01)
+    source.delete("a")
+    source.set("b", [2])
+    source.close()
+    with open(tmp_path / "data.log", "ab") as f:
+        f.write(b"0000 [[")  # оборванный хвост — LogStore при открытии обрезал бы его
+    time.sleep(0.05)  # срок "gone" истёк — живой LogStore записал бы его удаление
+    before = {name: (tmp_path / name).read_bytes() for name in os.listdir(tmp_path)}
+
+    store = open_store(tmp_path, import_from=str(tmp_path / "data.json"))
+    try:
+        time.sleep(0.05)
+        assert store.get("b") == [2] and "a" not in store
+        assert {name: (tmp_path / name).read_bytes() for name in before} == before
+    finally:
+        store.close()
@@ -0,0 +1,337 @@
+# tiered_store.py
+"""
+Хранилище с ограниченной памятью: горячие значения — в памяти, холодные —
+на диске. Включается KV_ENGINE=tiered; файлы — data.seg и журнал data.seg.log.
+
+- В памяти всегда только индекс: ключ -> (файл, смещение, длина) значения,
+  отсортированные ключи и сроки TTL. Сами значения — в LRU в закодированном
+  виде (байты JSON, а не граф Python-объектов), суммарно не больше
+  KV_MEMORY_CAP_MB; при переполнении вытесняются самые давно читанные.
+- Вытеснение ничего не пишет: у каждого значения уже есть копия на диске.
+  Свежая запись лежит в журнале (тот же WAL с групповой фиксацией, что у
+  storage.LogStore; значение читается прямо из строки журнала по смещению),
+  после уплотнения — в сегменте. Пока строка не записана на диск, значение
+  не вытесняется.
+- Сегмент data.seg — снимок этого движка: значения подряд по возрастанию
+  ключа, за ними индекс (JSON) и футер со смещением индекса. Файл
+  отображается в память (mmap) и читается по требованию; на старте
+  читается только индекс (и хвост журнала).
+- Уплотнение — как у LogStore: журнал переименовывается в data.seg.log.old,
+  значения переписываются в новый сегмент (по одному, без загрузки всех в
+  память), rename поверх data.seg, индекс переключается на новый файл.
+- Первый запуск переносит данные из data.json (+ data.log) движка log.
+
+stats() — попадания и промахи LRU, вытеснения и занятая память — для
+подбора KV_MEMORY_CAP_MB (GET /stats).
+"""
+import heapq
+import json
+import mmap
+import os
+import struct
+import threading
+from collections import OrderedDict
+
+from storage import LogStore, encode_record, encode_value, fsync_dir, read_data, read_log
+
+MEMORY_CAP = int(float(os.getenv("KV_MEMORY_CAP_MB", "64")) * 1024 * 1024)
+
+SEGMENT_MAGIC = b"KVSEG001"
+FOOTER = struct.Struct("<QQ8s")  # смещение индекса, длина индекса, magic
+
+
+class LogFile:
+    """Журнал на чтение: значения по смещениям строк."""
+
+    def __init__(self, path):
+        self._file = open(path, "rb")  # дескриптор живёт, пока на файл ссылается индекс
+
+    def read(self, offset: int, length: int) -> bytes:
+        return os.pread(self._file.fileno(), length, offset)
+
+
+class Segment:
+    """Сегмент только для чтения, отображённый в память."""
+
+    def __init__(self, path, index=None):
+        with open(path, "rb") as f:
+            self.size = os.fstat(f.fileno()).st_size
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        index_offset, index_length, magic = FOOTER.unpack_from(self._map, self.size - FOOTER.size)
+        if magic != SEGMENT_MAGIC or self._map[:len(SEGMENT_MAGIC)] != SEGMENT_MAGIC:
+            raise ValueError(f"{path}: не сегмент хранилища")
+        self._index_span = (index_offset, index_length)
+        self._index = index
+
+    def read(self, offset: int, length: int) -> bytes:
+        return self._map[offset:offset + length]
+
+    def take_index(self) -> dict:
+        """{"keys", "offsets", "lengths", "expires"}; после передачи в индекс хранилища не держим."""
+        index, self._index = self._index, None
+        if index is None:
+            offset, length = self._index_span
+            index = json.loads(self._map[offset:offset + length])
+        return index
+
+
+def write_segment(path, items, expires) -> Segment:
+    """items — (ключ, байты JSON значения) по возрастанию ключа."""
+    keys, offsets, lengths = [], [], []
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(SEGMENT_MAGIC)
+        position = len(SEGMENT_MAGIC)
+        for key, raw in items:
+            keys.append(key)
+            offsets.append(position)
+            lengths.append(len(raw))
+            f.write(raw)
+            position += len(raw)
+        index = {"keys": keys, "offsets": offsets, "lengths": lengths,
+                 "expires": {key: expires[key] for key in keys if key in expires}}
+        encoded = encode_value(index)
+        f.write(encoded)
+        f.write(FOOTER.pack(position, len(encoded), SEGMENT_MAGIC))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+    fsync_dir(path)
+    return Segment(path, index)
+
+
+class TieredValues:
+    """
+    Отображение ключ -> значение для LogStore: индекс мест на диске + LRU байтов.
+    Место — (источник, смещение, длина); источник None — значение есть только
+    в памяти (до ближайшего уплотнения не вытесняется).
+    """
+
+    def __init__(self, cap: int, evictable):
+        self.cap = cap
+        self.evictable = evictable  # место -> можно ли забыть значение в памяти
+        self.index = {}
+        self.hot = OrderedDict()
+        self.resident = 0
+        self.hits = self.misses = self.evictions = 0
+        self._lock = threading.Lock()  # LRU меняется и при чтении
+
+    def __contains__(self, key):
+        return key in self.index
+
+    def __len__(self):
+        return len(self.index)
+
+    def __iter__(self):
+        return iter(self.index)
+
+    def __getitem__(self, key):
+        raw = self.raw(key)
+        if raw is None:
+            raise KeyError(key)
+        return json.loads(raw)
+
+    def get(self, key, default=None):
+        raw = self.raw(key)
+        return default if raw is None else json.loads(raw)
+
+    def raw(self, key):
+        with self._lock:
+            raw = self.hot.get(key)
+            if raw is not None:
+                self.hot.move_to_end(key)
+                self.hits += 1
+                return raw
+            where = self.index.get(key)
+            if where is None:
+                return None
+            self.misses += 1
+        raw = where[0].read(where[1], where[2])
+        with self._lock:
+            if self.index.get(key) is where and key not in self.hot:  # ключ не перезаписан, пока читали
+                self._remember(key, raw)
+        return raw
+
+    def load(self, key, where):
+        """Байты значения по месту where (для уплотнения); None — ключ уже удалён."""
+        if where[0] is not None:
+            return where[0].read(where[1], where[2])
+        with self._lock:
+            return self.hot.get(key)
+
+    def put(self, key, raw: bytes, where):
+        with self._lock:
+            self.index[key] = where
+            self._forget(key)
+            self._remember(key, raw)
+
+    def __delitem__(self, key):
+        with self._lock:
+            del self.index[key]
+            self._forget(key)
+
+    def _forget(self, key):
+        old = self.hot.pop(key, None)
+        if old is not None:
+            self.resident -= len(old)
+
+    def _remember(self, key, raw):
+        self.hot[key] = raw
+        self.resident += len(raw)
+        budget = len(self.hot)
+        while self.resident > self.cap and budget:
+            budget -= 1
+            old_key, old = self.hot.popitem(last=False)
+            if not self.evictable(self.index[old_key]):
+                self.hot[old_key] = old  # копии на диске ещё нет — в конец очереди
+                continue
+            self.resident -= len(old)
+            self.evictions += 1
+
+    def relocate(self, old: dict, segment: Segment, index: dict):
+        """Перевести на сегмент ключи, место которых с копии old не менялось."""
+        current = self.index
+        for key, offset, length in zip(index["keys"], index["offsets"], index["lengths"]):
+            if current.get(key) is old[key]:
+                current[key] = (segment, offset, length)
+
+
+class TieredStore(LogStore):
+    """LogStore, который держит в памяти индекс, а значения — в LRU и на диске."""
+
+    def __init__(self, path="data.seg", import_from=None, memory_cap=MEMORY_CAP):
+        self.import_from = import_from
+        self.memory_cap = memory_cap
+        self._segment = None
+        self._log_source = None
+        self._log_end = 0  # конец журнала с учётом очереди — смещение следующей строки
+        super().__init__(path, log_path=path + ".log")
+
+    def _evictable(self, where) -> bool:
+        source, offset, length = where
+        if source is None:
+            return False
+        return source is not self._log_source or offset + length <= self._log_bytes
+
+    # --- запись ---
+
+    def _enqueue(self, ops) -> int:
+        spans = []
+        record = encode_record(ops, spans)
+        with self._cond:
+            if self._error is not None:
+                raise OSError("Журнал недоступен") from self._error
+            start, source = self._log_end, self._log_source
+            self._apply(ops, [(source, start + offset, record[offset:offset + length])
+                              for offset, length in spans])
+            self._pending.append(record)
+            self._log_end += len(record)
+            self._queued_seq += 1
+            self._cond.notify_all()
+            return self._queued_seq
+
+    def _put(self, key, value, place):
+        if place is None:  # строка журнала в другом виде — место значения в ней неизвестно
+            raw = encode_value(value)
+            self.data.put(key, raw, (None, 0, len(raw)))
+        else:
+            source, offset, raw = place
+            self.data.put(key, raw, (source, offset, len(raw)))
+
+    # --- восстановление ---
+
+    def _replay(self, path):
+        if not os.path.exists(path):
+            return
+        self._log_source = source = LogFile(path)
+        self._log_bytes = os.path.getsize(path)  # файл уже на диске — значения из него можно вытеснять
+        good = 0
+        for ops, line in read_log(path):
+            spans = []
+            if encode_record(ops, spans) == line:
+                places = [(source, good + offset, line[offset:offset + length]) for offset, length in spans]
+            else:
+                places = None
+            self._apply(ops, places)
+            good += len(line)
+        if good != os.path.getsize(path):
+            with open(path, "r+b") as f:
+                f.truncate(good)
+        self._log_end = good
+
+    def _import(self):
+        """Сегмент из данных движка log (import_from — его data.json) или пустой; источник только читается."""
+        data, expires = read_data(self.import_from) if self.import_from else ({}, {})
+        items = ((key, encode_value(data[key])) for key in sorted(data))
+        write_segment(self.snapshot_path, items, expires)
+
+    def _recover(self):
+        self.data = TieredValues(self.memory_cap, self._evictable)
+        if not os.path.exists(self.snapshot_path):
+            self._import()
+        self._segment = Segment(self.snapshot_path)
+        index = self._segment.take_index()
+        segment = self._segment
+        self.data.index = {
+            key: (segment, offset, length)
+            for key, offset, length in zip(index["keys"], index["offsets"], index["lengths"])
+        }
+        self._keys = index["keys"]  # сегмент записан по возрастанию ключа
+        self.expires = index["expires"]
+        self._expiry_heap = [(expires_at, key) for key, expires_at in self.expires.items()]
+        heapq.heapify(self._expiry_heap)
+
+        self._replay(self.old_log_path)
+        open(self.log_path, "ab").close()
+        self._replay(self.log_path)
+        if os.path.exists(self.old_log_path):
+            # уплотнение прервалось — доводим: все значения в новый сегмент, оба журнала не нужны
+            self._rewrite_segment(list(self._keys), dict(self.data.index), dict(self.expires))
+            os.remove(self.old_log_path)
+            os.truncate(self.log_path, 0)
+            self._log_source, self._log_end = LogFile(self.log_path), 0
+
+    # --- уплотнение ---
+
+    def _rewrite_segment(self, keys, places, expires):
+        """Новый сегмент из копии индекса; ключи, не менявшиеся с копии, переводятся на него."""
+        def items():
+            for key in keys:
+                raw = self.data.load(key, places[key])
+                if raw is not None:
+                    yield key, raw
+
+        segment = write_segment(self.snapshot_path, items(), expires)
+        with self._lock:
+            self.data.relocate(places, segment, segment.take_index())
+            self._segment = segment
+
+    def _rotate_log(self):
+        super()._rotate_log()
+        self._log_source, self._log_end = LogFile(self.log_path), 0
+
+    def compact(self):
+        self._compacting = True
+        try:
+            with self._lock, self._log_lock:
+                self._rotate_log()
+                keys, places, expires = list(self._keys), dict(self.data.index), dict(self.expires)
+            self._rewrite_segment(keys, places, expires)
+            os.remove(self.old_log_path)
+        finally:
+            self._compacting = False
+
+    def stats(self) -> dict:
+        values = self.data
+        lookups = values.hits + values.misses
+        return {
+            **super().stats(),
+            "hot_keys": len(values.hot),
+            "resident_bytes": values.resident,
+            "memory_cap_bytes": values.cap,
+            "hits": values.hits,
+            "misses": values.misses,
+            "hit_ratio": round(values.hits / lookups, 4) if lookups else None,
+            "evictions": values.evictions,
+            "segment_bytes": self._segment.size,
+        }
@@ -0,0 +1,114 @@
+"""
+Бенчмарк конвейера process_transactions.py: ускорение от числа процессов.
+
+Генерирует (один раз, папка переиспользуется) --count транзакций по
+--per-file в файле и для каждого значения --workers запускает подсчёт в
+отдельном процессе. Для сравнения — baseline: прежний вариант (все файлы
+по очереди в один список, затем суммирование). Печатает время, транзакций
+в секунду, ускорение относительно --workers 1 и пиковую память основного
+процесса и воркеров.
+
+    python bench_pipeline.py --count 1000000 --per-file 1000 --workers 1 2 4 8
+"""
+import argparse
+import asyncio
+import glob
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+from generate_transactions import generate_batch
+from process_transactions import aggregate, workers_count
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def prepare(directory: str, count: int, per_file: int):
+    marker = os.path.join(directory, "dataset.json")
+    wanted = {"count": count, "per_file": per_file}
+    if os.path.exists(marker):
+        with open(marker) as f:
+            if json.load(f) == wanted:
+                return
+    os.makedirs(directory, exist_ok=True)
+    for filename in glob.glob(os.path.join(directory, "transactions_*.json")):
+        os.remove(filename)
+    print(f"[INFO] Генерация {count} транзакций в {directory}...")
+    asyncio.run(generate_batch(count, per_file, directory, verbose=False))
+    with open(marker, "w") as f:
+        json.dump(wanted, f)
+
+
+def baseline(pattern: str) -> int:
+    """Прежний process_transactions: всё в один список, потом суммы."""
+    all_transactions = []
+    for filename in glob.glob(pattern):
+        with open(filename, "r", encoding="utf-8") as f:
+            all_transactions.extend(json.load(f))
+    totals = {}
+    for t in all_transactions:
+        totals[t["category"]] = totals.get(t["category"], 0) + t["amount"]
+    return len(all_transactions)
+
+
+def run_once(directory: str, mode: str):
+    """Один замер в этом процессе; печатает JSON с результатом."""
+    pattern = os.path.join(directory, "transactions_*.json")
+    started = time.perf_counter()
+    if mode == "baseline":
+        count = baseline(pattern)
+    else:
+        totals, _ = asyncio.run(aggregate(pattern, int(mode)))
+        count = sum(n for _, n in totals.values())
+    elapsed = time.perf_counter() - started
+    print(json.dumps({
+        "elapsed": elapsed,
+        "transactions": count,
+        "rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "worker_rss_mb": resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024,
+    }))
+
+
+def measure(directory: str, mode: str) -> dict:
+    out = subprocess.run([sys.executable, os.path.join(HERE, "bench_pipeline.py"), "--run", mode,
+                          "--data", directory], capture_output=True, text=True, check=True).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк конвейера транзакций")
+    parser.add_argument("--count", type=int, default=1_000_000)
+    parser.add_argument("--per-file", type=int, default=1000)
+    parser.add_argument("--data", default=os.path.join(tempfile.gettempdir(), "lab8-transactions"))
+    cores = os.cpu_count() or 1
+    parser.add_argument("--workers", type=workers_count, nargs="+",
+                        default=sorted({1, cores} | {n for n in (2, 4, 8) if n < cores}))
+    parser.add_argument("--no-baseline", action="store_true")
+    parser.add_argument("--run", help=argparse.SUPPRESS)  # внутренний режим: один замер
+    args = parser.parse_args()
+
+    if args.run:
+        run_once(args.data, args.run)
+        return
+
+    prepare(args.data, args.count, args.per_file)
+    modes = ([] if args.no_baseline else ["baseline"]) + [str(n) for n in args.workers]
+    print(f"ядер: {cores}, транзакций: {args.count}, по {args.per_file} в файле")
+    print(f"{'mode':<11} {'time s':>8} {'tx/s':>10} {'speedup':>8} {'rss MB':>8} {'workers rss MB':>15}")
+    single = None
+    for mode in modes:
+        result = measure(args.data, mode)
+        if mode == "1":
+            single = result["elapsed"]
+        speedup = f"{single / result['elapsed']:.2f}x" if single and mode != "baseline" else "-"
+        name = mode if mode == "baseline" else f"workers={mode}"
+        print(f"{name:<11} {result['elapsed']:>8.2f} {result['transactions'] / result['elapsed']:>10.0f} "
+              f"{speedup:>8} {result['rss_mb']:>8.1f} {result['worker_rss_mb']:>15.1f}")
+
+
+if __name__ == "__main__":
+    main()
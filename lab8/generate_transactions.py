@@ -1,5 +1,7 @@
+import argparse
 import asyncio
 import json
+import os
 import random
 import time
 
@@ -14,8 +16,8 @@ async def generate_transaction():
         "amount": round(random.uniform(100, 5000), 2)
     }
 
-async def generate_batch(count: int):
-    """Генерация транзакций пачками по 10"""
+async def generate_batch(count: int, per_file: int = 10, directory: str = ".", verbose: bool = True):
+    """Генерация транзакций пачками по per_file (по умолчанию 10)"""
     batch = []
     file_index = 1
 
@@ -23,24 +25,32 @@ async def generate_batch(count: int):
         transaction = await generate_transaction()
         batch.append(transaction)
 
-        if len(batch) == 10:
-            filename = f"transactions_{file_index}.json"
+        if len(batch) == per_file:
+            filename = os.path.join(directory, f"transactions_{file_index}.json")
             with open(filename, "w", encoding="utf-8") as f:
                 json.dump(batch, f, ensure_ascii=False, indent=4)
 
-            print(f"[INFO] Сохранено 10 транзакций → {filename}")
+            if verbose:
+                print(f"[INFO] Сохранено {per_file} транзакций → {filename}")
 
             batch = []
             file_index += 1
 
     if batch:
-        filename = f"transactions_{file_index}.json"
+        filename = os.path.join(directory, f"transactions_{file_index}.json")
         with open(filename, "w", encoding="utf-8") as f:
             json.dump(batch, f, ensure_ascii=False, indent=4)
-        print(f"[INFO] Сохранены оставшиеся {len(batch)} транзакций → {filename}")
+        if verbose:
+            print(f"[INFO] Сохранены оставшиеся {len(batch)} транзакций → {filename}")
 
 async def main():
-    count = int(input("Введите количество транзакций: "))
-    await generate_batch(count)
-
-asyncio.run(main())
+    parser = argparse.ArgumentParser(description="Генерация файлов transactions_*.json")
+    parser.add_argument("count", type=int, nargs="?", help="количество транзакций (без него — спросить)")
+    parser.add_argument("--per-file", type=int, default=10)
+    parser.add_argument("--dir", default=".")
+    args = parser.parse_args()
+    count = args.count if args.count is not None else int(input("Введите количество транзакций: "))
+    await generate_batch(count, args.per_file, args.dir)
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,55 +1,147 @@
+"""
+Суммы транзакций по категориям — потоковый конвейер на все ядра.
+
+- Файлы transactions_*.json перебираются лениво (glob.iglob) и собираются в
+  пачки примерно по CHUNK_BYTES байт.
+- Пачку читает пул потоков (ввод-вывод), разбирает JSON и суммирует по
+  категориям пул процессов (--workers, по умолчанию — число ядер). Каждая
+  пачка даёт частичные итоги {категория: [сумма, число]}, которые
+  сливаются в общие по мере готовности.
+- В работе одновременно не больше 2 × workers пачек, поэтому память не
+  зависит от числа файлов: ни список всех транзакций, ни список всех
+  файлов не строится.
+
+    python process_transactions.py [--dir ПАПКА] [--workers N]
+
+--workers 0 — то же самое в одном процессе, без пулов.
+"""
+import argparse
 import asyncio
-import json
 import glob
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 
 LIMIT = 10000  # Лимит превышения по категории
+CHUNK_BYTES = 4 * 1024 * 1024  # байт файлов на одну задачу разбора
+IO_THREADS = 4
 
 
-async def read_file(filename: str):
-    """Асинхронное чтение одного файла с транзакциями."""
-    await asyncio.sleep(0)  # имитация асинхронной операции
-    with open(filename, "r", encoding="utf-8") as f:
-        return json.load(f)
+def read_chunk(filenames: list[str]) -> list[bytes]:
+    """Прочитать пачку файлов (в пуле потоков)."""
+    blobs = []
+    for filename in filenames:
+        with open(filename, "rb") as f:
+            blobs.append(f.read())
+    return blobs
 
 
-async def process_category_sums(transactions: list[dict]):
-    """Группировка транзакций по категориям и суммирование amount."""
-    category_totals: dict[str, float] = {}
-
+def process_category_sums(transactions: list[dict], totals: dict = None) -> dict:
+    """Группировка транзакций по категориям: {категория: [сумма amount, число]}."""
+    totals = {} if totals is None else totals
     for t in transactions:
-        category = t["category"]
-        amount = t["amount"]
-        category_totals[category] = category_totals.get(category, 0) + amount
-
-    return category_totals
+        entry = totals.get(t["category"])
+        if entry is None:
+            entry = totals[t["category"]] = [0.0, 0]
+        entry[0] += t["amount"]
+        entry[1] += 1
+    return totals
+
+
+def parse_chunk(blobs: list[bytes]) -> dict:
+    """Разобрать пачку файлов и посчитать частичные итоги (в пуле процессов)."""
+    totals = {}
+    for blob in blobs:
+        process_category_sums(json.loads(blob), totals)
+    return totals
+
+
+def merge(totals: dict, partial: dict):
+    for category, (amount, count) in partial.items():
+        entry = totals.setdefault(category, [0.0, 0])
+        entry[0] += amount
+        entry[1] += count
+
+
+def workers_count(value: str) -> int:
+    """Тип аргумента --workers: целое не меньше 0."""
+    workers = int(value)
+    if workers < 0:
+        raise argparse.ArgumentTypeError("должно быть не меньше 0")
+    return workers
+
+
+def chunks(pattern: str, chunk_bytes: int = CHUNK_BYTES):
+    """Имена файлов пачками примерно по chunk_bytes байт."""
+    chunk, size = [], 0
+    for filename in glob.iglob(pattern):
+        chunk.append(filename)
+        size += os.path.getsize(filename)
+        if size >= chunk_bytes:
+            yield chunk
+            chunk, size = [], 0
+    if chunk:
+        yield chunk
+
+
+async def aggregate(pattern: str, workers: int, chunk_bytes: int = CHUNK_BYTES) -> tuple[dict, int]:
+    """Итоги по всем файлам pattern и число прочитанных файлов."""
+    totals, files = {}, 0
+    if workers == 0:
+        for chunk in chunks(pattern, chunk_bytes):
+            merge(totals, parse_chunk(read_chunk(chunk)))
+            files += len(chunk)
+        return totals, files
+
+    loop = asyncio.get_running_loop()
+    slots = asyncio.Semaphore(2 * workers)  # пачек в работе: ограничивает память
+
+    async def run(chunk):
+        try:
+            blobs = await loop.run_in_executor(io_pool, read_chunk, chunk)
+            merge(totals, await loop.run_in_executor(cpu_pool, parse_chunk, blobs))
+        finally:
+            slots.release()
+
+    with ThreadPoolExecutor(IO_THREADS) as io_pool, ProcessPoolExecutor(workers) as cpu_pool:
+        tasks = set()
+        for chunk in chunks(pattern, chunk_bytes):
+            await slots.acquire()
+            files += len(chunk)
+            task = asyncio.create_task(run(chunk))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+        await asyncio.gather(*tasks)
+    return totals, files
 
 
 async def main():
+    parser = argparse.ArgumentParser(description="Суммы транзакций по категориям")
+    parser.add_argument("--dir", default=".", help="папка с transactions_*.json")
+    parser.add_argument("--workers", type=workers_count, default=os.cpu_count() or 1,
+                        help="процессов для разбора (0 — без пулов)")
+    args = parser.parse_args()
+
     print("[INFO] Чтение файлов с транзакциями...")
-    files = glob.glob("transactions_*.json")
+    started = time.perf_counter()
+    category_totals, files = await aggregate(os.path.join(args.dir, "transactions_*.json"), args.workers)
+    elapsed = time.perf_counter() - started
 
     if not files:
         print("[WARN] Не найдено ни одного файла transactions_*.json")
         return
-
-    all_transactions: list[dict] = []
-
-    # Асинхронно читаем все файлы (по очереди, но через await)
-    for filename in files:
-        data = await read_file(filename)
-        all_transactions.extend(data)
-        print(f"[INFO] Прочитан файл {filename}, транзакций: {len(data)}")
-
-    # Обрабатываем все транзакции
-    category_totals = await process_category_sums(all_transactions)
+    count = sum(n for _, n in category_totals.values())
+    print(f"[INFO] Прочитано файлов: {files}, транзакций: {count} за {elapsed:.2f} с "
+          f"(процессов: {args.workers})")
 
     print("\n[RESULT] Суммы по категориям:")
-    for category, total in category_totals.items():
+    for category, (total, _) in category_totals.items():
         print(f" - {category}: {total:.2f}")
 
     print(f"\n[ALERT] Категории с превышением лимита {LIMIT}:")
     has_alerts = False
-    for category, total in category_totals.items():
+    for category, (total, _) in category_totals.items():
         if total > LIMIT:
             has_alerts = True
             print(
@@ -0,0 +1,50 @@
+# test_process_transactions.py
+import asyncio
+import glob
+import json
+import os
+import sys
+
+import pytest
+
+import process_transactions
+from generate_transactions import generate_batch
+from process_transactions import aggregate
+
+
+def plain_sums(directory) -> dict:
+    """Итоги простым циклом — то, с чем сверяется конвейер."""
+    totals = {}
+    for filename in glob.glob(os.path.join(directory, "transactions_*.json")):
+        with open(filename, encoding="utf-8") as f:
+            for t in json.load(f):
+                entry = totals.setdefault(t["category"], [0.0, 0])
+                entry[0] += t["amount"]
+                entry[1] += 1
+    return totals
+
+
+@pytest.mark.parametrize("workers", [0, 2])
+@pytest.mark.parametrize("count", [0, 1, 95])
+def test_aggregate_matches_plain_sum(tmp_path, workers, count):
+    asyncio.run(generate_batch(count, 10, str(tmp_path), verbose=False))
+    pattern = os.path.join(tmp_path, "transactions_*.json")
+    # маленькие пачки — файлы расходятся по нескольким задачам
+    totals, files = asyncio.run(aggregate(pattern, workers, chunk_bytes=2048))
+
+    expected = plain_sums(tmp_path)
+    assert files == len(glob.glob(pattern)) == -(-count // 10)
+    assert totals.keys() == expected.keys()
+    for category, (amount, n) in expected.items():
+        assert totals[category][1] == n
+        assert totals[category][0] == pytest.approx(amount)
+    assert sum(n for _, n in totals.values()) == count
+
+
+@pytest.mark.parametrize("workers", ["-1", "x"])
+def test_rejects_bad_workers(monkeypatch, capsys, workers):
+    monkeypatch.setattr(sys, "argv", ["process_transactions.py", "--workers", workers])
+    with pytest.raises(SystemExit) as exc:
+        asyncio.run(process_transactions.main())
+    assert exc.value.code == 2
+    assert "--workers" in capsys.readouterr().err
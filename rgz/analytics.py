@@ -0,0 +1,147 @@
+# analytics.py
+"""
+Сводка расходов по пользователю и периоду (таблица spending_summary).
+
+Маршруты записи копят изменения в SummaryDelta и применяют их upsert-ом
+в той же транзакции, что и саму запись, — чтение сводки стоит O(периодов)
+вместо O(подписок). Пересчёт с нуля — один агрегирующий INSERT ... SELECT:
+
+    python analytics.py            # или flask --app app rebuild-summary
+"""
+from decimal import ROUND_HALF_UP, Decimal
+
+from sqlalchemy import delete, func, insert, select
+
+from billing import PERIODS
+from database import SessionLocal
+from models import SpendingSummary, Subscription
+
+CENT = Decimal("0.01")
+
+
+def to_cents(amount) -> Decimal:
+    """Округление как у Numeric(10, 2) в PostgreSQL (половина — от нуля)."""
+    return Decimal(amount).quantize(CENT, rounding=ROUND_HALF_UP)
+
+
+def periods_per_year(period: str) -> Decimal | None:
+    """Сколько списаний в год даёт период; None — период неизвестен."""
+    step = PERIODS.get((period or "").strip().lower())
+    if step is None:
+        return None
+    months, days = step
+    if months:
+        return Decimal(12) / months
+    return Decimal(52) * 7 / days
+
+
+class SummaryDelta:
+    """Накопитель изменений сводки: {(user_id, period): [сумма, количество]}."""
+
+    def __init__(self):
+        self.items = {}
+
+    def _shift(self, user_id: int, period: str, amount, count: int):
+        item = self.items.setdefault((user_id, period), [Decimal(0), 0])
+        item[0] += to_cents(amount) * count
+        item[1] += count
+
+    def add(self, user_id: int, period: str, amount):
+        self._shift(user_id, period, amount, 1)
+
+    def remove(self, user_id: int, period: str, amount):
+        self._shift(user_id, period, amount, -1)
+
+    def apply(self, db):
+        rows = [
+            {"user_id": user_id, "period": period, "total": total, "subscriptions": count}
+            for (user_id, period), (total, count) in self.items.items()
+            if total or count
+        ]
+        if rows:
+            upsert_summary(db, rows)
+        self.items.clear()
+
+
+def upsert_summary(db, rows: list[dict]):
+    """total += delta, subscriptions += delta; атомарно на уровне строки."""
+    dialect = db.get_bind().dialect.name
+    if dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    elif dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+    else:
+        for row in rows:
+            summary = db.get(SpendingSummary, (row["user_id"], row["period"]), with_for_update=True)
+            if summary is None:
+                db.add(SpendingSummary(**row))
+            else:
+                summary.total += row["total"]
+                summary.subscriptions += row["subscriptions"]
+        db.flush()
+        return
+
+    stmt = dialect_insert(SpendingSummary)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[SpendingSummary.user_id, SpendingSummary.period],
+        set_={
+            "total": SpendingSummary.total + stmt.excluded.total,
+            "subscriptions": SpendingSummary.subscriptions + stmt.excluded.subscriptions,
+        },
+    )
+    db.execute(stmt, rows)
+
+
+def rebuild_summary(db):
+    """Пересчитать сводку с нуля одним агрегирующим запросом."""
+    db.execute(delete(SpendingSummary))
+    db.execute(
+        insert(SpendingSummary).from_select(
+            ["user_id", "period", "total", "subscriptions"],
+            select(
+                Subscription.user_id,
+                Subscription.period,
+                func.sum(Subscription.amount),
+                func.count(Subscription.id),
+            )
+            .where(Subscription.active.is_(True))
+            .group_by(Subscription.user_id, Subscription.period),
+        )
+    )
+
+
+def user_spending(db, user_id: int) -> dict:
+    """Расходы пользователя по периодам и приведённые к месяцу/году (Decimal)."""
+    rows = db.execute(
+        select(SpendingSummary.period, SpendingSummary.total, SpendingSummary.subscriptions)
+        .where(SpendingSummary.user_id == user_id, SpendingSummary.subscriptions > 0)
+        .order_by(SpendingSummary.period)
+    ).all()
+
+    yearly = Decimal(0)
+    periods = []
+    for period, total, count in rows:
+        total = to_cents(total)
+        periods.append({"period": period, "total": total, "subscriptions": count})
+        per_year = periods_per_year(period)
+        if per_year is not None:
+            yearly += total * per_year
+
+    return {
+        "user_id": user_id,
+        "periods": periods,
+        "monthly_total": to_cents(yearly / 12),
+        "yearly_total": to_cents(yearly),
+    }
+
+
+def rebuild_summary_command():
+    """Пересчитать spending_summary из subscriptions."""
+    with SessionLocal() as db:
+        rebuild_summary(db)
+        db.commit()
+    print("Сводка расходов пересчитана.")
+
+
+if __name__ == "__main__":
+    rebuild_summary_command()
@@ -1,38 +1,49 @@
 # app.py
+import hashlib
 from datetime import datetime
 from decimal import Decimal, InvalidOperation
 
-from flask import Flask, request, jsonify, render_template
-
-from database import SessionLocal, engine, Base
-from models import User, Subscription, AuditLog
-
-app = Flask(__name__)
-
-@app.route("/")
+from flask import (
+    Blueprint, Flask, Response, current_app, jsonify, render_template, request,
+    stream_with_context,
+)
+from sqlalchemy import insert, select, update
+
+from analytics import SummaryDelta, rebuild_summary_command, user_spending
+from audit import AUDIT_MODE, AuditWriter, attach_to_sessions
+from audit_retention import audit_retention_command
+from cache import mark_user_changed, response_cache
+from database import (
+    ReadSessionLocal, SessionLocal, db_session, engine, pool_stats,
+    read_session, remove_sessions,
+)
+import metrics
+from models import Subscription, AuditLog
+from projection import ID_INDEX, fetch_page, row_encoder
+
+# маршруты регистрируются в create_app(); при импорте к БД не обращаемся —
+# схема готовится отдельно (python schema.py / flask init-db)
+bp = Blueprint("subscriptions", __name__)
+
+
+@bp.route("/")
 def index():
     return render_template("subscriptions.html")
 
 
-def init_db():
-    """Создание таблиц и тестового пользователя."""
-    Base.metadata.create_all(bind=engine)
-    db = SessionLocal()
-    try:
-        user = db.query(User).filter_by(id=1).first()
-        if not user:
-            user = User(id=1, name="Test User")
-            db.add(user)
-            db.commit()
-    finally:
-        db.close()
-
-
-init_db()
+# в режиме async аудит пишется фоновым потоком после коммита (см. audit.py)
+audit_writer = None
+if AUDIT_MODE == "async":
+    audit_writer = AuditWriter(engine)
+    attach_to_sessions(SessionLocal, audit_writer)
 
 
 def log_action(db, user_id: int, action: str, subscription_id: int | None):
     """Запись действия в таблицу аудита."""
+    mark_user_changed(db, user_id)
+    if audit_writer is not None:
+        db.info.setdefault("audit_pending", []).append((user_id, action, subscription_id))
+        return
     log = AuditLog(
         user_id=user_id,
         action=action,
@@ -41,25 +52,60 @@ def log_action(db, user_id: int, action: str, subscription_id: int | None):
     db.add(log)
 
 
-@app.route("/health", methods=["GET"])
+def log_actions(db, user_id: int, actions: list[tuple[str, int | None]]):
+    """Запись пачки действий в аудит одним multi-row INSERT."""
+    if not actions:
+        return
+    mark_user_changed(db, user_id)
+    if audit_writer is not None:
+        db.info.setdefault("audit_pending", []).extend(
+            (user_id, action, subscription_id) for action, subscription_id in actions
+        )
+        return
+    db.execute(insert(AuditLog), [
+        {"user_id": user_id, "action": action, "subscription_id": subscription_id}
+        for action, subscription_id in actions
+    ])
+
+
+@bp.route("/health", methods=["GET"])
 def health():
     return jsonify({"status": "ok"})
 
 
-@app.route("/subscriptions", methods=["POST"])
-def create_subscription():
+@bp.route("/audit/stats", methods=["GET"])
+def audit_stats():
+    """Счётчики очереди аудита: queued, flushed, dropped, pending."""
+    if audit_writer is None:
+        return jsonify({"mode": "strict"})
+    return jsonify(audit_writer.stats())
+
+
+@bp.route("/db/stats", methods=["GET"])
+def db_stats():
+    """Состояние пулов соединений: занятые, overflow, время ожидания выдачи."""
+    return jsonify(pool_stats())
+
+
+@bp.route("/metrics", methods=["GET"])
+def metrics_endpoint():
+    """Метрики запросов, SQL и пулов в формате Prometheus."""
+    return Response(metrics.render(), content_type=metrics.CONTENT_TYPE)
+
+
+def parse_date(raw, field: str):
+    """Дата в формате YYYY-MM-DD. Возвращает (date, error)."""
+    try:
+        return datetime.strptime(raw, "%Y-%m-%d").date(), None
+    except (ValueError, TypeError):
+        return None, f"{field} в формате YYYY-MM-DD"
+
+
+def validate_create(data: dict):
     """
-    Создание подписки:
-    {
-      "name": "Netflix",
-      "amount": 499.0,
-      "period": "monthly",
-      "start_date": "2025-01-01",
-      "next_charge_date": "2025-02-01"   # опционально
-    }
+    Проверка тела создания подписки.
+    Возвращает (values, error): values — поля для Subscription, error — текст ошибки.
     """
-    data = request.json or {}
-
     name = data.get("name")
     amount_raw = data.get("amount")
     period = data.get("period")
@@ -67,131 +113,584 @@ def create_subscription():
     next_charge_raw = data.get("next_charge_date")
 
     if not all([name, amount_raw, period, start_date_raw]):
-        return jsonify({"error": "name, amount, period, start_date обязательны"}), 400
+        return None, "name, amount, period, start_date обязательны"
 
     try:
         amount = Decimal(str(amount_raw))
     except (InvalidOperation, TypeError):
-        return jsonify({"error": "amount должен быть числом"}), 400
+        return None, "amount должен быть числом"
 
-    try:
-        start_date = datetime.strptime(start_date_raw, "%Y-%m-%d").date()  # Исправлено: добавляем .date()
-    except ValueError:
-        return jsonify({"error": "start_date в формате YYYY-MM-DD"}), 400
+    start_date, error = parse_date(start_date_raw, "start_date")
+    if error:
+        return None, error
 
     next_charge_date = None
     if next_charge_raw:
+        next_charge_date, error = parse_date(next_charge_raw, "next_charge_date")
+        if error:
+            return None, error
+
+    return {
+        "name": name,
+        "amount": amount,
+        "period": period,
+        "start_date": start_date,
+        "next_charge_date": next_charge_date,
+    }, None
+
+
+def validate_update(data: dict):
+    """
+    Проверка тела редактирования: amount, period, next_charge_date.
+    Возвращает (changes, error) — только переданные поля.
+    """
+    changes = {}
+
+    if "amount" in data:
         try:
-            next_charge_date = datetime.strptime(next_charge_raw, "%Y-%m-%d").date()  # Исправлено: добавляем .date()
-        except ValueError:
-            return jsonify({"error": "next_charge_date в формате YYYY-MM-DD"}), 400
+            changes["amount"] = Decimal(str(data["amount"]))
+        except (InvalidOperation, TypeError):
+            return None, "amount должен быть числом"
 
-    db = SessionLocal()
-    try:
-        user_id = 1  # один тестовый пользователь
-        sub = Subscription(
-            user_id=user_id,
-            name=name,
-            amount=amount,
-            period=period,
-            start_date=start_date,
-            next_charge_date=next_charge_date,
-            active=True
-        )
-        db.add(sub)
-        db.flush()  # получаем sub.id до коммита
+    if "period" in data:
+        changes["period"] = data["period"]
+
+    if "next_charge_date" in data:
+        raw = data["next_charge_date"]
+        if raw is None:
+            changes["next_charge_date"] = None
+        else:
+            changes["next_charge_date"], error = parse_date(raw, "next_charge_date")
+            if error:
+                return None, error
+
+    return changes, None
+
+
+@bp.route("/subscriptions", methods=["POST"])
+def create_subscription():
+    """
+    Создание подписки:
+    {
+      "name": "Netflix",
+      "amount": 499.0,
+      "period": "monthly",
+      "start_date": "2025-01-01",
+      "next_charge_date": "2025-02-01"   # опционально
+    }
+    """
+    user_id = 1  # один тестовый пользователь
+    body, status = create_for_user(db_session(), user_id, request.json or {})
+    return jsonify(body), status
+
+
+def create_for_user(db, user_id: int, data: dict) -> tuple[dict, int]:
+    """
+    Логика POST /subscriptions без привязки к Flask: (тело ответа, статус).
+    Используется и асинхронным приложением (asgi_app.py) через run_sync.
+    """
+    values, error = validate_create(data)
+    if error:
+        return {"error": error}, 400
+
+    sub = Subscription(user_id=user_id, active=True, **values)
+    db.add(sub)
+    db.flush()  # получаем sub.id до коммита
+
+    log_action(db, user_id=user_id, action="create", subscription_id=sub.id)
+
+    delta = SummaryDelta()
+    delta.add(user_id, sub.period, sub.amount)
+    delta.apply(db)
+
+    db.commit()
+    db.refresh(sub)
+    return sub.to_dict(), 201
 
-        log_action(db, user_id=user_id, action="create", subscription_id=sub.id)
 
-        db.commit()
-        db.refresh(sub)
-        return jsonify(sub.to_dict()), 201
+PAGE_SIZE_DEFAULT = 100
+PAGE_SIZE_MAX = 1000
+STREAM_BATCH_SIZE = 500
+
+
+def current_row_encoder():
+    """Кодировщик строк projection с настройками JSON текущего приложения."""
+    return row_encoder(current_app.json.ensure_ascii, current_app.json.sort_keys)
+
+
+def iter_active_subscriptions(user_id: int, batch_size: int = STREAM_BATCH_SIZE):
+    """
+    Обход всех активных подписок пользователя пачками по batch_size, уже
+    в виде JSON-строк. Каждая пачка — отдельный keyset-запрос без ORM,
+    поэтому память не растёт с количеством строк. Генератор дочитывается
+    уже после teardown запроса, поэтому у него собственная сессия.
+    """
+    encode_row = current_row_encoder()
+    db = ReadSessionLocal()
+    try:
+        after = 0
+        while True:
+            rows = fetch_page(db, user_id, after, batch_size)
+            if not rows:
+                break
+            after = rows[-1][ID_INDEX]
+            yield from map(encode_row, rows)
+            if len(rows) < batch_size:
+                break
     finally:
         db.close()
 
 
-@app.route("/subscriptions", methods=["GET"])
-def list_subscriptions():
-    """Просмотр всех активных подписок пользователя."""
-    db = SessionLocal()
+def stream_json_array(encoded_rows):
+    """Чанкованный JSON-массив: тот же формат, что и jsonify(list)."""
+    yield "["
+    first = True
+    for row in encoded_rows:
+        if not first:
+            yield ","
+        first = False
+        yield row
+    yield "]\n"
+
+
+def stream_ndjson(encoded_rows):
+    """Одна подписка — одна строка JSON."""
+    for row in encoded_rows:
+        yield row + "\n"
+
+
+def wants_ndjson(req) -> bool:
+    if req.args.get("format") == "ndjson":
+        return True
+    return req.accept_mimetypes.best == "application/x-ndjson"
+
+
+def parse_page_args(args):
+    """
+    Разбор limit/after из query-параметров. Возвращает (after, limit, error).
+    limit=None означает «без пагинации» (полная выгрузка потоком).
+    """
+    limit_raw = args.get("limit")
+    after_raw = args.get("after")
+    if limit_raw is None and after_raw is None:
+        return 0, None, None
+
+    try:
+        limit = int(limit_raw) if limit_raw is not None else PAGE_SIZE_DEFAULT
+    except ValueError:
+        limit = 0
+    if not 1 <= limit <= PAGE_SIZE_MAX:
+        return None, None, f"limit должен быть целым числом от 1 до {PAGE_SIZE_MAX}"
+
     try:
-        user_id = 1
-        subs = (
-            db.query(Subscription)
-            .filter_by(user_id=user_id, active=True)
-            .all()
+        after = int(after_raw) if after_raw is not None else 0
+    except ValueError:
+        after = -1
+    if after < 0:
+        return None, None, "after должен быть неотрицательным id"
+
+    return after, limit, None
+
+
+@bp.route("/subscriptions", methods=["GET"])
+def list_subscriptions():
+    """
+    Просмотр активных подписок пользователя.
+
+    Без параметров — полная выгрузка потоком (JSON-массив, либо NDJSON при
+    ?format=ndjson / Accept: application/x-ndjson).
+    С ?limit=N&after=ID — одна страница по id; курсор следующей страницы
+    приходит в заголовках X-Next-Cursor и Link. Страницы кэшируются
+    по (пользователь, версия, параметры) — см. cache.py.
+    Оба варианта отдаются с ETag (list_etag); на совпадающий If-None-Match
+    отвечаем 304, не обращаясь к БД.
+    """
+    user_id = 1
+    after, limit, error = parse_page_args(request.args)
+    if error:
+        return jsonify({"error": error}), 400
+
+    ndjson = wants_ndjson(request)
+    etag = list_etag(user_id, after, limit, ndjson)
+    if etag is not None and request.if_none_match.contains_weak(etag):
+        resp = Response(status=304)
+        resp.set_etag(etag)
+        return resp
+
+    if limit is None:
+        rows = iter_active_subscriptions(user_id)
+        if ndjson:
+            body, mimetype = stream_ndjson(rows), "application/x-ndjson"
+        else:
+            body, mimetype = stream_json_array(rows), "application/json"
+        resp = Response(stream_with_context(body), mimetype=mimetype)
+        if etag is not None:
+            resp.set_etag(etag)
+        return resp
+
+    entry = cached_page(read_session(), user_id, after, limit, ndjson, current_row_encoder())
+    resp = Response(entry["body"], mimetype=entry["mimetype"])
+    resp.set_etag(etag or entry["etag"])
+    next_cursor = entry["next_cursor"]
+    if next_cursor is not None:
+        resp.headers["X-Next-Cursor"] = str(next_cursor)
+        resp.headers["Link"] = (
+            f'<{request.path}?after={next_cursor}&limit={limit}>; rel="next"'
         )
-        return jsonify([s.to_dict() for s in subs])
-    finally:
-        db.close()
+    return resp.make_conditional(request)
+
+
+def page_variant(after, limit, ndjson: bool) -> str:
+    """Вариант запроса списка в ключе кэша и ETag."""
+    return f"{limit}:{after}:{'ndjson' if ndjson else 'json'}"
+
+
+def list_etag(user_id: int, after, limit, ndjson: bool, version: str | None = None) -> str | None:
+    """
+    ETag списка по версии пользователя из кэша ответов: версия читается до
+    запроса в БД, поэтому запись после неё даст уже другой ETag. None —
+    кэш выключен, версий нет: страница получит ETag по содержимому, а
+    полная выгрузка — без ETag.
+    """
+    if response_cache is None:
+        return None
+    if version is None:
+        version = response_cache.version(user_id)
+    return response_cache.etag(user_id, version, "list:" + page_variant(after, limit, ndjson))
+
+
+def cached_page(db, user_id: int, after: int, limit: int, ndjson: bool, encode_row) -> dict:
+    """Страница списка из кэша ответов либо из БД (с сохранением в кэш)."""
+    if response_cache is None:
+        return build_page(db, user_id, after, limit, ndjson, encode_row)
+
+    variant = page_variant(after, limit, ndjson)
+    # версию читаем до запроса в БД: запись после неё поднимет версию, и
+    # возможный устаревший результат ляжет под уже неиспользуемый ключ
+    version = response_cache.version(user_id)
+    entry = response_cache.get(user_id, version, variant)
+    if entry is None:
+        entry = build_page(db, user_id, after, limit, ndjson, encode_row)
+        response_cache.put(user_id, version, variant, entry)
+    return entry
+
+
+def build_page(db, user_id: int, after: int, limit: int, ndjson: bool, encode_row) -> dict:
+    """Страница списка в готовом к отдаче (и кэшированию) виде."""
+    # берём на одну строку больше, чтобы узнать, есть ли следующая страница
+    rows = fetch_page(db, user_id, after, limit + 1)
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    encoded = map(encode_row, rows)
+
+    if ndjson:
+        body, mimetype = "".join(stream_ndjson(encoded)), "application/x-ndjson"
+    else:
+        body, mimetype = "".join(stream_json_array(encoded)), "application/json"
+    return {
+        "body": body,
+        "mimetype": mimetype,
+        "etag": hashlib.sha1(body.encode(), usedforsecurity=False).hexdigest(),
+        "next_cursor": rows[-1][ID_INDEX] if has_more else None,
+    }
 
 
-@app.route("/subscriptions/<int:sub_id>", methods=["PUT"])
+@bp.route("/cache/stats", methods=["GET"])
+def cache_stats():
+    """Статистика кэша ответов: hits, misses, evictions, записи."""
+    if response_cache is None:
+        return jsonify({"enabled": False})
+    return jsonify({"enabled": True, **response_cache.stats()})
+
+
+BATCH_MAX_OPERATIONS = 5000
+# строк в одном INSERT ... VALUES: 7 полей × 500 — с запасом ниже лимита
+# параметров SQLite (32766)
+BATCH_INSERT_ROWS = 500
+
+
+def plan_batch(operations: list):
+    """
+    Предварительная проверка операций пакета теми же правилами, что и у
+    одиночных маршрутов. Возвращает (planned, errors): planned — список
+    (index, op, sub_id, payload), errors — {index: текст ошибки}.
+    """
+    planned = []
+    errors = {}
+    for index, item in enumerate(operations):
+        if not isinstance(item, dict):
+            errors[index] = "операция должна быть объектом"
+            continue
+
+        op = item.get("op")
+        if op not in ("create", "update", "delete"):
+            errors[index] = "op должен быть create, update или delete"
+            continue
+
+        sub_id = item.get("id")
+        if op != "create" and (not isinstance(sub_id, int) or isinstance(sub_id, bool)):
+            errors[index] = "id подписки обязателен"
+            continue
+
+        data = item.get("data") or {}
+        if op != "delete" and not isinstance(data, dict):
+            errors[index] = "data должен быть объектом"
+            continue
+
+        payload = None
+        if op == "create":
+            payload, error = validate_create(data)
+        elif op == "update":
+            payload, error = validate_update(data)
+        else:
+            error = None
+        if error:
+            errors[index] = error
+            continue
+
+        planned.append((index, op, sub_id, payload))
+    return planned, errors
+
+
+@bp.route("/subscriptions/batch", methods=["POST"])
+def batch_subscriptions():
+    """
+    Пакетное создание/редактирование/удаление подписок одной транзакцией:
+    {
+      "operations": [
+        {"op": "create", "data": {"name": "Netflix", "amount": 499, ...}},
+        {"op": "update", "id": 5, "data": {"amount": 599}},
+        {"op": "delete", "id": 7}
+      ]
+    }
+    Ответ: {"results": [{"index": 0, "status": 201, "body": {...}}, ...]},
+    где status и body — то, что вернул бы одиночный маршрут. Ошибочные
+    операции пропускаются, остальные записываются bulk-запросами.
+    """
+    user_id = 1
+    body, status = batch_for_user(db_session(), user_id, request.json or {})
+    return jsonify(body), status
+
+
+def batch_for_user(db, user_id: int, data: dict) -> tuple[dict, int]:
+    """Логика POST /subscriptions/batch без привязки к Flask: (тело ответа, статус)."""
+    operations = data.get("operations") if isinstance(data, dict) else None
+    if not isinstance(operations, list) or not operations:
+        return {"error": "operations должен быть непустым списком"}, 400
+    if len(operations) > BATCH_MAX_OPERATIONS:
+        return {"error": f"не больше {BATCH_MAX_OPERATIONS} операций за раз"}, 400
+
+    planned, errors = plan_batch(operations)
+    results = {
+        index: {"index": index, "status": 400, "body": {"error": error}}
+        for index, error in errors.items()
+    }
+
+    target_ids = {sub_id for _, op, sub_id, _ in planned if op != "create"}
+    # id -> (amount, period) живых подписок: нужны для 404 и для дельты сводки
+    alive = {}
+    if target_ids:
+        alive = {
+            sub_id: (amount, period)
+            for sub_id, amount, period in db.execute(
+                select(Subscription.id, Subscription.amount, Subscription.period)
+                .where(
+                    Subscription.id.in_(target_ids),
+                    Subscription.user_id == user_id,
+                    Subscription.active.is_(True),
+                )
+                .order_by(Subscription.id)  # один порядок блокировок — без взаимоблокировок
+                .with_for_update()
+            )
+        }
+
+    # проходим по порядку: удалённая раньше в пакете подписка уже не найдётся
+    creates = []
+    updates = {}
+    deletes = []
+    actions = []
+    delta = SummaryDelta()
+    for index, op, sub_id, payload in planned:
+        if op == "create":
+            creates.append((index, payload))
+            delta.add(user_id, payload["period"], payload["amount"])
+            continue
+        if sub_id not in alive:
+            results[index] = {
+                "index": index, "status": 404,
+                "body": {"error": "Подписка не найдена"},
+            }
+            continue
+        amount, period = alive[sub_id]
+        delta.remove(user_id, period, amount)
+        if op == "update":
+            updates.setdefault(sub_id, {}).update(payload)
+            amount = payload.get("amount", amount)
+            period = payload.get("period", period)
+            alive[sub_id] = (amount, period)
+            delta.add(user_id, period, amount)
+            actions.append(("update", sub_id))
+            results[index] = {"index": index, "status": 200, "sub_id": sub_id}
+        else:
+            del alive[sub_id]
+            deletes.append(sub_id)
+            actions.append(("delete", sub_id))
+            results[index] = {
+                "index": index, "status": 200, "body": {"status": "deleted"},
+            }
+
+    if creates:
+        # многострочный INSERT ... VALUES ... RETURNING: один запрос на пачку
+        # (executemany с sort_by_parameter_order на SQLite шёл построчно).
+        # id одного INSERT выдаются по порядку строк VALUES, а порядок строк
+        # RETURNING не гарантирован — поэтому сортируем по id.
+        rows = [{"user_id": user_id, "active": True, **values} for _, values in creates]
+        created = []
+        for start in range(0, len(rows), BATCH_INSERT_ROWS):
+            chunk = rows[start:start + BATCH_INSERT_ROWS]
+            created += sorted(
+                db.scalars(insert(Subscription).values(chunk).returning(Subscription)).all(),
+                key=lambda sub: sub.id,
+            )
+        for (index, _), sub in zip(creates, created):
+            results[index] = {"index": index, "status": 201, "body": sub.to_dict()}
+        actions.extend(("create", sub.id) for sub in created)
+
+    changed = [{"id": sub_id, **changes} for sub_id, changes in updates.items() if changes]
+    if changed:
+        db.execute(update(Subscription), changed)
+    if deletes:
+        db.execute(
+            update(Subscription)
+            .where(Subscription.id.in_(deletes))
+            .values(active=False)
+            .execution_options(synchronize_session=False)
+        )
+    log_actions(db, user_id, actions)
+    delta.apply(db)
+
+    if updates:
+        current = {
+            sub.id: sub.to_dict()
+            for sub in db.scalars(
+                select(Subscription)
+                .where(Subscription.id.in_(updates))
+                .execution_options(populate_existing=True)
+            )
+        }
+        for result in results.values():
+            sub_id = result.pop("sub_id", None)
+            if sub_id is not None:
+                result["body"] = current[sub_id]
+
+    db.commit()
+
+    return {"results": [results[index] for index in range(len(operations))]}, 200
+
+
+@bp.route("/subscriptions/<int:sub_id>", methods=["PUT"])
 def update_subscription(sub_id: int):
     """
     Редактирование подписки:
     можно обновить amount, period, next_charge_date.
     """
-    data = request.json or {}
-    db = SessionLocal()
-    try:
-        user_id = 1
-        sub = (
-            db.query(Subscription)
-            .filter_by(id=sub_id, user_id=user_id, active=True)
-            .first()
-        )
-        if not sub:
-            return jsonify({"error": "Подписка не найдена"}), 404
-
-        if "amount" in data:
-            try:
-                sub.amount = Decimal(str(data["amount"]))
-            except (InvalidOperation, TypeError):
-                return jsonify({"error": "amount должен быть числом"}), 400
-
-        if "period" in data:
-            sub.period = data["period"]
-
-        if "next_charge_date" in data:
-            raw = data["next_charge_date"]
-            if raw is None:
-                sub.next_charge_date = None
-            else:
-                try:
-                    sub.next_charge_date = datetime.strptime(raw, "%Y-%m-%d").date()  # Исправлено: добавляем .date()
-                except ValueError:
-                    return jsonify({"error": "next_charge_date в формате YYYY-MM-DD"}), 400
-
-        log_action(db, user_id=user_id, action="update", subscription_id=sub.id)
-
-        db.commit()
-        db.refresh(sub)
-        return jsonify(sub.to_dict())
-    finally:
-        db.close()
+    user_id = 1
+    body, status = update_for_user(db_session(), user_id, sub_id, request.json or {})
+    return jsonify(body), status
+
+
+def update_for_user(db, user_id: int, sub_id: int, data: dict) -> tuple[dict, int]:
+    """Логика PUT /subscriptions/<id> без привязки к Flask: (тело ответа, статус)."""
+    # строка блокируется до коммита: иначе параллельный PUT прочитает те же
+    # старые amount/period и сводка spending_summary разойдётся с подписками
+    sub = (
+        db.query(Subscription)
+        .filter_by(id=sub_id, user_id=user_id, active=True)
+        .with_for_update()
+        .populate_existing()
+        .first()
+    )
+    if not sub:
+        return {"error": "Подписка не найдена"}, 404
+
+    changes, error = validate_update(data)
+    if error:
+        return {"error": error}, 400
+
+    delta = SummaryDelta()
+    delta.remove(user_id, sub.period, sub.amount)
+    for field, value in changes.items():
+        setattr(sub, field, value)
+    delta.add(user_id, sub.period, sub.amount)
+    delta.apply(db)
+
+    log_action(db, user_id=user_id, action="update", subscription_id=sub.id)
+
+    db.commit()
+    db.refresh(sub)
+    return sub.to_dict(), 200
 
 
-@app.route("/subscriptions/<int:sub_id>", methods=["DELETE"])
+@bp.route("/subscriptions/<int:sub_id>", methods=["DELETE"])
 def delete_subscription(sub_id: int):
-    db = SessionLocal()
-    try:
-        user_id = 1
-        sub = (
-            db.query(Subscription)
-            .filter_by(id=sub_id, user_id=user_id, active=True)
-            .first()
-        )
-        if not sub:
-            return jsonify({"error": "Подписка не найдена"}), 404
+    user_id = 1
+    body, status = delete_for_user(db_session(), user_id, sub_id)
+    return jsonify(body), status
+
+
+def delete_for_user(db, user_id: int, sub_id: int) -> tuple[dict, int]:
+    """Логика DELETE /subscriptions/<id> без привязки к Flask: (тело ответа, статус)."""
+    sub = (
+        db.query(Subscription)
+        .filter_by(id=sub_id, user_id=user_id, active=True)
+        .with_for_update()  # как в update_for_user: вычитаем из сводки актуальные значения
+        .populate_existing()
+        .first()
+    )
+    if not sub:
+        return {"error": "Подписка не найдена"}, 404
 
-        sub.active = False
-        log_action(db, user_id=user_id, action="delete", subscription_id=sub.id)
+    sub.active = False
+    log_action(db, user_id=user_id, action="delete", subscription_id=sub.id)
 
-        db.commit()
-        return jsonify({"status": "deleted"})
-    finally:
-        db.close()
+    delta = SummaryDelta()
+    delta.remove(user_id, sub.period, sub.amount)
+    delta.apply(db)
+
+    db.commit()
+    return {"status": "deleted"}, 200
+
+
+@bp.route("/analytics/spending", methods=["GET"])
+def spending():
+    """
+    Расходы пользователя из сводки spending_summary: суммы по периодам и
+    приведённые monthly_total / yearly_total. Денежные поля — строки Decimal.
+    """
+    user_id = 1
+    return jsonify(user_spending(read_session(), user_id))
+
+
+def init_db_command():
+    """Создать/обновить схему БД, если она не совпадает с моделями."""
+    from schema import ensure_schema
+
+    print("Схема создана/обновлена." if ensure_schema() else "Схема актуальна.")
+
+
+def create_app() -> Flask:
+    """Фабрика приложения: только регистрация маршрутов, без обращений к БД."""
+    flask_app = Flask(__name__)
+    flask_app.register_blueprint(bp)
+    flask_app.teardown_appcontext(remove_sessions)
+    metrics.init_app(flask_app)
+    flask_app.cli.command("init-db")(init_db_command)
+    flask_app.cli.command("rebuild-summary")(rebuild_summary_command)
+    flask_app.cli.command("audit-retention")(audit_retention_command)
+    return flask_app
+
+
+app = create_app()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,279 @@
+# asgi_app.py
+"""
+Асинхронный (ASGI) режим API подписок: те же маршруты и JSON-контракты,
+что у app.py, но на Quart и асинхронном движке SQLAlchemy — запрос,
+ждущий БД или медленного клиента, не держит поток.
+
+Логика записи не дублируется: функции *_for_user из app.py выполняются
+через AsyncSession.run_sync (в greenlet поверх асинхронного соединения),
+а сессии создаются от того же класса, что SessionLocal, — поэтому хуки
+аудита и кэша работают так же, как в синхронном приложении. Блокирующие
+вызовы этих хуков (Redis, ожидание места в очереди аудита) и кэша ответов
+выполняются в пуле потоков (asyncio.to_thread), а не в цикле событий.
+
+    uvicorn asgi_app:app --port 5000     # или python asgi_app.py
+
+Драйверы: sqlite -> aiosqlite, postgresql -> asyncpg; ASYNC_DATABASE_URL
+и ASYNC_DATABASE_READ_URL позволяют задать URL явно.
+"""
+import asyncio
+import os
+
+from quart import Quart, Response, jsonify, render_template, request
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+import metrics
+from analytics import user_spending
+from app import (
+    STREAM_BATCH_SIZE, audit_writer, batch_for_user, build_page, create_for_user,
+    delete_for_user, list_etag, page_variant, parse_page_args, update_for_user,
+    wants_ndjson,
+)
+from cache import response_cache
+from database import (
+    AFTER_COMMIT_CALLS, DATABASE_READ_URL, DATABASE_URL, DB_MAX_OVERFLOW,
+    DB_POOL_PRE_PING, DB_POOL_RECYCLE, DB_POOL_SIZE, DB_POOL_TIMEOUT,
+    DEFER_AFTER_COMMIT, SessionLocal, pool_stats, run_after_commit_calls,
+)
+from projection import ID_INDEX, PAGE_STATEMENT, row_encoder
+
+ASYNC_DRIVERS = {"sqlite": "sqlite+aiosqlite", "postgresql": "postgresql+asyncpg"}
+
+
+def async_url(url: str) -> str:
+    """URL синхронного драйвера -> URL асинхронного (sqlite:// -> sqlite+aiosqlite://)."""
+    parsed = make_url(url)
+    driver = ASYNC_DRIVERS.get(parsed.get_backend_name())
+    if driver is None or parsed.drivername in ASYNC_DRIVERS.values():
+        return url
+    return parsed.set(drivername=driver).render_as_string(hide_password=False)
+
+
+def make_async_engine(url: str):
+    kwargs = {"pool_pre_ping": DB_POOL_PRE_PING, "pool_recycle": DB_POOL_RECYCLE}
+    parsed = make_url(url)
+    in_memory = parsed.get_backend_name() == "sqlite" and parsed.database in (None, "", ":memory:")
+    if not in_memory:
+        kwargs.update(pool_size=DB_POOL_SIZE, max_overflow=DB_MAX_OVERFLOW,
+                      pool_timeout=DB_POOL_TIMEOUT)
+    return create_async_engine(url, **kwargs)
+
+
+ASYNC_DATABASE_URL = os.getenv("ASYNC_DATABASE_URL") or async_url(DATABASE_URL)
+ASYNC_DATABASE_READ_URL = os.getenv("ASYNC_DATABASE_READ_URL") or (
+    async_url(DATABASE_READ_URL) if DATABASE_READ_URL else None
+)
+
+async_engine = make_async_engine(ASYNC_DATABASE_URL)
+async_read_engine = (
+    make_async_engine(ASYNC_DATABASE_READ_URL) if ASYNC_DATABASE_READ_URL else async_engine
+)
+
+# sync_session_class — класс сессий SessionLocal с навешанными хуками аудита/кэша;
+# коммит идёт в цикле событий, поэтому хуки откладываются (см. run_write)
+AsyncSessionLocal = async_sessionmaker(
+    async_engine, sync_session_class=SessionLocal.class_, info={DEFER_AFTER_COMMIT: True}
+)
+AsyncReadSessionLocal = async_sessionmaker(
+    async_read_engine, sync_session_class=SessionLocal.class_
+)
+
+app = Quart(__name__)
+USER_ID = 1  # один тестовый пользователь, как в app.py
+
+if metrics.METRICS_ENABLED:
+    metrics.instrument_engine(async_engine.sync_engine, "async")
+    if async_read_engine is not async_engine:
+        metrics.instrument_engine(async_read_engine.sync_engine, "async_replica")
+metrics.init_app(app, request)
+
+
+@app.after_serving
+async def dispose_engines():
+    await async_engine.dispose()
+    if async_read_engine is not async_engine:
+        await async_read_engine.dispose()
+
+
+async def request_data() -> dict:
+    return await request.get_json(silent=True) or {}
+
+
+async def run_write(fn, *args):
+    """fn(session, *args) в сессии записи, затем отложенные хуки коммита — в пуле потоков."""
+    async with AsyncSessionLocal() as session:
+        result = await session.run_sync(fn, *args)
+        calls = session.info.pop(AFTER_COMMIT_CALLS, None)
+    if calls:
+        await asyncio.to_thread(run_after_commit_calls, calls)
+    return result
+
+
+def current_row_encoder():
+    return row_encoder(app.json.ensure_ascii, app.json.sort_keys)
+
+
+@app.route("/")
+async def index():
+    return await render_template("subscriptions.html")
+
+
+@app.route("/health", methods=["GET"])
+async def health():
+    return jsonify({"status": "ok"})
+
+
+@app.route("/audit/stats", methods=["GET"])
+async def audit_stats():
+    if audit_writer is None:
+        return jsonify({"mode": "strict"})
+    return jsonify(audit_writer.stats())
+
+
+@app.route("/db/stats", methods=["GET"])
+async def db_stats():
+    stats = pool_stats()
+    stats["async"] = {"pool": async_engine.pool.status()}
+    return jsonify(stats)
+
+
+@app.route("/metrics", methods=["GET"])
+async def metrics_endpoint():
+    return Response(metrics.render(), content_type=metrics.CONTENT_TYPE)
+
+
+@app.route("/cache/stats", methods=["GET"])
+async def cache_stats():
+    if response_cache is None:
+        return jsonify({"enabled": False})
+    return jsonify({"enabled": True, **response_cache.stats()})
+
+
+@app.route("/subscriptions", methods=["POST"])
+async def create_subscription():
+    data = await request_data()
+    body, status = await run_write(create_for_user, USER_ID, data)
+    return jsonify(body), status
+
+
+async def iter_active_subscriptions(user_id: int, encode_row, batch_size: int = STREAM_BATCH_SIZE):
+    """Асинхронный аналог app.iter_active_subscriptions: keyset-пачки без ORM."""
+    async with AsyncReadSessionLocal() as session:
+        after = 0
+        while True:
+            result = await session.execute(
+                PAGE_STATEMENT, {"user_id": user_id, "after": after, "limit": batch_size}
+            )
+            rows = result.all()
+            if not rows:
+                break
+            after = rows[-1][ID_INDEX]
+            for row in rows:
+                yield encode_row(row)
+            if len(rows) < batch_size:
+                break
+
+
+async def stream_json_array(encoded_rows):
+    yield "["
+    first = True
+    async for row in encoded_rows:
+        if not first:
+            yield ","
+        first = False
+        yield row
+    yield "]\n"
+
+
+async def stream_ndjson(encoded_rows):
+    async for row in encoded_rows:
+        yield row + "\n"
+
+
+async def cached_page(user_id: int, version, after: int, limit: int, ndjson: bool, encode_row) -> dict:
+    """Как app.cached_page, но обращения к кэшу ответов — в пуле потоков."""
+    if response_cache is not None:
+        variant = page_variant(after, limit, ndjson)
+        entry = await asyncio.to_thread(response_cache.get, user_id, version, variant)
+        if entry is not None:
+            return entry
+    async with AsyncReadSessionLocal() as session:
+        entry = await session.run_sync(build_page, user_id, after, limit, ndjson, encode_row)
+    if response_cache is not None:
+        await asyncio.to_thread(response_cache.put, user_id, version, variant, entry)
+    return entry
+
+
+@app.route("/subscriptions", methods=["GET"])
+async def list_subscriptions():
+    """Тот же контракт, что у app.list_subscriptions (страницы, ETag, потоковая выгрузка)."""
+    after, limit, error = parse_page_args(request.args)
+    if error:
+        return jsonify({"error": error}), 400
+
+    ndjson = wants_ndjson(request)
+    # версия из общего backend (Redis) читается в потоке, не в цикле событий
+    version = None
+    if response_cache is not None:
+        version = await asyncio.to_thread(response_cache.version, USER_ID)
+    etag = list_etag(USER_ID, after, limit, ndjson, version)
+    if etag is not None and request.if_none_match.contains_weak(etag):
+        resp = Response("", status=304)
+        resp.set_etag(etag)
+        return resp
+
+    encode_row = current_row_encoder()
+    if limit is None:
+        rows = iter_active_subscriptions(USER_ID, encode_row)
+        if ndjson:
+            resp = Response(stream_ndjson(rows), mimetype="application/x-ndjson")
+        else:
+            resp = Response(stream_json_array(rows), mimetype="application/json")
+        if etag is not None:
+            resp.set_etag(etag)
+        return resp
+
+    entry = await cached_page(USER_ID, version, after, limit, ndjson, encode_row)
+    resp = Response(entry["body"], mimetype=entry["mimetype"])
+    resp.set_etag(etag or entry["etag"])
+    next_cursor = entry["next_cursor"]
+    if next_cursor is not None:
+        resp.headers["X-Next-Cursor"] = str(next_cursor)
+        resp.headers["Link"] = (
+            f'<{request.path}?after={next_cursor}&limit={limit}>; rel="next"'
+        )
+    return await resp.make_conditional(request)
+
+
+@app.route("/subscriptions/batch", methods=["POST"])
+async def batch_subscriptions():
+    data = await request_data()
+    body, status = await run_write(batch_for_user, USER_ID, data)
+    return jsonify(body), status
+
+
+@app.route("/subscriptions/<int:sub_id>", methods=["PUT"])
+async def update_subscription(sub_id: int):
+    data = await request_data()
+    body, status = await run_write(update_for_user, USER_ID, sub_id, data)
+    return jsonify(body), status
+
+
+@app.route("/subscriptions/<int:sub_id>", methods=["DELETE"])
+async def delete_subscription(sub_id: int):
+    body, status = await run_write(delete_for_user, USER_ID, sub_id)
+    return jsonify(body), status
+
+
+@app.route("/analytics/spending", methods=["GET"])
+async def spending():
+    async with AsyncReadSessionLocal() as session:
+        body = await session.run_sync(user_spending, USER_ID)
+    return jsonify(body)
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    uvicorn.run("asgi_app:app", port=5000)
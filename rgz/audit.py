@@ -0,0 +1,166 @@
+# audit.py
+"""
+Запись аудита в двух режимах (переменная окружения AUDIT_MODE):
+
+- strict — строка AuditLog пишется в транзакции запроса (как раньше);
+- async  — события после коммита попадают в ограниченную очередь, фоновый
+  поток сбрасывает их в audit_log multi-row INSERT-ом по размеру пачки
+  или по таймеру.
+"""
+import atexit
+import logging
+import os
+import queue
+import threading
+import time
+from datetime import datetime
+
+from sqlalchemy import event, insert
+
+from database import after_commit_call
+from models import AuditLog
+
+logger = logging.getLogger(__name__)
+
+AUDIT_MODE = os.getenv("AUDIT_MODE", "strict")
+AUDIT_QUEUE_SIZE = int(os.getenv("AUDIT_QUEUE_SIZE", "10000"))
+AUDIT_BATCH_SIZE = int(os.getenv("AUDIT_BATCH_SIZE", "500"))
+AUDIT_FLUSH_INTERVAL = float(os.getenv("AUDIT_FLUSH_INTERVAL", "1.0"))
+# сколько запрос готов ждать места в заполненной очереди, прежде чем событие будет отброшено
+AUDIT_PUT_TIMEOUT = float(os.getenv("AUDIT_PUT_TIMEOUT", "0.5"))
+
+
+class AuditWriter:
+    """Фоновый писатель аудита с ограниченной очередью и пакетной записью."""
+
+    def __init__(self, engine, maxsize=AUDIT_QUEUE_SIZE, batch_size=AUDIT_BATCH_SIZE,
+                 flush_interval=AUDIT_FLUSH_INTERVAL, put_timeout=AUDIT_PUT_TIMEOUT):
+        self.engine = engine
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.put_timeout = put_timeout
+
+        self._queue = queue.Queue(maxsize=maxsize)
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stopping = threading.Event()
+
+        self.queued = 0
+        self.flushed = 0
+        self.dropped = 0
+
+    def start(self):
+        with self._lock:
+            if self._thread is None:
+                self._stopping.clear()
+                self._thread = threading.Thread(
+                    target=self._run, name="audit-writer", daemon=True
+                )
+                self._thread.start()
+                atexit.register(self.stop)
+
+    def submit(self, user_id: int, action: str, subscription_id: int | None) -> bool:
+        """
+        Поставить событие в очередь. Если очередь полна, запрос ждёт
+        put_timeout секунд (backpressure), затем событие отбрасывается.
+        """
+        if self._thread is None:
+            self.start()
+        row = {
+            "user_id": user_id,
+            "action": action,
+            "subscription_id": subscription_id,
+            "created_at": datetime.utcnow(),
+        }
+        try:
+            self._queue.put(row, timeout=self.put_timeout)
+        except queue.Full:
+            with self._lock:
+                self.dropped += 1
+            return False
+        with self._lock:
+            self.queued += 1
+        return True
+
+    def _write(self, rows: list[dict]):
+        try:
+            with self.engine.begin() as conn:
+                conn.execute(insert(AuditLog), rows)
+        except Exception:
+            logger.exception("Не удалось записать %d событий аудита", len(rows))
+            with self._lock:
+                self.dropped += len(rows)
+            return
+        with self._lock:
+            self.flushed += len(rows)
+
+    def _drain(self, limit: int) -> list[dict]:
+        rows = []
+        while len(rows) < limit:
+            try:
+                rows.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return rows
+
+    def _run(self):
+        batch = []
+        deadline = time.monotonic() + self.flush_interval
+        while not self._stopping.is_set():
+            timeout = max(deadline - time.monotonic(), 0)
+            try:
+                batch.append(self._queue.get(timeout=timeout))
+                batch.extend(self._drain(self.batch_size - len(batch)))
+            except queue.Empty:
+                pass
+
+            if len(batch) >= self.batch_size or time.monotonic() >= deadline:
+                if batch:
+                    self._write(batch)
+                    batch = []
+                deadline = time.monotonic() + self.flush_interval
+
+        if batch:
+            self._write(batch)
+
+    def flush(self):
+        """Синхронно записать всё, что сейчас лежит в очереди."""
+        while True:
+            rows = self._drain(self.batch_size)
+            if not rows:
+                break
+            self._write(rows)
+
+    def stop(self, timeout: float = 5.0):
+        """Остановить поток и дописать остаток очереди."""
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            self._stopping.set()
+            thread.join(timeout)
+        self.flush()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "mode": "async",
+                "queued": self.queued,
+                "flushed": self.flushed,
+                "dropped": self.dropped,
+                "pending": self._queue.qsize(),
+            }
+
+
+def attach_to_sessions(session_factory, writer: AuditWriter):
+    """
+    События, накопленные в session.info["audit_pending"], уходят в очередь
+    только после успешного коммита; при откате они отбрасываются.
+    """
+    @event.listens_for(session_factory, "after_commit")
+    def _enqueue(session):
+        for user_id, action, subscription_id in session.info.pop("audit_pending", []):
+            after_commit_call(session, writer.submit, user_id, action, subscription_id)
+
+    @event.listens_for(session_factory, "after_rollback")
+    def _discard(session):
+        session.info.pop("audit_pending", None)
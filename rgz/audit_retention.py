@@ -0,0 +1,365 @@
+# audit_retention.py
+"""
+Секционирование audit_log по месяцам, архивация и удаление старых секций.
+
+Два режима (выбираются по состоянию БД):
+
+- declarative — PostgreSQL, audit_log создан как PARTITION BY RANGE (created_at):
+  секции audit_log_pYYYYMM создаются заранее на AUDIT_PARTITIONS_AHEAD
+  месяцев вперёд, строки вне секций попадают в audit_log_default и
+  переносятся в секцию при её создании; для прошлых месяцев, чьи строки
+  лежат в audit_log_default, секции создаются задним числом — так они
+  тоже доходят до архивации;
+- rotation — SQLite и несекционированный audit_log: строки закрытых месяцев
+  переносятся из audit_log в таблицы audit_log_pYYYYMM того же вида.
+  Несекционированный audit_log на PostgreSQL (созданный до секционирования)
+  переводит в declarative migrate_to_partitioned() — её вызывает
+  schema.ensure_schema; до миграции retention работает ротацией и пишет
+  предупреждение.
+
+Секции старше AUDIT_RETENTION_MONTHS полных месяцев потоково выгружаются в
+AUDIT_ARCHIVE_DIR/<секция>.ndjson.gz (рядом — манифест <секция>.json с
+диапазоном subscription_id) и удаляются. Файл архива пишется целиком до
+удаления секции, поэтому прерванный прогон можно просто повторить.
+
+subscription_history() ищет историю подписки в живых таблицах и архивах.
+
+    python audit_retention.py --keep-months 12     # или flask --app app audit-retention
+"""
+import argparse
+import gzip
+import json
+import logging
+import os
+import re
+from datetime import datetime
+
+from sqlalchemy import (
+    Column, DateTime, Index, Integer, MetaData, String, Table, delete, func,
+    insert, inspect, select, text,
+)
+from sqlalchemy.schema import AddConstraint
+
+from database import engine
+from models import AuditLog
+
+AUDIT_ARCHIVE_DIR = os.getenv("AUDIT_ARCHIVE_DIR", "audit_archive")
+AUDIT_RETENTION_MONTHS = int(os.getenv("AUDIT_RETENTION_MONTHS", "12"))
+AUDIT_PARTITIONS_AHEAD = int(os.getenv("AUDIT_PARTITIONS_AHEAD", "2"))
+AUDIT_ARCHIVE_BATCH = int(os.getenv("AUDIT_ARCHIVE_BATCH", "5000"))
+
+PARENT = AuditLog.__table__
+DEFAULT_PARTITION = f"{PARENT.name}_default"
+PARTITION_RE = re.compile(rf"^{PARENT.name}_p(\d{{4}})(\d{{2}})$")
+
+logger = logging.getLogger(__name__)
+
+
+def month_start(moment) -> datetime:
+    return datetime(moment.year, moment.month, 1)
+
+
+def shift_month(start: datetime, months: int) -> datetime:
+    index = start.year * 12 + start.month - 1 + months
+    return datetime(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(start: datetime) -> str:
+    return f"{PARENT.name}_p{start:%Y%m}"
+
+
+def partition_bounds(name: str) -> tuple[datetime, datetime] | None:
+    match = PARTITION_RE.match(name)
+    if match is None:
+        return None
+    start = datetime(int(match[1]), int(match[2]), 1)
+    return start, shift_month(start, 1)
+
+
+def period_table(name: str) -> Table:
+    """Таблица секции (или периода) с колонками audit_log, без внешних ключей."""
+    return Table(
+        name, MetaData(),
+        Column("id", Integer, primary_key=True, autoincrement=False),
+        Column("user_id", Integer, nullable=False),
+        Column("subscription_id", Integer, nullable=True),
+        Column("action", String, nullable=False),
+        Column("created_at", DateTime, nullable=False),
+        Index(f"ix_{name}_subscription_created", "subscription_id", "created_at"),
+    )
+
+
+def is_declarative(bind=engine) -> bool:
+    """audit_log — секционированная таблица PostgreSQL?"""
+    if bind.dialect.name != "postgresql":
+        return False
+    with bind.connect() as conn:
+        return bool(conn.scalar(
+            text("SELECT EXISTS (SELECT 1 FROM pg_partitioned_table "
+                 "WHERE partrelid = to_regclass(:name))"),
+            {"name": PARENT.name},
+        ))
+
+
+def list_partitions(bind=engine, declarative: bool | None = None) -> list[tuple[str, datetime, datetime]]:
+    """Месячные секции (или таблицы периодов) по возрастанию: (имя, начало, конец)."""
+    if declarative is None:
+        declarative = is_declarative(bind)
+    if declarative:
+        with bind.connect() as conn:
+            names = conn.scalars(text(
+                "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+                "WHERE i.inhparent = to_regclass(:name)"
+            ), {"name": PARENT.name}).all()
+    else:
+        names = inspect(bind).get_table_names()
+    partitions = []
+    for name in names:
+        bounds = partition_bounds(name)
+        if bounds is not None:
+            partitions.append((name, *bounds))
+    return sorted(partitions, key=lambda p: p[1])
+
+
+def create_partition(conn, start: datetime):
+    """
+    Создать секцию месяца. Строки этого месяца, уже попавшие в
+    audit_log_default, переносятся в неё в той же транзакции (иначе
+    ATTACH PARTITION откажет).
+    """
+    name, end = partition_name(start), shift_month(start, 1)
+    bounds = f"FROM ('{start:%Y-%m-%d}') TO ('{end:%Y-%m-%d}')"
+    conn.execute(text(
+        f"CREATE TABLE {name} (LIKE {PARENT.name} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)"
+    ))
+    conn.execute(text(
+        f"WITH moved AS (DELETE FROM {DEFAULT_PARTITION} "
+        f"WHERE created_at >= :start AND created_at < :end RETURNING *) "
+        f"INSERT INTO {name} SELECT * FROM moved"
+    ), {"start": start, "end": end})
+    conn.execute(text(f"ALTER TABLE {PARENT.name} ATTACH PARTITION {name} FOR VALUES {bounds}"))
+
+
+def ensure_partitions(bind=engine, today: datetime | None = None,
+                      ahead: int = AUDIT_PARTITIONS_AHEAD) -> list[str]:
+    """
+    Секция по умолчанию, секции с текущего месяца на ahead месяцев вперёд и
+    секции прошлых месяцев, строки которых лежат в audit_log_default.
+    """
+    current = month_start(today or datetime.utcnow())
+    existing = {name for name, _, _ in list_partitions(bind, declarative=True)}
+    created = []
+    with bind.begin() as conn:
+        conn.execute(text(
+            f"CREATE TABLE IF NOT EXISTS {DEFAULT_PARTITION} PARTITION OF {PARENT.name} DEFAULT"
+        ))
+        past = conn.scalars(text(
+            f"SELECT DISTINCT date_trunc('month', created_at) AS month FROM {DEFAULT_PARTITION} "
+            f"WHERE created_at < :current ORDER BY month"
+        ), {"current": current}).all()
+        months = list(past) + [shift_month(current, offset) for offset in range(ahead + 1)]
+        for start in months:
+            if partition_name(start) not in existing:
+                create_partition(conn, start)
+                existing.add(partition_name(start))
+                created.append(partition_name(start))
+    return created
+
+
+def migrate_to_partitioned(bind=engine, today: datetime | None = None) -> bool:
+    """
+    Перевести обычный audit_log PostgreSQL в секционированный: старая таблица
+    становится audit_log_default новой, затем ensure_partitions раскладывает
+    её строки по месячным секциям. False — переводить нечего.
+    """
+    if bind.dialect.name != "postgresql" or is_declarative(bind):
+        return False
+    inspector = inspect(bind)
+    if not inspector.has_table(PARENT.name):
+        return False
+    pk_name = inspector.get_pk_constraint(PARENT.name).get("name")
+    index_names = [index["name"] for index in inspector.get_indexes(PARENT.name)]
+    with bind.begin() as conn:
+        conn.execute(text(f"ALTER TABLE {PARENT.name} RENAME TO {DEFAULT_PARTITION}"))
+        # ключ и индексы родителя (PK — с created_at) создадутся на секции при ATTACH
+        if pk_name:
+            conn.execute(text(f'ALTER TABLE {DEFAULT_PARTITION} DROP CONSTRAINT "{pk_name}"'))
+        for name in index_names:
+            conn.execute(text(f'DROP INDEX "{name}"'))
+        # LIKE ... INCLUDING DEFAULTS — id продолжает брать значения из прежней последовательности
+        conn.execute(text(
+            f"CREATE TABLE {PARENT.name} (LIKE {DEFAULT_PARTITION} INCLUDING DEFAULTS) "
+            f"PARTITION BY RANGE (created_at)"
+        ))
+        conn.execute(text(f"ALTER TABLE {PARENT.name} ADD PRIMARY KEY (id, created_at)"))
+        for constraint in PARENT.foreign_key_constraints:
+            conn.execute(AddConstraint(constraint))
+        for index in PARENT.indexes:
+            index.create(conn)
+        conn.execute(text(f"ALTER TABLE {PARENT.name} ATTACH PARTITION {DEFAULT_PARTITION} DEFAULT"))
+    ensure_partitions(bind, today)
+    return True
+
+
+def rotate(bind=engine, today: datetime | None = None) -> list[str]:
+    """Режим rotation: перенести строки закрытых месяцев в таблицы audit_log_pYYYYMM."""
+    current = month_start(today or datetime.utcnow())
+    columns = [c.name for c in PARENT.columns]
+    touched = []
+    with bind.begin() as conn:
+        oldest = conn.scalar(select(func.min(PARENT.c.created_at)).where(PARENT.c.created_at < current))
+        if oldest is None:
+            return touched
+        start = month_start(oldest)
+        while start < current:
+            end = shift_month(start, 1)
+            in_month = (PARENT.c.created_at >= start) & (PARENT.c.created_at < end)
+            if conn.scalar(select(PARENT.c.id).where(in_month).limit(1)) is not None:
+                table = period_table(partition_name(start))
+                table.create(conn, checkfirst=True)
+                conn.execute(insert(table).from_select(
+                    columns, select(*(PARENT.c[c] for c in columns)).where(in_month)
+                ))
+                conn.execute(delete(PARENT).where(in_month))
+                touched.append(table.name)
+            start = end
+    return touched
+
+
+def row_to_dict(row) -> dict:
+    return {
+        "id": row.id,
+        "user_id": row.user_id,
+        "subscription_id": row.subscription_id,
+        "action": row.action,
+        "created_at": row.created_at.isoformat(),
+    }
+
+
+def _write_json(path: str, payload: dict):
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(payload, f, ensure_ascii=False)
+    os.replace(tmp, path)
+
+
+def archive_partition(bind, name: str, archive_dir: str = AUDIT_ARCHIVE_DIR) -> dict:
+    """Потоково выгрузить секцию в <archive_dir>/<name>.ndjson.gz; вернуть манифест."""
+    os.makedirs(archive_dir, exist_ok=True)
+    table = period_table(name)
+    start, end = partition_bounds(name)
+    path = os.path.join(archive_dir, f"{name}.ndjson.gz")
+    manifest = {
+        "table": name,
+        "file": os.path.basename(path),
+        "from": start.isoformat(),
+        "to": end.isoformat(),
+        "rows": 0,
+        "min_subscription_id": None,
+        "max_subscription_id": None,
+    }
+    with bind.connect() as conn, gzip.open(path + ".tmp", "wt", encoding="utf-8") as out:
+        result = conn.execution_options(yield_per=AUDIT_ARCHIVE_BATCH).execute(
+            select(table).order_by(table.c.id)
+        )
+        for row in result:
+            out.write(json.dumps(row_to_dict(row), ensure_ascii=False) + "\n")
+            manifest["rows"] += 1
+            if row.subscription_id is not None:
+                low, high = manifest["min_subscription_id"], manifest["max_subscription_id"]
+                manifest["min_subscription_id"] = row.subscription_id if low is None else min(low, row.subscription_id)
+                manifest["max_subscription_id"] = row.subscription_id if high is None else max(high, row.subscription_id)
+    os.replace(path + ".tmp", path)
+    _write_json(os.path.join(archive_dir, f"{name}.json"), manifest)
+    return manifest
+
+
+def drop_partition(bind, name: str, declarative: bool):
+    with bind.begin() as conn:
+        if declarative:
+            conn.execute(text(f"ALTER TABLE {PARENT.name} DETACH PARTITION {name}"))
+        conn.execute(text(f"DROP TABLE {name}"))
+
+
+def run_retention(bind=engine, archive_dir: str = AUDIT_ARCHIVE_DIR,
+                  keep_months: int = AUDIT_RETENTION_MONTHS,
+                  today: datetime | None = None) -> list[dict]:
+    """
+    Подготовить секции (или перенести закрытые месяцы), затем архивировать и
+    удалить секции, целиком лежащие раньше текущего месяца минус keep_months.
+    """
+    today = today or datetime.utcnow()
+    declarative = is_declarative(bind)
+    if declarative:
+        ensure_partitions(bind, today)
+    else:
+        if bind.dialect.name == "postgresql":
+            logger.warning("%s на PostgreSQL не секционирован — месяцы переносятся ротацией; "
+                           "перевод в секции: python schema.py", PARENT.name)
+        rotate(bind, today)
+
+    cutoff = shift_month(month_start(today), -keep_months)
+    archived = []
+    for name, _, end in list_partitions(bind, declarative):
+        if end <= cutoff:
+            archived.append(archive_partition(bind, name, archive_dir))
+            drop_partition(bind, name, declarative)
+    return archived
+
+
+def _archived_rows(archive_dir: str, subscription_id: int):
+    if not os.path.isdir(archive_dir):
+        return
+    for entry in sorted(os.listdir(archive_dir)):
+        if not (entry.endswith(".json") and partition_bounds(entry[:-5])):
+            continue
+        with open(os.path.join(archive_dir, entry), encoding="utf-8") as f:
+            manifest = json.load(f)
+        low, high = manifest["min_subscription_id"], manifest["max_subscription_id"]
+        if low is None or not low <= subscription_id <= high:
+            continue
+        with gzip.open(os.path.join(archive_dir, manifest["file"]), "rt", encoding="utf-8") as f:
+            for line in f:
+                row = json.loads(line)
+                if row["subscription_id"] == subscription_id:
+                    yield row
+
+
+def subscription_history(db, subscription_id: int, archive_dir: str = AUDIT_ARCHIVE_DIR) -> list[dict]:
+    """История подписки по времени: audit_log, таблицы периодов и архивы."""
+    bind = db.get_bind()
+    tables = [PARENT]
+    if not is_declarative(bind):
+        tables += [period_table(name) for name, _, _ in list_partitions(bind, declarative=False)]
+
+    history = {}
+    for table in tables:
+        rows = db.execute(
+            select(table.c.id, table.c.user_id, table.c.subscription_id,
+                   table.c.action, table.c.created_at)
+            .where(table.c.subscription_id == subscription_id)
+        )
+        for row in rows:
+            history[row.id] = row_to_dict(row)
+    # секция, выгруженная в архив, но не удалённая (прерванный прогон), не даёт дублей
+    for row in _archived_rows(archive_dir, subscription_id):
+        history.setdefault(row["id"], row)
+    return sorted(history.values(), key=lambda r: (r["created_at"], r["id"]))
+
+
+def audit_retention_command(archive_dir: str = AUDIT_ARCHIVE_DIR,
+                            keep_months: int = AUDIT_RETENTION_MONTHS):
+    """Архивировать и удалить секции audit_log старше AUDIT_RETENTION_MONTHS."""
+    archived = run_retention(archive_dir=archive_dir, keep_months=keep_months)
+    for manifest in archived:
+        print(f"{manifest['table']}: {manifest['rows']} строк -> {manifest['file']}")
+    if not archived:
+        print("Секций для архивации нет.")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Архивация и удаление старых секций audit_log")
+    parser.add_argument("--keep-months", type=int, default=AUDIT_RETENTION_MONTHS)
+    parser.add_argument("--archive-dir", default=AUDIT_ARCHIVE_DIR)
+    args = parser.parse_args()
+    audit_retention_command(args.archive_dir, args.keep_months)
@@ -0,0 +1,331 @@
+# bench_api.py
+"""
+Нагрузочный прогон всех маршрутов app.py с контролем регрессий.
+
+1. Заполняет БД (по умолчанию временная SQLite, либо --database-url)
+   заданным числом пользователей, подписок и строк аудита.
+2. Гоняет каждый маршрут через Flask test client (последовательно) и через
+   HTTP-генератор нагрузки с --concurrency потоками против werkzeug-сервера.
+3. Печатает req/s, p50/p95/p99 (мс) и число SQL-запросов на запрос.
+4. --save-baseline FILE сохраняет результат; --baseline FILE сравнивает
+   с сохранённым. Код 1 — если выросло число SQL на запрос или файла нет.
+   Рост p95 больше чем в --threshold раз (и больше чем на --slack-ms)
+   только печатается: baseline снят на другой машине, и миллисекунды с
+   CI-раннером несравнимы. --fail-on-latency делает его ошибкой — для
+   сравнения двух прогонов на одной машине.
+
+    python bench_api.py --users 100 --subscriptions 20000 --audit 50000
+    python bench_api.py --quick --no-http --save-baseline bench_baseline.json
+    python bench_api.py --quick --no-http --baseline bench_baseline.json --threshold 1.5
+    python bench_api.py --baseline before.json --fail-on-latency   # до и после на одной машине
+"""
+import argparse
+import itertools
+import json
+import logging
+import os
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+
+
+def percentile(samples: list[float], q: float) -> float:
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, round(q / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+class QueryCounter:
+    """Счётчик SQL-запросов по событию before_cursor_execute."""
+
+    def __init__(self, *engines):
+        from sqlalchemy import event
+
+        self.count = 0
+        self._lock = threading.Lock()
+        for eng in {id(e): e for e in engines}.values():
+            event.listen(eng, "before_cursor_execute", self._on_execute)
+
+    def _on_execute(self, *args):
+        with self._lock:
+            self.count += 1
+
+
+def seed(users: int, subscriptions: int, audit: int, spare: int):
+    """Пользователи, подписки (у пользователя 1 — не меньше половины) и аудит."""
+    from sqlalchemy import func, insert, select
+
+    from analytics import rebuild_summary
+    from database import SessionLocal
+    from models import AuditLog, Subscription, User
+
+    start = date(2025, 1, 1)
+    with SessionLocal() as db:
+        if users > 1:
+            db.execute(insert(User), [
+                {"id": uid, "name": f"User {uid}"} for uid in range(2, users + 1)
+            ])
+
+        def subscription(i, user_id):
+            return {
+                "user_id": user_id,
+                "name": f"bench-{i}",
+                "amount": Decimal(i % 100000) / 100,
+                "period": ("monthly", "yearly", "weekly")[i % 3],
+                "start_date": start + timedelta(days=i % 365),
+                "next_charge_date": start + timedelta(days=30 + i % 365),
+                "active": True,
+            }
+
+        batch = []
+        for i in range(subscriptions + spare):
+            user_id = 1 if i % 2 == 0 or i >= subscriptions else 2 + i % max(users - 1, 1)
+            batch.append(subscription(i, min(user_id, users)))
+            if len(batch) == 10000:
+                db.execute(insert(Subscription), batch)
+                batch = []
+        if batch:
+            db.execute(insert(Subscription), batch)
+
+        max_id = db.scalar(select(func.max(Subscription.id))) or 1
+        now = datetime.utcnow()
+        for offset in range(0, audit, 10000):
+            db.execute(insert(AuditLog), [
+                {"user_id": 1, "subscription_id": 1 + (i % max_id), "action": "update", "created_at": now}
+                for i in range(offset, min(offset + 10000, audit))
+            ])
+        rebuild_summary(db)
+        db.commit()
+
+        # последние spare подписок пользователя 1 расходуются сценарием DELETE
+        spare_ids = db.scalars(
+            select(Subscription.id).where(Subscription.user_id == 1)
+            .order_by(Subscription.id.desc()).limit(spare)
+        ).all()
+        update_ids = db.scalars(
+            select(Subscription.id).where(Subscription.user_id == 1)
+            .order_by(Subscription.id).limit(100)
+        ).all()
+    return list(spare_ids), list(update_ids)
+
+
+def scenarios(spare_ids: list[int], update_ids: list[int]) -> dict:
+    """Имя -> функция, возвращающая (method, path, json) для очередного запроса."""
+    to_delete = iter(spare_ids)
+    to_update = itertools.cycle(update_ids)
+    counter = itertools.count()
+    new_subscription = {
+        "name": "bench-new", "amount": "9.99", "period": "monthly", "start_date": "2025-01-01",
+    }
+    return {
+        "GET /health": lambda: ("GET", "/health", None),
+        "GET /": lambda: ("GET", "/", None),
+        "GET /subscriptions?limit=100": lambda: ("GET", "/subscriptions?limit=100", None),
+        "GET /subscriptions?limit=100&after=N": lambda: (
+            "GET", f"/subscriptions?limit=100&after={next(counter) % 1000}", None),
+        "GET /subscriptions (export)": lambda: ("GET", "/subscriptions", None),
+        "GET /subscriptions?format=ndjson": lambda: ("GET", "/subscriptions?format=ndjson", None),
+        "POST /subscriptions": lambda: ("POST", "/subscriptions", new_subscription),
+        "PUT /subscriptions/<id>": lambda: (
+            "PUT", f"/subscriptions/{next(to_update)}", {"amount": f"{next(counter) % 1000}.50"}),
+        "DELETE /subscriptions/<id>": lambda: ("DELETE", f"/subscriptions/{next(to_delete)}", None),
+        "POST /subscriptions/batch": lambda: ("POST", "/subscriptions/batch", {"operations": [
+            {"op": "create", "data": new_subscription} for _ in range(50)
+        ]}),
+        "GET /analytics/spending": lambda: ("GET", "/analytics/spending", None),
+        "GET /audit/stats": lambda: ("GET", "/audit/stats", None),
+        "GET /db/stats": lambda: ("GET", "/db/stats", None),
+        "GET /cache/stats": lambda: ("GET", "/cache/stats", None),
+    }
+
+
+def summarize(latencies: list[float], elapsed: float, queries: int, errors: int) -> dict:
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "rps": round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 3),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 3),
+        "queries_per_request": round(queries / len(latencies), 2),
+    }
+
+
+def run_test_client(app, counter, make_request, requests: int) -> dict:
+    client = app.test_client()
+    latencies, errors = [], 0
+    queries_before = counter.count
+    started = time.perf_counter()
+    for _ in range(requests):
+        method, path, body = make_request()
+        t0 = time.perf_counter()
+        resp = client.open(path, method=method, json=body)
+        resp.get_data()
+        latencies.append(time.perf_counter() - t0)
+        errors += resp.status_code >= 400
+    elapsed = time.perf_counter() - started
+    return summarize(latencies, elapsed, counter.count - queries_before, errors)
+
+
+def run_http(base_url: str, counter, make_request, requests: int, concurrency: int) -> dict:
+    lock = threading.Lock()
+    latencies, errors = [], [0]
+
+    def one(_):
+        with lock:
+            method, path, body = make_request()
+        data = json.dumps(body).encode() if body is not None else None
+        req = urllib.request.Request(base_url + path, data=data, method=method,
+                                     headers={"Content-Type": "application/json"})
+        t0 = time.perf_counter()
+        try:
+            with urllib.request.urlopen(req, timeout=30) as resp:
+                resp.read()
+        except Exception:
+            with lock:
+                errors[0] += 1
+        elapsed = time.perf_counter() - t0
+        with lock:
+            latencies.append(elapsed)
+
+    queries_before = counter.count
+    started = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as pool:
+        list(pool.map(one, range(requests)))
+    elapsed = time.perf_counter() - started
+    return summarize(latencies, elapsed, counter.count - queries_before, errors[0])
+
+
+def compare(results: dict, baseline: dict) -> list[str]:
+    """Список регрессий относительно baseline: запросу стало нужно больше SQL."""
+    regressions = []
+    for mode, endpoints in results.items():
+        for name, stats in endpoints.items():
+            base = baseline.get(mode, {}).get(name)
+            if base and stats["queries_per_request"] > base["queries_per_request"]:
+                regressions.append(
+                    f"{mode} {name}: SQL на запрос {stats['queries_per_request']} > {base['queries_per_request']}"
+                )
+    return regressions
+
+
+def slower(results: dict, baseline: dict, threshold: float, slack_ms: float = 0.0) -> list[str]:
+    """
+    Маршруты, у которых p95 вырос больше чем в threshold раз и больше чем
+    на slack_ms (на долях миллисекунды шум больше сигнала).
+    """
+    lines = []
+    for mode, endpoints in results.items():
+        for name, stats in endpoints.items():
+            base = baseline.get(mode, {}).get(name)
+            if not base or not base["p95_ms"]:
+                continue
+            if stats["p95_ms"] > base["p95_ms"] * threshold and stats["p95_ms"] - base["p95_ms"] > slack_ms:
+                lines.append(f"{mode} {name}: p95 {stats['p95_ms']} мс > {base['p95_ms']} мс × {threshold}")
+    return lines
+
+
+def print_table(mode: str, endpoints: dict):
+    print(f"\n[{mode}]")
+    print(f"{'endpoint':<40} {'req/s':>9} {'p50':>8} {'p95':>8} {'p99':>8} {'sql/req':>8} {'err':>4}")
+    for name, s in endpoints.items():
+        print(f"{name:<40} {s['rps']:>9} {s['p50_ms']:>8} {s['p95_ms']:>8} "
+              f"{s['p99_ms']:>8} {s['queries_per_request']:>8} {s['errors']:>4}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк маршрутов rgz API")
+    parser.add_argument("--database-url", help="по умолчанию — временная SQLite")
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--subscriptions", type=int, default=20000)
+    parser.add_argument("--audit", type=int, default=50000)
+    parser.add_argument("--requests", type=int, default=200, help="запросов на маршрут и режим")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--quick", action="store_true", help="малые объёмы для CI")
+    parser.add_argument("--no-http", action="store_true", help="только test client")
+    parser.add_argument("--output", help="сохранить результат в JSON")
+    parser.add_argument("--save-baseline", metavar="FILE")
+    parser.add_argument("--baseline", metavar="FILE")
+    parser.add_argument("--threshold", type=float, default=1.5)
+    parser.add_argument("--slack-ms", type=float, default=5.0,
+                        help="рост p95 меньше этого не считается регрессией")
+    parser.add_argument("--fail-on-latency", action="store_true",
+                        help="рост p95 — ошибка (baseline снят на этой же машине)")
+    args = parser.parse_args()
+    if args.quick:
+        args.users, args.subscriptions, args.audit, args.requests = 10, 2000, 5000, 50
+
+    os.environ["DATABASE_URL"] = args.database_url or (
+        "sqlite:///" + os.path.join(tempfile.mkdtemp(), "bench_api.db")
+    )
+
+    from werkzeug.serving import make_server
+
+    logging.getLogger("werkzeug").setLevel(logging.WARNING)
+
+    from app import app
+    from database import engine, read_engine
+    from schema import ensure_schema
+
+    ensure_schema()
+    modes = ["test_client"] + ([] if args.no_http else ["http"])
+    spare_ids, update_ids = seed(args.users, args.subscriptions, args.audit,
+                                 spare=args.requests * len(modes))
+    counter = QueryCounter(engine, read_engine)
+    plan = scenarios(spare_ids, update_ids)
+
+    results = {"test_client": {}}
+    for name, make_request in plan.items():
+        results["test_client"][name] = run_test_client(app, counter, make_request, args.requests)
+
+    if not args.no_http:
+        server = make_server("127.0.0.1", 0, app, threaded=True)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        base_url = f"http://127.0.0.1:{server.server_port}"
+        results["http"] = {}
+        try:
+            for name, make_request in plan.items():
+                results["http"][name] = run_http(
+                    base_url, counter, make_request, args.requests, args.concurrency
+                )
+        finally:
+            server.shutdown()
+
+    for mode, endpoints in results.items():
+        print_table(mode, endpoints)
+
+    for path in (args.output, args.save_baseline):
+        if path:
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump(results, f, ensure_ascii=False, indent=2)
+
+    if args.baseline:
+        if not os.path.exists(args.baseline):
+            # пропущенное сравнение выглядело бы как успешное — в CI это ошибка
+            print(f"\nBaseline {args.baseline} не найден; создайте его: "
+                  f"python bench_api.py --quick --no-http --save-baseline {args.baseline}")
+            sys.exit(1)
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline)
+        latency = slower(results, baseline, args.threshold, args.slack_ms)
+        if latency:
+            print(f"\nРост p95 (порог ×{args.threshold}, не ошибка без --fail-on-latency):")
+            for line in latency:
+                print(" - " + line)
+            if args.fail_on_latency:
+                regressions += latency
+        if regressions:
+            print("\nРегрессии:")
+            for line in regressions:
+                print(" - " + line)
+            sys.exit(1)
+        print(f"\nРегрессий относительно {args.baseline} нет.")
+
+if __name__ == "__main__":
+    main()
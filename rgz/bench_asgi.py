@@ -0,0 +1,99 @@
+# bench_asgi.py
+"""
+Сравнение синхронного (app.py на werkzeug, поток на запрос) и асинхронного
+(asgi_app.py на uvicorn) режимов под одинаковой HTTP-нагрузкой. Данные и
+генератор нагрузки — из bench_api.py; для каждого уровня --concurrency
+печатаются req/s и p95 обоих режимов.
+
+    python bench_asgi.py
+    python bench_asgi.py --concurrency 8 32 128 --requests 400
+"""
+import argparse
+import asyncio
+import logging
+import os
+import tempfile
+import threading
+import time
+
+from bench_api import QueryCounter, run_http, seed
+
+READ_SCENARIOS = {
+    "GET /subscriptions?limit=100": "/subscriptions?limit=100",
+    "GET /subscriptions (export)": "/subscriptions",
+    "GET /analytics/spending": "/analytics/spending",
+}
+
+
+def serve_sync(app):
+    from werkzeug.serving import make_server
+
+    server = make_server("127.0.0.1", 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{server.server_port}", server.shutdown
+
+
+def serve_async(app):
+    import socket
+
+    import uvicorn
+
+    sock = socket.socket()
+    sock.bind(("127.0.0.1", 0))
+    port = sock.getsockname()[1]
+    server = uvicorn.Server(uvicorn.Config(app, log_level="warning"))
+    thread = threading.Thread(target=lambda: asyncio.run(server.serve(sockets=[sock])), daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.05)
+
+    def stop():
+        server.should_exit = True
+        thread.join()
+
+    return f"http://127.0.0.1:{port}", stop
+
+
+def main():
+    parser = argparse.ArgumentParser(description="werkzeug (WSGI) против uvicorn (ASGI)")
+    parser.add_argument("--subscriptions", type=int, default=5000)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[8, 32, 128])
+    args = parser.parse_args()
+
+    os.environ.setdefault(
+        "DATABASE_URL", "sqlite:///" + os.path.join(tempfile.mkdtemp(), "bench_asgi.db")
+    )
+    # кэш страниц выключен, чтобы сравнивать работу с БД, а не попадания в кэш
+    os.environ.setdefault("CACHE_ENABLED", "0")
+    logging.getLogger("werkzeug").setLevel(logging.WARNING)
+
+    from app import app as sync_app
+    from asgi_app import app as async_app
+    from database import engine
+    from schema import ensure_schema
+
+    ensure_schema()
+    seed(users=10, subscriptions=args.subscriptions, audit=0, spare=0)
+    counter = QueryCounter(engine)
+
+    servers = {"wsgi": serve_sync(sync_app), "asgi": serve_async(async_app)}
+    try:
+        print(f"{'endpoint':<32} {'conc':>5} {'wsgi req/s':>11} {'asgi req/s':>11} "
+              f"{'wsgi p95':>9} {'asgi p95':>9}")
+        for name, path in READ_SCENARIOS.items():
+            for concurrency in args.concurrency:
+                row = {}
+                for mode, (base_url, _) in servers.items():
+                    row[mode] = run_http(base_url, counter, lambda: ("GET", path, None),
+                                         args.requests, concurrency)
+                print(f"{name:<32} {concurrency:>5} {row['wsgi']['rps']:>11} "
+                      f"{row['asgi']['rps']:>11} {row['wsgi']['p95_ms']:>9} "
+                      f"{row['asgi']['p95_ms']:>9}")
+    finally:
+        for _, stop in servers.values():
+            stop()
+
+
+if __name__ == "__main__":
+    main()
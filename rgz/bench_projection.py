@@ -0,0 +1,102 @@
+# bench_projection.py
+"""
+Микробенчмарк чтения списка: ORM (Subscription + to_dict + json) против
+projection (Core-колонки + готовый кодировщик строк). Данные — во временной
+SQLite-базе, по умолчанию 10k и 100k строк.
+
+    python bench_projection.py
+    python bench_projection.py --rows 10000 100000 --repeat 3
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+from datetime import date, timedelta
+from decimal import Decimal
+
+
+def seed(session_factory, rows: int):
+    from sqlalchemy import insert
+
+    from models import Subscription, User
+
+    with session_factory() as db:
+        db.add(User(id=1, name="Bench User"))
+        db.flush()
+        batch = []
+        start = date(2025, 1, 1)
+        for i in range(rows):
+            batch.append({
+                "user_id": 1,
+                "name": f"subscription-{i}",
+                "amount": Decimal(i % 100000) / 100,
+                "period": "monthly" if i % 3 else "yearly",
+                "start_date": start + timedelta(days=i % 365),
+                "next_charge_date": None if i % 7 == 0 else start + timedelta(days=30 + i % 365),
+                "active": True,
+            })
+            if len(batch) == 10000:
+                db.execute(insert(Subscription), batch)
+                batch = []
+        if batch:
+            db.execute(insert(Subscription), batch)
+        db.commit()
+
+
+def orm_path(db, limit: int) -> int:
+    from models import Subscription
+
+    subs = (
+        db.query(Subscription)
+        .filter(Subscription.user_id == 1, Subscription.active.is_(True), Subscription.id > 0)
+        .order_by(Subscription.id)
+        .limit(limit)
+        .all()
+    )
+    body = json.dumps([s.to_dict() for s in subs], sort_keys=True, separators=(",", ":"))
+    return len(body)
+
+
+def projection_path(db, limit: int) -> int:
+    from projection import fetch_page, row_encoder
+
+    encode_row = row_encoder(True, True)
+    body = "[" + ",".join(map(encode_row, fetch_page(db, 1, 0, limit))) + "]"
+    return len(body)
+
+
+def measure(session_factory, path, rows: int, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        with session_factory() as db:
+            started = time.perf_counter()
+            path(db, rows)
+            best = min(best, time.perf_counter() - started)
+    return rows / best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ORM vs projection: строк в секунду")
+    parser.add_argument("--rows", type=int, nargs="+", default=[10_000, 100_000])
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    path = os.path.join(tempfile.mkdtemp(), "bench.db")
+    os.environ["DATABASE_URL"] = f"sqlite:///{path}"
+
+    from database import Base, SessionLocal, engine
+    import models  # noqa: F401
+
+    Base.metadata.create_all(bind=engine)
+    seed(SessionLocal, max(args.rows))
+
+    print(f"{'rows':>8} {'orm rows/s':>14} {'projection rows/s':>18} {'speedup':>8}")
+    for rows in args.rows:
+        orm = measure(SessionLocal, orm_path, rows, args.repeat)
+        projection = measure(SessionLocal, projection_path, rows, args.repeat)
+        print(f"{rows:>8} {orm:>14,.0f} {projection:>18,.0f} {projection / orm:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
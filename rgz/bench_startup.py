@@ -0,0 +1,68 @@
+# bench_startup.py
+"""
+Замер холодного старта: время от начала импорта app до первого ответа
+/health в свежем процессе интерпретатора (и общее время жизни процесса).
+
+    python bench_startup.py --runs 10
+    python bench_startup.py --runs 10 --max-ms 800   # код 1 при превышении медианы
+"""
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+PROBE = """
+import json, time
+started = time.perf_counter()
+from app import app
+imported = time.perf_counter()
+resp = app.test_client().get("/health")
+assert resp.status_code == 200, resp.status_code
+done = time.perf_counter()
+print(json.dumps({"import_ms": (imported - started) * 1000,
+                  "first_response_ms": (done - started) * 1000}))
+"""
+
+
+def measure(runs: int) -> dict:
+    import_ms, first_ms, process_ms = [], [], []
+    for _ in range(runs):
+        started = time.perf_counter()
+        out = subprocess.run(
+            [sys.executable, "-c", PROBE],
+            cwd=Path(__file__).resolve().parent,
+            capture_output=True, text=True, check=True,
+        )
+        process_ms.append((time.perf_counter() - started) * 1000)
+        sample = json.loads(out.stdout.strip().splitlines()[-1])
+        import_ms.append(sample["import_ms"])
+        first_ms.append(sample["first_response_ms"])
+
+    return {
+        "runs": runs,
+        "import_ms_median": round(statistics.median(import_ms), 1),
+        "first_response_ms_median": round(statistics.median(first_ms), 1),
+        "first_response_ms_max": round(max(first_ms), 1),
+        "process_ms_median": round(statistics.median(process_ms), 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Время холодного старта app.py")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--max-ms", type=float,
+                        help="порог медианы import→первый ответ, мс")
+    args = parser.parse_args()
+
+    result = measure(args.runs)
+    print(json.dumps(result, ensure_ascii=False, indent=2))
+    if args.max_ms is not None and result["first_response_ms_median"] > args.max_ms:
+        print(f"Старт медленнее порога {args.max_ms} мс", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
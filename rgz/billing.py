@@ -0,0 +1,255 @@
+# billing.py
+"""
+Прогон списаний по next_charge_date.
+
+Подписки к списанию (active и next_charge_date <= дата прогона) читаются
+по индексу (active, next_charge_date) пачками по диапазонам id, поток
+строк идёт через yield_per. Для каждой пачки одним executemany-UPDATE
+сдвигается next_charge_date на период, одним INSERT пишутся строки аудита
+и в той же транзакции обновляется контрольная точка — после падения
+прогон продолжается с последней закоммиченной пачки. За один прогон
+подписка списывается не больше одного раза.
+
+Пространство id можно разбить на шарды и обрабатывать несколькими
+процессами:
+
+    python billing.py --date 2025-02-01 --workers 4
+    python billing.py --date 2025-02-01 --shard 2 --shards 4
+"""
+import argparse
+import calendar
+import logging
+from datetime import date, datetime, timedelta
+from multiprocessing import Pool
+
+from sqlalchemy import func, insert, select, update
+from sqlalchemy.exc import IntegrityError
+
+from cache import mark_user_changed
+from database import SessionLocal, engine
+from models import AuditLog, BillingCheckpoint, Subscription
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 1000
+YIELD_PER = 500
+
+# период подписки -> (месяцев, дней)
+PERIODS = {
+    "weekly": (0, 7),
+    "еженедельно": (0, 7),
+    "monthly": (1, 0),
+    "ежемесячно": (1, 0),
+    "quarterly": (3, 0),
+    "ежеквартально": (3, 0),
+    "yearly": (12, 0),
+    "annual": (12, 0),
+    "ежегодно": (12, 0),
+}
+
+
+def add_months(day: date, months: int, anchor_day: int | None = None) -> date:
+    """
+    Сдвиг даты на months месяцев с прижатием к концу месяца (31.01 -> 28.02).
+    anchor_day — день цикла списаний: дата, прижатая к концу короткого
+    месяца, в следующем снова получает его (28.02 -> 31.03, а не 28.03).
+    """
+    target = day.day
+    if anchor_day and anchor_day > day.day and day.day == calendar.monthrange(day.year, day.month)[1]:
+        target = anchor_day
+    month_index = day.month - 1 + months
+    year = day.year + month_index // 12
+    month = month_index % 12 + 1
+    last_day = calendar.monthrange(year, month)[1]
+    return date(year, month, min(target, last_day))
+
+
+def next_charge(day: date, period: str, anchor: date | None = None) -> date | None:
+    """
+    Следующая дата списания или None для неизвестного периода. anchor —
+    дата начала подписки: её день — день цикла для помесячных периодов.
+    """
+    step = PERIODS.get((period or "").strip().lower())
+    if step is None:
+        return None
+    months, days = step
+    return add_months(day, months, anchor.day if anchor else None) + timedelta(days=days)
+
+
+def shard_bounds(max_id: int, shards: int, shard: int) -> tuple[int, int]:
+    """Непрерывный диапазон id (lo, hi] для шарда shard из shards."""
+    span = -(-max_id // shards)  # округление вверх
+    return shard * span, min((shard + 1) * span, max_id)
+
+
+def due_filter(run_date: date):
+    return (
+        Subscription.active.is_(True),
+        Subscription.next_charge_date <= run_date,
+    )
+
+
+def get_or_create_checkpoint(db, run_key: str, max_id) -> BillingCheckpoint:
+    """Строка контрольной точки; гонку двух процессов за вставку разрешает PK."""
+    checkpoint = db.get(BillingCheckpoint, run_key)
+    if checkpoint is not None:
+        return checkpoint
+    try:
+        checkpoint = BillingCheckpoint(
+            run_key=run_key, last_id=0, max_id=max_id(), finished=False
+        )
+        db.add(checkpoint)
+        db.commit()
+    except IntegrityError:
+        db.rollback()
+        checkpoint = db.get(BillingCheckpoint, run_key)
+    return checkpoint
+
+
+def load_checkpoint(db, run_date: date, shard: int, shards: int) -> BillingCheckpoint:
+    """
+    Контрольная точка шарда. Граница max_id фиксируется один раз на весь
+    прогон (строка «{дата}:*/{шардов}»), чтобы диапазоны шардов, запущенных
+    в разное время или перезапущенных после падения, не пересекались.
+    """
+    def due_max_id():
+        return db.scalar(select(func.max(Subscription.id)).where(*due_filter(run_date))) or 0
+
+    prefix = run_date.isoformat()
+    header = get_or_create_checkpoint(db, f"{prefix}:*/{shards}", due_max_id)
+    return get_or_create_checkpoint(db, f"{prefix}:{shard}/{shards}", lambda: header.max_id)
+
+
+def process_chunk(db, run_date: date, after: int, hi: int, chunk_size: int):
+    """
+    Обработка одной пачки подписок с after < id <= hi.
+    Возвращает (последний обработанный id, списано, пропущено) или None, если пачка пуста.
+    """
+    rows = db.execute(
+        select(
+            Subscription.id,
+            Subscription.user_id,
+            Subscription.period,
+            Subscription.start_date,
+            Subscription.next_charge_date,
+        )
+        .where(*due_filter(run_date), Subscription.id > after, Subscription.id <= hi)
+        .order_by(Subscription.id)
+        .limit(chunk_size)
+        .execution_options(yield_per=YIELD_PER)
+    )
+
+    changes = []
+    audit_rows = []
+    last_id = None
+    skipped = 0
+    now = datetime.utcnow()
+    for partition in rows.partitions():
+        for sub_id, user_id, period, start_date, charge_date in partition:
+            last_id = sub_id
+            new_date = next_charge(charge_date, period, start_date)
+            if new_date is None:
+                skipped += 1
+                continue
+            changes.append({"id": sub_id, "next_charge_date": new_date})
+            audit_rows.append({
+                "user_id": user_id,
+                "subscription_id": sub_id,
+                "action": "charge",
+                "created_at": now,
+            })
+
+    if last_id is None:
+        return None
+
+    if changes:
+        db.execute(update(Subscription), changes)
+        db.execute(insert(AuditLog), audit_rows)
+        # кэш списков этих пользователей сбросится после коммита пачки
+        for user_id in {row["user_id"] for row in audit_rows}:
+            mark_user_changed(db, user_id)
+    return last_id, len(changes), skipped
+
+
+def run_billing(run_date: date, shard: int = 0, shards: int = 1,
+                chunk_size: int = CHUNK_SIZE) -> dict:
+    """Прогон одного шарда; можно безопасно перезапускать после падения."""
+    run_key = f"{run_date.isoformat()}:{shard}/{shards}"
+    charged = skipped = 0
+
+    # expire_on_commit=False: контрольная точка не перечитывается после каждого коммита
+    db = SessionLocal(expire_on_commit=False)
+    try:
+        checkpoint = load_checkpoint(db, run_date, shard, shards)
+        lo, hi = shard_bounds(checkpoint.max_id, shards, shard)
+        after = max(checkpoint.last_id, lo)
+
+        while not checkpoint.finished:
+            result = process_chunk(db, run_date, after, hi, chunk_size)
+            if result is None:
+                checkpoint.finished = True
+            else:
+                after, chunk_charged, chunk_skipped = result
+                checkpoint.last_id = after
+                charged += chunk_charged
+                skipped += chunk_skipped
+            # UPDATE подписок, аудит и контрольная точка — одна транзакция
+            db.commit()
+            logger.info("%s: обработано до id=%s", run_key, after)
+    finally:
+        db.close()
+
+    return {"run_key": run_key, "charged": charged, "skipped": skipped}
+
+
+def _init_worker():
+    # соединения пула родителя нельзя использовать в дочернем процессе
+    engine.dispose(close=False)
+
+
+def _run_shard(args):
+    return run_billing(*args)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Прогон списаний по подпискам")
+    parser.add_argument("--date", type=date.fromisoformat, default=date.today(),
+                        help="дата прогона, YYYY-MM-DD (по умолчанию сегодня)")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+    parser.add_argument("--workers", type=int, default=1,
+                        help="сколько процессов запустить (по шарду на процесс)")
+    parser.add_argument("--shard", type=int, help="обработать только этот шард")
+    parser.add_argument("--shards", type=int, help="общее число шардов для --shard")
+    args = parser.parse_args()
+    if args.shards is not None and args.shard is None:
+        parser.error("--shards задаётся только вместе с --shard")
+    if args.shard is not None:
+        if args.shards is None:
+            parser.error("--shard требует --shards")
+        if args.shards < 1:
+            parser.error("--shards должно быть больше 0")
+        if not 0 <= args.shard < args.shards:
+            parser.error(f"--shard должен быть от 0 до {args.shards - 1}")
+    if args.workers < 1:
+        parser.error("--workers должно быть больше 0")
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(message)s")
+    BillingCheckpoint.__table__.create(bind=engine, checkfirst=True)
+
+    if args.shard is not None:
+        jobs = [(args.date, args.shard, args.shards, args.chunk_size)]
+    else:
+        jobs = [(args.date, shard, args.workers, args.chunk_size) for shard in range(args.workers)]
+
+    if len(jobs) == 1:
+        results = [_run_shard(jobs[0])]
+    else:
+        with Pool(len(jobs), initializer=_init_worker) as pool:
+            results = pool.map(_run_shard, jobs)
+
+    for result in results:
+        print(f"{result['run_key']}: списано {result['charged']}, пропущено {result['skipped']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,247 @@
+# cache.py
+"""
+Read-through кэш ответов списка подписок.
+
+Ключ — (пользователь, версия пользователя, вариант запроса). Версию
+поднимает каждая запись (после коммита), поэтому старые ключи просто
+перестают запрашиваться и вытесняются LRU/TTL — сканировать ключи не нужно.
+
+Версия — "эпоха.счётчик". Эпоха — случайная строка, созданная вместе со
+счётчиком (в общем backend — в том же хэше subs:ver:<user>, через HSETNX).
+Если backend потерял или вытеснил ключ, счётчик начнётся с нуля, но уже в
+новой эпохе: старый ETag или страница кэша с новой версией не совпадут.
+
+Уровни:
+- LRUCache — ограниченный по числу записей кэш процесса с TTL;
+- общий backend (CACHE_URL): redis://... или memory:// — локальная замена
+  для тестов и одного процесса.
+
+Версии должны быть общими для всех воркеров: иначе воркер, не видевший
+записи, отдаёт старую страницу и отвечает 304 на старый ETag. Поэтому по
+умолчанию кэш включён только при заданном CACHE_URL; CACHE_ENABLED=1 без
+него — для сервера в один процесс.
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from sqlalchemy import event
+
+from database import SessionLocal, after_commit_call
+
+CACHE_URL = os.getenv("CACHE_URL")
+CACHE_ENABLED = os.getenv("CACHE_ENABLED", "1" if CACHE_URL else "0") == "1"
+CACHE_MAX_ENTRIES = int(os.getenv("CACHE_MAX_ENTRIES", "1024"))
+CACHE_TTL = float(os.getenv("CACHE_TTL", "30"))
+
+
+class LRUCache:
+    """Потокобезопасный LRU с TTL и счётчиками hits/misses/evictions."""
+
+    def __init__(self, maxsize: int = CACHE_MAX_ENTRIES, ttl: float = CACHE_TTL):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expired = 0
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                self.misses += 1
+                return None
+            expires_at, value = item
+            if expires_at < time.monotonic():
+                del self._data[key]
+                self.expired += 1
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._data),
+                "max_entries": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expired": self.expired,
+            }
+
+
+class MemoryBackend:
+    """Локальная замена общего хранилища (строки с TTL и счётчики)."""
+
+    def __init__(self):
+        self._data = {}
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> str | None:
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            expires_at, value = item
+            if expires_at is not None and expires_at < time.monotonic():
+                del self._data[key]
+                return None
+            return value
+
+    def set(self, key: str, value: str, ttl: float):
+        with self._lock:
+            self._data[key] = (time.monotonic() + ttl, value)
+
+    def hmget(self, key: str, *fields: str) -> list:
+        with self._lock:
+            _, fields_map = self._data.get(key, (None, {}))
+            return [fields_map.get(field) for field in fields]
+
+    def hsetnx(self, key: str, field: str, value: str):
+        with self._lock:
+            self._data.setdefault(key, (None, {}))[1].setdefault(field, value)
+
+    def hincrby(self, key: str, field: str) -> int:
+        with self._lock:
+            fields_map = self._data.setdefault(key, (None, {}))[1]
+            fields_map[field] = str(int(fields_map.get(field, "0")) + 1)
+            return int(fields_map[field])
+
+
+class RedisBackend:
+    """Общий backend на Redis; пакет redis нужен только при CACHE_URL=redis://..."""
+
+    def __init__(self, url: str):
+        import redis
+
+        self._redis = redis.Redis.from_url(url, decode_responses=True)
+
+    def get(self, key: str) -> str | None:
+        return self._redis.get(key)
+
+    def set(self, key: str, value: str, ttl: float):
+        self._redis.set(key, value, px=int(ttl * 1000))
+
+    def hmget(self, key: str, *fields: str) -> list:
+        return self._redis.hmget(key, fields)
+
+    def hsetnx(self, key: str, field: str, value: str):
+        self._redis.hsetnx(key, field, value)
+
+    def hincrby(self, key: str, field: str) -> int:
+        return self._redis.hincrby(key, field, 1)
+
+
+def new_epoch() -> str:
+    return os.urandom(8).hex()
+
+
+def make_backend(url: str | None):
+    if not url:
+        return None
+    if url.startswith("memory://"):
+        return MemoryBackend()
+    if url.startswith(("redis://", "rediss://")):
+        return RedisBackend(url)
+    raise ValueError(f"Неизвестный CACHE_URL: {url}")
+
+
+class ResponseCache:
+    """Кэш ответов с версионированием по пользователю."""
+
+    def __init__(self, local: LRUCache, shared=None, ttl: float = CACHE_TTL):
+        self.local = local
+        self.shared = shared
+        self.ttl = ttl
+        self._versions = {}
+        self._lock = threading.Lock()
+        self.shared_hits = 0
+        # версии процесса после перезапуска снова с нуля — старые ETag не должны совпасть
+        self._epoch = new_epoch()
+
+    def version(self, user_id: int) -> str:
+        if self.shared is not None:
+            key = f"subs:ver:{user_id}"
+            epoch, counter = self.shared.hmget(key, "epoch", "n")
+            if epoch is None:
+                # записей ещё не было или ключ потерян — начинаем новую эпоху
+                self.shared.hsetnx(key, "epoch", new_epoch())
+                epoch, counter = self.shared.hmget(key, "epoch", "n")
+            return f"{epoch}.{counter or 0}"
+        with self._lock:
+            return f"{self._epoch}.{self._versions.get(user_id, 0)}"
+
+    def bump(self, user_id: int):
+        if self.shared is not None:
+            self.shared.hincrby(f"subs:ver:{user_id}", "n")
+            return
+        with self._lock:
+            self._versions[user_id] = self._versions.get(user_id, 0) + 1
+
+    def etag(self, user_id: int, version: str, variant: str) -> str:
+        """Валидатор ответа по версии пользователя — без запроса в БД."""
+        raw = f"{user_id}:{version}:{variant}"
+        return hashlib.sha1(raw.encode(), usedforsecurity=False).hexdigest()
+
+    def get(self, user_id: int, version: str, variant: str) -> dict | None:
+        key = f"subs:{user_id}:{version}:{variant}"
+        entry = self.local.get(key)
+        if entry is None and self.shared is not None:
+            raw = self.shared.get(key)
+            if raw is not None:
+                entry = json.loads(raw)
+                self.local.set(key, entry)
+                with self._lock:
+                    self.shared_hits += 1
+        return entry
+
+    def put(self, user_id: int, version: str, variant: str, entry: dict):
+        key = f"subs:{user_id}:{version}:{variant}"
+        self.local.set(key, entry)
+        if self.shared is not None:
+            self.shared.set(key, json.dumps(entry), self.ttl)
+
+    def stats(self) -> dict:
+        stats = self.local.stats()
+        stats["shared_backend"] = type(self.shared).__name__ if self.shared else None
+        stats["shared_hits"] = self.shared_hits
+        return stats
+
+
+def mark_user_changed(db, user_id: int):
+    """Пометить пользователя: его версия поднимется после коммита сессии."""
+    db.info.setdefault("changed_users", set()).add(user_id)
+
+
+def attach_to_sessions(session_factory, cache: ResponseCache):
+    @event.listens_for(session_factory, "after_commit")
+    def _bump(session):
+        for user_id in session.info.pop("changed_users", ()):
+            after_commit_call(session, cache.bump, user_id)
+
+    @event.listens_for(session_factory, "after_rollback")
+    def _discard(session):
+        session.info.pop("changed_users", None)
+
+
+response_cache = None
+if CACHE_ENABLED:
+    response_cache = ResponseCache(LRUCache(), make_backend(CACHE_URL))
+    attach_to_sessions(SessionLocal, response_cache)
@@ -0,0 +1,21 @@
+# conftest.py
+import os
+import tempfile
+
+import pytest
+
+# локально тесты гоняются на SQLite; в CI DATABASE_URL указывает на PostgreSQL
+os.environ.setdefault(
+    "DATABASE_URL",
+    "sqlite:///" + os.path.join(tempfile.mkdtemp(), "rgz_test.db"),
+)
+# кэш ответов включается только с общим backend — в тестах его заменяет memory://
+os.environ.setdefault("CACHE_URL", "memory://")
+
+
+@pytest.fixture(scope="session", autouse=True)
+def schema():
+    """app.py не создаёт таблицы при импорте — готовим схему один раз на прогон."""
+    from schema import ensure_schema
+
+    ensure_schema()
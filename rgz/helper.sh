@@ -3,16 +3,11 @@ set -e
 
 VENV_DIR="venv"
 
-# 1. setup_database: создание таблиц PostgreSQL
+# 1. setup_database: разовая подготовка схемы PostgreSQL (до start_app)
 setup_database() {
   echo "[*] Создание таблиц в PostgreSQL..."
-  python - << 'EOF'
-from database import engine, Base
-import models  # важно, чтобы модели были импортированы
-
-Base.metadata.create_all(bind=engine)
-print("Таблицы созданы.")
-EOF
+  # создаёт таблицы только если отпечаток схемы в БД не совпадает с моделями
+  python schema.py
 }
 
 # 2. install_dependencies: venv + pip install
@@ -29,13 +24,17 @@ install_dependencies() {
   pip install -r requirements.txt
 }
 
-# 3. start_app: запуск Flask-приложения
+# 3. start_app: запуск Flask-приложения (APP_MODE=asgi — Quart + uvicorn)
 start_app() {
   # shellcheck disable=SC1091
   source "$VENV_DIR/bin/activate" 2>/dev/null || source "$VENV_DIR/Scripts/activate"
 
   echo "[*] Запуск приложения..."
-  python app.py &
+  if [ "${APP_MODE:-wsgi}" = "asgi" ]; then
+    python asgi_app.py &
+  else
+    python app.py &
+  fi
 
   APP_PID=$!
   echo "$APP_PID" > app.pid
@@ -63,6 +62,15 @@ run_tests() {
   pytest
 }
 
+# 6. run_billing: прогон списаний (аргументы передаются в billing.py)
+run_billing() {
+  # shellcheck disable=SC1091
+  source "$VENV_DIR/bin/activate" 2>/dev/null || source "$VENV_DIR/Scripts/activate"
+
+  echo "[*] Прогон списаний..."
+  python billing.py "$@"
+}
+
 case "$1" in
   setup_database)
     setup_database
@@ -79,8 +87,12 @@ case "$1" in
   run_tests)
     run_tests
     ;;
+  run_billing)
+    shift
+    run_billing "$@"
+    ;;
   *)
-    echo "Использование: $0 {setup_database|install_dependencies|start_app|stop_app|run_tests}"
+    echo "Использование: $0 {setup_database|install_dependencies|start_app|stop_app|run_tests|run_billing}"
     exit 1
     ;;
 esac
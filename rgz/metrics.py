@@ -0,0 +1,264 @@
+# metrics.py
+"""
+Встроенная инструментация: время запросов, число и время SQL-запросов,
+медленные запросы и состояние пулов — в текстовом формате Prometheus
+на /metrics.
+
+- before/after_request приложения засекают время и открывают счётчики
+  запроса (contextvar — работает и в потоках werkzeug, и в задачах Quart);
+- before/after_cursor_execute движков считают запросы и их время; запрос
+  дольше SLOW_QUERY_MS пишется в лог вместе с SQL;
+- гистограммы по шаблону маршрута (url_rule), а не по пути — число серий
+  ограничено числом маршрутов.
+
+Накладные расходы — пара perf_counter и одна короткая блокировка на
+наблюдение, поэтому METRICS_ENABLED=1 по умолчанию.
+"""
+import logging
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+
+from sqlalchemy import event
+
+from database import TimedQueuePool, engine, read_engine
+
+logger = logging.getLogger(__name__)
+
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "1") == "1"
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "200"))
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+
+def _labels(names: tuple, values: tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _number(value) -> str:
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    def __init__(self, name: str, help_text: str, labels: tuple = ()):
+        self.name, self.help, self.labels = name, help_text, labels
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values, amount=1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def value(self, *label_values):
+        with self._lock:
+            return self._values.get(label_values, 0)
+
+    def render(self) -> list[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        lines += [f"{self.name}{_labels(self.labels, key)} {_number(v)}" for key, v in items]
+        return lines
+
+
+class Histogram:
+    """Гистограмма с фиксированными границами; сумма и число — как в Prometheus."""
+
+    def __init__(self, name: str, help_text: str, labels: tuple = (), buckets=LATENCY_BUCKETS):
+        self.name, self.help, self.labels = name, help_text, labels
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *label_values):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def count(self, *label_values) -> int:
+        with self._lock:
+            series = self._series.get(label_values)
+            return series[2] if series else 0
+
+    def render(self) -> list[str]:
+        with self._lock:
+            items = sorted((key, (list(s[0]), s[1], s[2])) for key, s in self._series.items())
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for key, (counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket
+                le = 'le="+Inf"' if bound == float("inf") else f'le="{_number(bound)}"'
+                lines.append(f"{self.name}_bucket{_labels(self.labels, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labels, key)} {_number(total)}")
+            lines.append(f"{self.name}_count{_labels(self.labels, key)} {count}")
+        return lines
+
+
+class RequestStats:
+    """Счётчики одного HTTP-запроса."""
+    __slots__ = ("started", "queries", "sql_seconds")
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.sql_seconds = 0.0
+
+
+_current = ContextVar("rgz_request_stats", default=None)
+
+requests_total = Counter(
+    "rgz_http_requests_total", "HTTP-запросы по маршруту, методу и статусу",
+    ("route", "method", "status"),
+)
+request_duration = Histogram(
+    "rgz_http_request_duration_seconds", "Время обработки запроса", ("route", "method"),
+)
+request_queries = Histogram(
+    "rgz_http_request_queries", "SQL-запросов на HTTP-запрос", ("route",), QUERY_COUNT_BUCKETS,
+)
+request_sql_duration = Histogram(
+    "rgz_http_request_sql_seconds", "Суммарное время SQL на HTTP-запрос", ("route",),
+)
+queries_total = Counter("rgz_db_queries_total", "Все SQL-запросы", ("engine",))
+query_seconds_total = Counter("rgz_db_query_seconds_total", "Суммарное время SQL", ("engine",))
+slow_queries_total = Counter(
+    "rgz_db_slow_queries_total", "SQL-запросы дольше SLOW_QUERY_MS", ("engine",),
+)
+
+COLLECTORS = (
+    requests_total, request_duration, request_queries, request_sql_duration,
+    queries_total, query_seconds_total, slow_queries_total,
+)
+
+
+def instrument_engine(eng, name: str):
+    """Считать запросы движка; eng — Engine или AsyncEngine.sync_engine."""
+
+    @event.listens_for(eng, "before_cursor_execute")
+    def _start(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+    @event.listens_for(eng, "after_cursor_execute")
+    def _finish(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info["query_started"].pop()
+        queries_total.inc(name)
+        query_seconds_total.inc(name, amount=elapsed)
+        stats = _current.get()
+        if stats is not None:
+            stats.queries += 1
+            stats.sql_seconds += elapsed
+        if elapsed * 1000 >= SLOW_QUERY_MS:
+            slow_queries_total.inc(name)
+            logger.warning("Медленный запрос (%.1f мс, %s): %s", elapsed * 1000, name, statement)
+
+    @event.listens_for(eng, "handle_error")
+    def _failed(exception_context):
+        conn = exception_context.connection
+        if conn is not None and conn.info.get("query_started"):
+            conn.info["query_started"].pop()
+
+
+def route_label(req) -> str:
+    rule = req.url_rule
+    return rule.rule if rule is not None else "<unmatched>"
+
+
+def start_request():
+    _current.set(RequestStats())
+
+
+def finish_request(req, response):
+    """Отметить запрос. Для потоковых ответов время — до начала отдачи тела."""
+    stats = _current.get()
+    if stats is None:
+        return response
+    _current.set(None)
+    route = route_label(req)
+    request_duration.observe(time.perf_counter() - stats.started, route, req.method)
+    requests_total.inc(route, req.method, str(response.status_code))
+    request_queries.observe(stats.queries, route)
+    request_sql_duration.observe(stats.sql_seconds, route)
+    return response
+
+
+def pool_lines(engines: dict) -> list[str]:
+    """Текущие показатели пулов (снимаются при каждом запросе /metrics)."""
+    gauges = {
+        "rgz_db_pool_checked_out": ("Занятые соединения", lambda p: p.checkedout()),
+        "rgz_db_pool_overflow": ("Соединения сверх pool_size", lambda p: p.overflow()),
+        "rgz_db_pool_size": ("Размер пула", lambda p: p.size()),
+    }
+    pools = {name: eng.pool for name, eng in engines.items() if isinstance(eng.pool, TimedQueuePool)}
+    lines = []
+    for metric, (help_text, read) in gauges.items():
+        lines += [f"# HELP {metric} {help_text}", f"# TYPE {metric} gauge"]
+        lines += [f'{metric}{{engine="{name}"}} {read(pool)}' for name, pool in pools.items()]
+    lines += ["# HELP rgz_db_pool_wait_seconds_total Ожидание свободного соединения",
+              "# TYPE rgz_db_pool_wait_seconds_total counter"]
+    lines += [f'rgz_db_pool_wait_seconds_total{{engine="{name}"}} {_number(pool.wait_total)}'
+              for name, pool in pools.items()]
+    return lines
+
+
+def render(engines: dict | None = None) -> str:
+    """Все метрики в текстовом формате Prometheus."""
+    if engines is None:
+        engines = {"primary": engine, "replica": read_engine}
+    lines = []
+    for collector in COLLECTORS:
+        lines += collector.render()
+    lines += pool_lines(engines)
+    return "\n".join(lines) + "\n"
+
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def init_app(app, request_proxy=None):
+    """
+    Повесить хуки замера на приложение. Для Quart передаётся quart.request:
+    хуки там регистрируются корутинами, иначе Quart выполнил бы их в пуле
+    потоков и contextvar не дошёл бы до обработчика.
+    """
+    if not METRICS_ENABLED:
+        return
+    if request_proxy is None:
+        from flask import request as request_proxy
+
+    if hasattr(app, "ensure_async"):
+        async def before():
+            start_request()
+
+        async def after(response):
+            return finish_request(request_proxy, response)
+    else:
+        def before():
+            start_request()
+
+        def after(response):
+            return finish_request(request_proxy, response)
+
+    app.before_request(before)
+    app.after_request(after)
+
+
+if METRICS_ENABLED:
+    instrument_engine(engine, "primary")
+    if read_engine is not engine:
+        instrument_engine(read_engine, "replica")
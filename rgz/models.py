@@ -4,8 +4,9 @@ from decimal import Decimal
 
 from sqlalchemy import (
     Column, Integer, String, Numeric, Date, Boolean,
-    ForeignKey, DateTime
+    ForeignKey, DateTime, Index, PrimaryKeyConstraint
 )
+from sqlalchemy.ext.compiler import compiles
 from sqlalchemy.orm import relationship
 
 from database import Base
@@ -37,6 +38,13 @@ class Subscription(Base):
     user = relationship("User", back_populates="subscriptions")
     audit_logs = relationship("AuditLog", back_populates="subscription")
 
+    __table_args__ = (
+        # keyset-пагинация списка: WHERE user_id=? AND active AND id > ? ORDER BY id
+        Index("ix_subscriptions_user_active_id", "user_id", "active", "id"),
+        # поиск подписок к списанию в billing.py
+        Index("ix_subscriptions_active_next_charge", "active", "next_charge_date"),
+    )
+
     def to_dict(self):
         return {
             "id": self.id,
@@ -54,6 +62,11 @@ class Subscription(Base):
 
 
 class AuditLog(Base):
+    """
+    Журнал действий. На PostgreSQL таблица секционирована по месяцам
+    (PARTITION BY RANGE (created_at), секции ведёт audit_retention.py);
+    на SQLite закрытые месяцы переносятся в таблицы audit_log_pYYYYMM.
+    """
     __tablename__ = "audit_log"
 
     id = Column(Integer, primary_key=True)
@@ -64,3 +77,44 @@ class AuditLog(Base):
 
     user = relationship("User", back_populates="audit_logs")
     subscription = relationship("Subscription", back_populates="audit_logs")
+
+    __table_args__ = (
+        # история подписки и выборки по времени
+        Index("ix_audit_log_subscription_created", "subscription_id", "created_at"),
+        Index("ix_audit_log_created_at", "created_at"),
+        {"postgresql_partition_by": "RANGE (created_at)", "info": {"partition_key": "created_at"}},
+    )
+
+
+@compiles(PrimaryKeyConstraint, "postgresql")
+def _partitioned_primary_key(constraint, compiler, **kw):
+    """В секционированной таблице PostgreSQL ключ секционирования обязан входить в PK."""
+    sql = compiler.visit_primary_key_constraint(constraint, **kw)
+    key = constraint.table.info.get("partition_key")
+    if key and key not in constraint.columns:
+        sql = sql[:-1] + f", {key})"
+    return sql
+
+
+class BillingCheckpoint(Base):
+    """Прогресс прогона списаний по шарду: пишется в одной транзакции с UPDATE."""
+    __tablename__ = "billing_checkpoints"
+
+    run_key = Column(String, primary_key=True)  # дата прогона + номер шарда
+    last_id = Column(Integer, nullable=False, default=0)
+    max_id = Column(Integer, nullable=False)
+    finished = Column(Boolean, nullable=False, default=False)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
+
+
+class SpendingSummary(Base):
+    """
+    Сводка расходов: сумма amount и число активных подписок по (user_id, period).
+    Поддерживается инкрементально маршрутами записи (analytics.SummaryDelta).
+    """
+    __tablename__ = "spending_summary"
+
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    period = Column(String, primary_key=True)
+    total = Column(Numeric(14, 2), nullable=False, default=0)
+    subscriptions = Column(Integer, nullable=False, default=0)
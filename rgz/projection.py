@@ -0,0 +1,102 @@
+# projection.py
+"""
+Чтение списка подписок без ORM.
+
+Вместо загрузки объектов Subscription и Subscription.to_dict() выбираем
+нужные колонки через SQLAlchemy Core одним заранее собранным запросом
+(параметры — bindparam, поэтому скомпилированный SQL берётся из кэша
+движка) и сериализуем строку сразу в JSON по заранее вычисленному списку
+«колонка -> кодировщик». Результат побайтно совпадает с jsonify(to_dict()).
+"""
+import json
+import math
+from functools import lru_cache
+from json.encoder import encode_basestring, encode_basestring_ascii
+
+from sqlalchemy import Integer, bindparam, select
+
+from models import Subscription
+
+_c = Subscription.__table__.c
+
+
+def _int(value) -> str:
+    return str(value)
+
+
+def _bool(value) -> str:
+    return "true" if value else "false"
+
+
+def _amount(value) -> str:
+    # как в to_dict: float(Decimal); float.__repr__ — то же, что даёт json
+    number = float(value)
+    return repr(number) if math.isfinite(number) else json.dumps(number)
+
+
+def _date(value) -> str:
+    return '"' + value.isoformat() + '"'
+
+
+# ключ to_dict -> (колонка, кодировщик значения без None)
+FIELDS = {
+    "id": (_c.id, _int),
+    "user_id": (_c.user_id, _int),
+    "name": (_c.name, None),
+    "amount": (_c.amount, _amount),
+    "period": (_c.period, None),
+    "start_date": (_c.start_date, _date),
+    "next_charge_date": (_c.next_charge_date, _date),
+    "active": (_c.active, _bool),
+}
+
+# порядок колонок в SELECT фиксирован; id нужен для курсора
+KEYS = list(FIELDS)
+ID_INDEX = KEYS.index("id")
+
+PAGE_STATEMENT = (
+    select(*(column for column, _ in FIELDS.values()))
+    .where(
+        _c.user_id == bindparam("user_id"),
+        _c.active.is_(True),
+        _c.id > bindparam("after"),
+    )
+    .order_by(_c.id)
+    .limit(bindparam("limit", type_=Integer))
+)
+
+
+def fetch_page(db, user_id: int, after: int, limit: int):
+    """Кортежи колонок в порядке KEYS для активных подписок с id > after."""
+    return db.execute(
+        PAGE_STATEMENT, {"user_id": user_id, "after": after, "limit": limit}
+    ).all()
+
+
+def _nullable(encode):
+    def encode_or_null(value):
+        return "null" if value is None else encode(value)
+    return encode_or_null
+
+
+@lru_cache(maxsize=None)
+def row_encoder(ensure_ascii: bool = True, sort_keys: bool = True):
+    """
+    Функция «строка -> JSON-объект» с теми же настройками, что у jsonify
+    (компактные разделители, ensure_ascii, sort_keys).
+    """
+    encode_str = encode_basestring_ascii if ensure_ascii else encode_basestring
+    order = sorted(range(len(KEYS)), key=KEYS.__getitem__) if sort_keys else range(len(KEYS))
+    plan = [
+        (
+            index,
+            ("{" if position == 0 else ",") + encode_str(KEYS[index]) + ":",
+            _nullable(FIELDS[KEYS[index]][1] or encode_str),
+        )
+        for position, index in enumerate(order)
+    ]
+
+    def encode_row(row) -> str:
+        return "".join([prefix + encode(row[index]) for index, prefix, encode in plan]) + "}"
+
+    return encode_row
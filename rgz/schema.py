@@ -0,0 +1,89 @@
+# schema.py
+"""
+Разовая подготовка схемы БД — вместо create_all при импорте app.py.
+
+Отпечаток схемы (sha256 от DDL всех таблиц и индексов) хранится в таблице
+schema_version. Если он совпадает с текущими моделями, bootstrap
+ограничивается одним запросом; иначе выполняется create_all (создаёт
+недостающие таблицы), добавляются недостающие индексы существующих таблиц,
+на PostgreSQL создаются секции audit_log (audit_retention.ensure_partitions;
+несекционированный audit_log переводится в секции — migrate_to_partitioned),
+заводится тестовый пользователь и сохраняется новый отпечаток.
+
+    python schema.py            # или ./helper.sh setup_database
+    flask --app app init-db
+"""
+import hashlib
+from datetime import datetime
+
+from sqlalchemy import Column, DateTime, Integer, String, inspect, select
+from sqlalchemy.schema import CreateIndex, CreateTable
+
+import models  # noqa: F401  — регистрирует модели в Base.metadata
+from audit_retention import ensure_partitions, is_declarative, migrate_to_partitioned
+from database import Base, SessionLocal, engine
+
+
+class SchemaVersion(Base):
+    __tablename__ = "schema_version"
+
+    id = Column(Integer, primary_key=True)
+    fingerprint = Column(String(64), nullable=False)
+    applied_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
+
+
+def schema_fingerprint(bind=engine) -> str:
+    """Отпечаток DDL моделей в диалекте bind."""
+    digest = hashlib.sha256()
+    for table in Base.metadata.sorted_tables:
+        digest.update(str(CreateTable(table).compile(dialect=bind.dialect)).encode())
+        for index in sorted(table.indexes, key=lambda i: i.name):
+            digest.update(str(CreateIndex(index).compile(dialect=bind.dialect)).encode())
+    return digest.hexdigest()
+
+
+def stored_fingerprint(bind=engine) -> str | None:
+    if not inspect(bind).has_table(SchemaVersion.__tablename__):
+        return None
+    with bind.connect() as conn:
+        return conn.scalar(select(SchemaVersion.fingerprint).where(SchemaVersion.id == 1))
+
+
+def seed_test_user(db):
+    """Один тестовый пользователь, под которым работают маршруты."""
+    if db.get(models.User, 1) is None:
+        db.add(models.User(id=1, name="Test User"))
+
+
+def ensure_schema(bind=engine) -> bool:
+    """Подготовить схему, если она не совпадает с моделями. True — если что-то менялось."""
+    fingerprint = schema_fingerprint(bind)
+    if stored_fingerprint(bind) == fingerprint:
+        return False
+
+    Base.metadata.create_all(bind=bind)
+    # create_all не трогает существующие таблицы — индексы добавляем отдельно
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind, checkfirst=True)
+    if is_declarative(bind):
+        ensure_partitions(bind)
+    else:
+        migrate_to_partitioned(bind)  # audit_log, созданный на PostgreSQL до секционирования
+
+    with SessionLocal(bind=bind) as db:
+        seed_test_user(db)
+        version = db.get(SchemaVersion, 1)
+        if version is None:
+            db.add(SchemaVersion(id=1, fingerprint=fingerprint))
+        else:
+            version.fingerprint = fingerprint
+        db.commit()
+    return True
+
+
+if __name__ == "__main__":
+    if ensure_schema():
+        print("Схема создана/обновлена.")
+    else:
+        print("Схема актуальна.")
@@ -0,0 +1,100 @@
+# test_analytics.py
+import threading
+from decimal import Decimal
+
+import pytest
+from sqlalchemy import select
+
+from analytics import rebuild_summary, user_spending
+from app import app, update_for_user
+from database import SessionLocal, engine
+from models import SpendingSummary, User
+
+
+def summary_rows(db):
+    return {
+        (row.user_id, row.period): (row.total, row.subscriptions)
+        for row in db.scalars(select(SpendingSummary))
+    }
+
+
+def test_summary_follows_writes_and_matches_rebuild():
+    # другие тесты пишут подписки мимо маршрутов — начинаем с согласованной сводки
+    with SessionLocal() as db:
+        rebuild_summary(db)
+        db.commit()
+
+    client = app.test_client()
+    resp = client.post("/subscriptions", json={
+        "name": "analytics-a", "amount": "10.10", "period": "monthly", "start_date": "2025-01-01",
+    })
+    sub_id = resp.get_json()["id"]
+    client.put(f"/subscriptions/{sub_id}", json={"amount": "20.20", "period": "yearly"})
+    client.post("/subscriptions/batch", json={"operations": [
+        {"op": "create", "data": {
+            "name": "analytics-b", "amount": "0.10", "period": "weekly", "start_date": "2025-01-01",
+        }},
+        {"op": "update", "id": sub_id, "data": {"amount": "30.30"}},
+    ]})
+    deleted = client.post("/subscriptions", json={
+        "name": "analytics-c", "amount": "5", "period": "monthly", "start_date": "2025-01-01",
+    }).get_json()["id"]
+    client.delete(f"/subscriptions/{deleted}")
+
+    with SessionLocal() as db:
+        incremental = summary_rows(db)
+        rebuild_summary(db)
+        db.flush()
+        rebuilt = summary_rows(db)
+        db.rollback()
+
+    live = {key: value for key, value in incremental.items() if value[1]}
+    assert live == rebuilt
+
+
+def test_concurrent_updates_keep_summary_consistent():
+    if engine.dialect.name != "postgresql":
+        pytest.skip("SQLite не даёт параллельных писателей")
+    with SessionLocal() as db:
+        rebuild_summary(db)
+        db.commit()
+    sub_id = app.test_client().post("/subscriptions", json={
+        "name": "analytics-race", "amount": "1", "period": "monthly", "start_date": "2025-01-01",
+    }).get_json()["id"]
+
+    def writer(n):
+        for i in range(10):
+            with SessionLocal() as db:
+                update_for_user(db, 1, sub_id, {"amount": str(n * 10 + i), "period": ("monthly", "yearly")[i % 2]})
+
+    threads = [threading.Thread(target=writer, args=(n,)) for n in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    with SessionLocal() as db:
+        incremental = summary_rows(db)
+        rebuild_summary(db)
+        db.flush()
+        rebuilt = summary_rows(db)
+        db.rollback()
+    assert {key: value for key, value in incremental.items() if value[1]} == rebuilt
+
+
+def test_spending_endpoint_uses_decimal():
+    with SessionLocal() as db:
+        db.add(User(id=999, name="Analytics User"))
+        db.flush()
+        db.add(SpendingSummary(user_id=999, period="monthly", total=Decimal("10.01"), subscriptions=1))
+        db.add(SpendingSummary(user_id=999, period="yearly", total=Decimal("120.00"), subscriptions=1))
+        db.flush()
+        result = user_spending(db, 999)
+        db.rollback()
+
+    assert result["yearly_total"] == Decimal("240.12")
+    assert result["monthly_total"] == Decimal("20.01")
+
+    resp = app.test_client().get("/analytics/spending")
+    assert resp.status_code == 200
+    assert isinstance(resp.get_json()["yearly_total"], str)
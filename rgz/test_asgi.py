@@ -0,0 +1,93 @@
+# test_asgi.py
+import asyncio
+import threading
+
+import pytest
+
+pytest.importorskip("quart")
+pytest.importorskip("aiosqlite")
+pytest.importorskip("greenlet")
+
+from app import app as sync_app  # noqa: E402
+from asgi_app import app, async_url, dispose_engines  # noqa: E402
+
+
+def test_async_url():
+    assert async_url("sqlite:///x.db") == "sqlite+aiosqlite:///x.db"
+    assert async_url("postgresql://u:p@h/db") == "postgresql+asyncpg://u:p@h/db"
+
+
+def test_async_routes_match_sync_contract():
+    async def scenario():
+        client = app.test_client()
+        resp = await client.post("/subscriptions", json={
+            "name": "asgi", "amount": "12.30", "period": "monthly", "start_date": "2025-01-01",
+        })
+        assert resp.status_code == 201
+        created = await resp.get_json()
+
+        resp = await client.put(f"/subscriptions/{created['id']}", json={"amount": "bad"})
+        assert resp.status_code == 400
+
+        resp = await client.post("/subscriptions/batch", json={"operations": [
+            {"op": "update", "id": created["id"], "data": {"amount": "15"}},
+        ]})
+        assert (await resp.get_json())["results"][0]["body"]["amount"] == 15.0
+
+        path = f"/subscriptions?limit=5&after={created['id'] - 1}"
+        page = await client.get(path)
+        cached = await client.get(path, headers={"If-None-Match": page.headers["ETag"]})
+        assert cached.status_code == 304
+
+        export = await client.get("/subscriptions?format=ndjson")
+        assert b'"name":"asgi"' in await export.get_data()
+        await dispose_engines()  # соединения asyncpg привязаны к циклу, который закроет asyncio.run
+        return created["id"], path, await page.get_data()
+
+    sub_id, path, async_page = asyncio.run(scenario())
+
+    # синхронное приложение отдаёт ту же страницу байт в байт
+    client = sync_app.test_client()
+    assert client.get(path).get_data() == async_page
+
+    async def cleanup():
+        resp = await app.test_client().delete(f"/subscriptions/{sub_id}")
+        body = await resp.get_json()
+        await dispose_engines()
+        return body
+
+    assert asyncio.run(cleanup()) == {"status": "deleted"}
+    assert client.put(f"/subscriptions/{sub_id}", json={"amount": "1"}).status_code == 404
+
+
+def test_cache_calls_run_off_the_event_loop(monkeypatch):
+    from cache import response_cache
+
+    if response_cache is None:
+        pytest.skip("кэш ответов выключен")
+    threads = []
+    for name in ("version", "bump", "get", "put"):
+        original = getattr(response_cache, name)
+
+        def record(*args, _name=name, _original=original):
+            threads.append((_name, threading.get_ident()))
+            return _original(*args)
+
+        monkeypatch.setattr(response_cache, name, record)
+
+    async def scenario():
+        loop_thread = threading.get_ident()
+        client = app.test_client()
+        resp = await client.post("/subscriptions", json={
+            "name": "asgi-thread", "amount": "1", "period": "monthly", "start_date": "2025-01-01",
+        })
+        sub_id = (await resp.get_json())["id"]
+        assert ("bump", loop_thread) not in threads and any(n == "bump" for n, _ in threads)
+        await client.get("/subscriptions?limit=5")
+        await client.delete(f"/subscriptions/{sub_id}")
+        await dispose_engines()
+        return loop_thread
+
+    loop_thread = asyncio.run(scenario())
+    assert {name for name, _ in threads} == {"version", "bump", "get", "put"}
+    assert all(ident != loop_thread for _, ident in threads)
@@ -0,0 +1,57 @@
+# test_audit.py
+from sqlalchemy import func, select
+
+from audit import AuditWriter, attach_to_sessions
+from database import SessionLocal, engine
+from models import AuditLog
+
+
+def count_actions(action):
+    with SessionLocal() as db:
+        return db.scalar(select(func.count()).where(AuditLog.action == action))
+
+
+def test_writer_flushes_batches():
+    writer = AuditWriter(engine, maxsize=100, batch_size=10, flush_interval=0.05)
+    before = count_actions("async-test")
+    for _ in range(25):
+        assert writer.submit(1, "async-test", None)
+    writer.stop()
+
+    assert count_actions("async-test") == before + 25
+    stats = writer.stats()
+    assert stats["queued"] == 25
+    assert stats["flushed"] == 25
+    assert stats["pending"] == 0
+
+
+def test_writer_drops_when_queue_full():
+    writer = AuditWriter(engine, maxsize=2, put_timeout=0)
+    writer._thread = object()  # поток не запускаем — очередь никто не разбирает
+    results = [writer.submit(1, "overflow", None) for _ in range(3)]
+    writer._thread = None
+
+    assert results == [True, True, False]
+    assert writer.stats()["dropped"] == 1
+    writer.flush()
+    assert writer.stats()["flushed"] == 2
+
+
+def test_pending_events_follow_commit():
+    from sqlalchemy.orm import sessionmaker
+
+    factory = sessionmaker(bind=engine)
+    writer = AuditWriter(engine)
+    writer._thread = object()
+    attach_to_sessions(factory, writer)
+
+    with factory() as db:
+        db.info["audit_pending"] = [(1, "rolled-back", None)]
+        db.rollback()
+        db.info["audit_pending"] = [(1, "committed", None)]
+        db.commit()
+    writer._thread = None
+
+    assert writer.stats()["queued"] == 1
+    writer.flush()
+    assert count_actions("rolled-back") == 0
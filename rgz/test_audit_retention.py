@@ -0,0 +1,53 @@
+# test_audit_retention.py
+import gzip
+import json
+from datetime import datetime
+
+from sqlalchemy import func, insert, inspect, select
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.schema import CreateTable
+
+from audit_retention import is_declarative, run_retention, subscription_history
+from database import SessionLocal, engine
+from models import AuditLog, Subscription
+
+
+def test_postgres_audit_log_is_partitioned_by_month():
+    ddl = str(CreateTable(AuditLog.__table__).compile(dialect=postgresql.dialect()))
+    assert "PARTITION BY RANGE (created_at)" in ddl
+    assert "PRIMARY KEY (id, created_at)" in ddl
+
+
+def test_retention_archives_old_months_and_history_spans_them(tmp_path):
+    with SessionLocal() as db:
+        sub = Subscription(user_id=1, name="retention", amount=1, period="monthly",
+                           start_date=datetime(2020, 1, 1).date())
+        db.add(sub)
+        db.flush()
+        sub_id = sub.id
+        db.execute(insert(AuditLog), [
+            {"user_id": 1, "subscription_id": sub_id, "action": "create", "created_at": datetime(2020, 1, 5)},
+            {"user_id": 1, "subscription_id": sub_id, "action": "update", "created_at": datetime(2020, 2, 7)},
+            {"user_id": 1, "subscription_id": sub_id, "action": "update", "created_at": datetime(2020, 3, 9)},
+            {"user_id": 1, "subscription_id": sub_id, "action": "delete", "created_at": datetime(2020, 4, 2)},
+        ])
+        db.commit()
+
+    archived = run_retention(engine, str(tmp_path), keep_months=1, today=datetime(2020, 4, 15))
+
+    assert [m["table"] for m in archived] == ["audit_log_p202001", "audit_log_p202002"]
+    tables = inspect(engine).get_table_names()
+    assert "audit_log_p202001" not in tables and "audit_log_p202003" in tables
+    with gzip.open(tmp_path / "audit_log_p202001.ndjson.gz", "rt", encoding="utf-8") as f:
+        assert json.loads(f.readline())["action"] == "create"
+
+    with SessionLocal() as db:
+        # SQLite: в самом audit_log остался только текущий (апрельский) месяц, март — в audit_log_p202003;
+        # PostgreSQL: audit_log видит все неархивированные секции — март и апрель
+        live = db.scalar(select(func.count()).where(AuditLog.subscription_id == sub_id))
+        assert live == (2 if is_declarative(engine) else 1)
+        history = subscription_history(db, sub_id, str(tmp_path))
+    assert [row["action"] for row in history] == ["create", "update", "update", "delete"]
+
+    # повторный прогон ничего не архивирует заново
+    assert run_retention(engine, str(tmp_path), keep_months=1, today=datetime(2020, 4, 15)) == []
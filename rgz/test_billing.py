@@ -0,0 +1,95 @@
+# test_billing.py
+import sys
+from datetime import date
+
+import pytest
+from sqlalchemy import select
+
+import billing
+from billing import add_months, next_charge, run_billing, shard_bounds
+from database import SessionLocal
+from models import AuditLog, Subscription
+
+
+def test_add_months_clamps_to_month_end():
+    assert add_months(date(2025, 1, 31), 1) == date(2025, 2, 28)
+    assert add_months(date(2024, 12, 15), 12) == date(2025, 12, 15)
+    assert next_charge(date(2025, 1, 1), "weekly") == date(2025, 1, 8)
+    assert next_charge(date(2025, 1, 1), "??") is None
+
+
+def test_month_end_anchor_does_not_drift():
+    start = date(2025, 1, 31)
+    day, charges = start, []
+    for _ in range(4):
+        day = next_charge(day, "monthly", start)
+        charges.append(day)
+    assert charges == [date(2025, 2, 28), date(2025, 3, 31), date(2025, 4, 30), date(2025, 5, 31)]
+
+    assert add_months(date(2024, 2, 29), 12, anchor_day=29) == date(2025, 2, 28)
+    assert add_months(date(2025, 2, 28), 12, anchor_day=29) == date(2026, 2, 28)
+    assert add_months(date(2028, 2, 28), 12, anchor_day=29) == date(2029, 2, 28)
+    assert next_charge(date(2025, 2, 28), "quarterly", date(2024, 11, 30)) == date(2025, 5, 30)
+    # день не на конце месяца — явно заданный цикл не сдвигается к дню начала
+    assert next_charge(date(2025, 2, 1), "monthly", date(2025, 1, 15)) == date(2025, 3, 1)
+    assert next_charge(date(2025, 2, 28), "weekly", date(2025, 1, 31)) == date(2025, 3, 7)
+
+
+def test_shard_bounds_cover_id_space():
+    bounds = [shard_bounds(10, 3, shard) for shard in range(3)]
+    assert bounds == [(0, 4), (4, 8), (8, 10)]
+
+
+@pytest.mark.parametrize("argv", [
+    ["--shard", "2"], ["--shards", "4"], ["--shard", "4", "--shards", "4"],
+    ["--shard", "-1", "--shards", "4"], ["--shard", "0", "--shards", "0"], ["--workers", "0"],
+])
+def test_main_rejects_bad_shard_args(monkeypatch, capsys, argv):
+    monkeypatch.setattr(sys, "argv", ["billing.py", *argv])
+    monkeypatch.setattr(billing, "run_billing", lambda *args: pytest.fail("прогон не должен начаться"))
+    with pytest.raises(SystemExit) as exc:
+        billing.main()
+    assert exc.value.code == 2 and "error:" in capsys.readouterr().err
+
+
+def test_run_billing_advances_due_and_is_resumable():
+    run_date = date(2031, 6, 1)
+    with SessionLocal() as db:
+        subs = [
+            Subscription(user_id=1, name="due-monthly", amount=1, period="monthly",
+                         start_date=date(2031, 1, 1), next_charge_date=date(2031, 5, 31)),
+            Subscription(user_id=1, name="due-yearly", amount=1, period="yearly",
+                         start_date=date(2031, 1, 1), next_charge_date=date(2031, 6, 1)),
+            Subscription(user_id=1, name="not-due", amount=1, period="monthly",
+                         start_date=date(2031, 1, 1), next_charge_date=date(2031, 6, 2)),
+            Subscription(user_id=1, name="odd-period", amount=1, period="??",
+                         start_date=date(2031, 1, 1), next_charge_date=date(2031, 5, 1)),
+            Subscription(user_id=1, name="due-month-end", amount=1, period="monthly",
+                         start_date=date(2031, 1, 31), next_charge_date=date(2031, 4, 30)),
+        ]
+        db.add_all(subs)
+        db.commit()
+        ids = [s.id for s in subs]
+
+    result = run_billing(run_date, chunk_size=1)
+    assert result["charged"] == 3
+    assert result["skipped"] == 1
+
+    # повторный запуск с той же контрольной точкой ничего не списывает
+    assert run_billing(run_date, chunk_size=1)["charged"] == 0
+
+    with SessionLocal() as db:
+        dates = dict(db.execute(
+            select(Subscription.id, Subscription.next_charge_date)
+            .where(Subscription.id.in_(ids))
+        ).all())
+        charges = db.scalars(
+            select(AuditLog.subscription_id)
+            .where(AuditLog.action == "charge", AuditLog.subscription_id.in_(ids))
+        ).all()
+
+    assert dates[ids[0]] == date(2031, 6, 30)
+    assert dates[ids[1]] == date(2032, 6, 1)
+    assert dates[ids[2]] == date(2031, 6, 2)
+    assert dates[ids[4]] == date(2031, 5, 31)  # день цикла — 31-е, а не 30-е из апреля
+    assert sorted(charges) == ids[:2] + ids[4:]
@@ -0,0 +1,143 @@
+# test_cache.py
+import os
+import subprocess
+import sys
+import time
+
+from sqlalchemy import event
+
+from app import app
+from database import engine
+from cache import LRUCache, MemoryBackend, ResponseCache, response_cache
+
+
+def test_lru_evicts_oldest_and_expires():
+    cache = LRUCache(maxsize=2, ttl=60)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1
+    cache.set("c", 3)  # вытесняет b — к нему обращались раньше всех
+    assert cache.get("b") is None
+    assert cache.stats()["evictions"] == 1
+
+    short = LRUCache(maxsize=2, ttl=0.01)
+    short.set("a", 1)
+    time.sleep(0.02)
+    assert short.get("a") is None
+    assert short.stats()["expired"] == 1
+
+
+def test_shared_backend_versions():
+    shared = MemoryBackend()
+    first = ResponseCache(LRUCache(), shared)
+    second = ResponseCache(LRUCache(), shared)
+
+    version = first.version(1)
+    first.put(1, version, "page", {"body": "[]"})
+    assert second.get(1, second.version(1), "page") == {"body": "[]"}
+
+    second.bump(1)
+    assert first.version(1) != version and first.version(1) == second.version(1)
+    assert first.get(1, first.version(1), "page") is None
+
+
+def test_lost_shared_versions_start_new_epoch():
+    shared = MemoryBackend()
+    cache = ResponseCache(LRUCache(), shared)
+    cache.bump(1)
+    old_version = cache.version(1)
+    old_etag = cache.etag(1, old_version, "list")
+    cache.put(1, old_version, "list", {"body": "[]"})
+
+    del shared._data["subs:ver:1"]  # Redis потерял или вытеснил счётчик версий
+    cache.bump(1)  # счётчик снова 1, но эпоха уже другая
+    assert cache.version(1) != old_version
+    assert cache.etag(1, cache.version(1), "list") != old_etag
+    assert ResponseCache(LRUCache(), shared).get(1, cache.version(1), "list") is None
+
+    # memory:// у каждого процесса свой — и эпоха своя
+    first, second = ResponseCache(LRUCache(), MemoryBackend()), ResponseCache(LRUCache(), MemoryBackend())
+    assert first.etag(1, first.version(1), "list") != second.etag(1, second.version(1), "list")
+
+
+def test_cache_needs_shared_backend_by_default():
+    def enabled(**env):
+        env = {k: v for k, v in os.environ.items() if not k.startswith("CACHE_")} | env
+        out = subprocess.run([sys.executable, "-c", "import cache; print(cache.response_cache is not None)"],
+                             env=env, cwd=os.path.dirname(os.path.abspath(__file__)),
+                             capture_output=True, text=True, check=True).stdout
+        return out.strip() == "True"
+
+    assert not enabled()
+    assert enabled(CACHE_URL="memory://")
+    assert enabled(CACHE_ENABLED="1")  # явно — сервер в один процесс
+    assert not enabled(CACHE_URL="memory://", CACHE_ENABLED="0")
+
+
+def test_writes_in_one_worker_change_etag_in_another():
+    shared = MemoryBackend()
+    first = ResponseCache(LRUCache(), shared)
+    second = ResponseCache(LRUCache(), shared)
+    etag = second.etag(1, second.version(1), "list")
+    assert first.etag(1, first.version(1), "list") == etag
+
+    first.bump(1)  # запись обработал другой воркер
+    assert second.etag(1, second.version(1), "list") != etag
+
+    local = ResponseCache(LRUCache())
+    restarted = ResponseCache(LRUCache())
+    assert local.etag(1, local.version(1), "list") != restarted.etag(1, restarted.version(1), "list")
+
+
+def test_list_cache_hit_and_invalidation():
+    client = app.test_client()
+    url = "/subscriptions?limit=3&after=0&format=ndjson"
+    client.get(url)
+    hits = response_cache.stats()["hits"]
+
+    cached = client.get(url)
+    assert response_cache.stats()["hits"] == hits + 1
+
+    sub_id = client.post("/subscriptions", json={
+        "name": "cache", "amount": "1", "period": "monthly", "start_date": "2025-01-01",
+    }).get_json()["id"]
+    client.delete(f"/subscriptions/{sub_id}")
+
+    fresh = client.get(url, headers={"If-None-Match": cached.headers["ETag"]})
+    assert response_cache.stats()["hits"] == hits + 1
+    assert fresh.status_code == 200  # запись подняла версию — ETag уже другой
+    assert fresh.headers["ETag"] != cached.headers["ETag"]
+    assert fresh.get_data() == cached.get_data()
+
+    again = client.get(url, headers={"If-None-Match": fresh.headers["ETag"]})
+    assert again.status_code == 304
+    assert response_cache.stats()["hits"] == hits + 1  # 304 — без обращения к кэшу и БД
+
+    stats = client.get("/cache/stats").get_json()
+    assert stats["enabled"] is True
+
+
+def test_full_list_etag_without_queries():
+    client = app.test_client()
+    first = client.get("/subscriptions")
+    etag = first.headers["ETag"]
+    assert first.status_code == 200
+
+    statements = []
+    record = lambda conn, cursor, statement, *args: statements.append(statement)
+    event.listen(engine, "before_cursor_execute", record)
+    try:
+        resp = client.get("/subscriptions", headers={"If-None-Match": etag})
+    finally:
+        event.remove(engine, "before_cursor_execute", record)
+    assert resp.status_code == 304 and resp.headers["ETag"] == etag
+    assert statements == []
+    # у NDJSON-выгрузки свой ETag
+    assert client.get("/subscriptions?format=ndjson", headers={"If-None-Match": etag}).status_code == 200
+
+    client.post("/subscriptions", json={
+        "name": "etag-full", "amount": "1", "period": "monthly", "start_date": "2025-01-01",
+    })
+    changed = client.get("/subscriptions", headers={"If-None-Match": etag})
+    assert changed.status_code == 200 and changed.headers["ETag"] != etag
+    assert any(s["name"] == "etag-full" for s in changed.get_json())
@@ -0,0 +1,39 @@
+# test_database.py
+import os
+import tempfile
+from datetime import date
+
+from app import app
+from cache import response_cache
+from database import Base, ReadSessionLocal, make_engine, read_session
+from models import Subscription, User
+
+
+def test_pool_stats_endpoint():
+    client = app.test_client()
+    client.get("/subscriptions?limit=1")
+    stats = client.get("/db/stats").get_json()
+    assert "primary" in stats
+
+
+def test_get_handlers_read_from_replica():
+    path = os.path.join(tempfile.mkdtemp(), "replica.db")
+    replica = make_engine(f"sqlite:///{path}")
+    Base.metadata.create_all(bind=replica)
+    with ReadSessionLocal(bind=replica) as db:
+        db.add(User(id=1, name="Replica User"))
+        db.add(Subscription(user_id=1, name="from-replica", amount=1, period="monthly",
+                            start_date=date(2025, 1, 1)))
+        db.commit()
+
+    primary = ReadSessionLocal.kw["bind"]
+    read_session.configure(bind=replica)
+    response_cache.bump(1)  # не отдавать страницы, закэшированные с основной БД
+    try:
+        client = app.test_client()
+        page = client.get("/subscriptions?limit=10").get_json()
+        export = client.get("/subscriptions").get_json()
+    finally:
+        read_session.configure(bind=primary)
+    assert [s["name"] for s in page] == ["from-replica"]
+    assert export == page
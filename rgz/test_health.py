@@ -7,3 +7,14 @@ def test_health():
     resp = client.get("/health")
     assert resp.status_code == 200
     assert resp.get_json()["status"] == "ok"
+
+
+def test_health_needs_no_database(monkeypatch):
+    import database
+
+    def refuse(*args, **kwargs):
+        raise AssertionError("GET /health не должен обращаться к БД")
+
+    monkeypatch.setattr(database.engine, "connect", refuse)
+    resp = app.test_client().get("/health")
+    assert resp.status_code == 200
@@ -0,0 +1,32 @@
+# test_metrics.py
+import logging
+
+import metrics
+from app import app
+
+
+def test_metrics_exposes_route_histograms_and_query_counts():
+    client = app.test_client()
+    before = metrics.request_queries.count("/subscriptions/<int:sub_id>")
+    client.put("/subscriptions/999999", json={"amount": "1"})
+    assert metrics.request_queries.count("/subscriptions/<int:sub_id>") == before + 1
+    client.get("/health")
+
+    resp = client.get("/metrics")
+    assert resp.status_code == 200
+    assert resp.content_type.startswith("text/plain; version=0.0.4")
+    body = resp.get_data(as_text=True)
+    assert 'rgz_http_requests_total{route="/subscriptions/<int:sub_id>",method="PUT",status="404"}' in body
+    assert 'rgz_http_request_duration_seconds_bucket{route="/health",method="GET",le="+Inf"}' in body
+    assert 'rgz_db_queries_total{engine="primary"}' in body
+    # /health к БД не обращается
+    assert 'rgz_http_request_queries_bucket{route="/health",le="0"}' in body
+
+
+def test_slow_queries_are_logged_with_statement(monkeypatch, caplog):
+    monkeypatch.setattr(metrics, "SLOW_QUERY_MS", 0)
+    slow_before = metrics.slow_queries_total.value("primary")
+    with caplog.at_level(logging.WARNING, logger="metrics"):
+        app.test_client().get("/analytics/spending")
+    assert metrics.slow_queries_total.value("primary") > slow_before
+    assert any("SELECT" in record.getMessage() for record in caplog.records)
@@ -0,0 +1,42 @@
+# test_projection.py
+from datetime import date
+from decimal import Decimal
+
+from flask import jsonify
+from sqlalchemy import select
+
+from app import app
+from database import SessionLocal
+from models import Subscription
+from projection import FIELDS, fetch_page, row_encoder
+
+
+def test_projection_matches_to_dict_bytes():
+    with SessionLocal() as db:
+        subs = [
+            Subscription(user_id=1, name="Кинопоиск \"HD\"", amount=Decimal("299.90"),
+                         period="monthly", start_date=date(2025, 1, 31),
+                         next_charge_date=date(2025, 2, 28)),
+            Subscription(user_id=1, name="plain", amount=Decimal("0.10"), period="yearly",
+                         start_date=date(2024, 2, 29), next_charge_date=None),
+        ]
+        db.add_all(subs)
+        db.flush()
+        after = subs[0].id - 1
+
+        rows = fetch_page(db, 1, after, 2)
+        orm = db.scalars(
+            select(Subscription).where(Subscription.id.in_([s.id for s in subs])).order_by(Subscription.id)
+        ).all()
+
+        with app.app_context():
+            for sort_keys in (True, False):
+                app.json.sort_keys = sort_keys
+                encode = row_encoder(app.json.ensure_ascii, sort_keys)
+                for row, sub in zip(rows, orm):
+                    expected = jsonify(sub.to_dict()).get_data(as_text=True).rstrip("\n")
+                    assert encode(row) == expected
+            app.json.sort_keys = True
+        db.rollback()
+
+    assert list(FIELDS) == list(orm[0].to_dict())
@@ -0,0 +1,16 @@
+# test_schema.py
+import os
+import tempfile
+
+from database import make_engine
+from schema import ensure_schema, schema_fingerprint, stored_fingerprint
+
+
+def test_bootstrap_runs_once():
+    path = os.path.join(tempfile.mkdtemp(), "fresh.db")
+    bind = make_engine(f"sqlite:///{path}")
+
+    assert stored_fingerprint(bind) is None
+    assert ensure_schema(bind) is True
+    assert stored_fingerprint(bind) == schema_fingerprint(bind)
+    assert ensure_schema(bind) is False
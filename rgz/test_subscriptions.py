@@ -0,0 +1,153 @@
+# test_subscriptions.py
+import json
+
+from sqlalchemy import event
+
+import app as app_module
+from app import app
+from database import engine
+
+
+def create(client, name, amount="100.00", period="monthly"):
+    resp = client.post("/subscriptions", json={
+        "name": name,
+        "amount": amount,
+        "period": period,
+        "start_date": "2025-01-01",
+    })
+    assert resp.status_code == 201
+    return resp.get_json()
+
+
+def test_list_pagination_by_cursor():
+    client = app.test_client()
+    ids = [create(client, f"page-{i}")["id"] for i in range(5)]
+    after = ids[0] - 1
+
+    resp = client.get(f"/subscriptions?limit=2&after={after}")
+    assert resp.status_code == 200
+    assert [s["id"] for s in resp.get_json()] == ids[:2]
+    assert resp.headers["X-Next-Cursor"] == str(ids[1])
+
+    resp = client.get(f"/subscriptions?limit=2&after={ids[1]}")
+    assert [s["id"] for s in resp.get_json()] == ids[2:4]
+
+
+def test_list_bad_limit():
+    client = app.test_client()
+    assert client.get("/subscriptions?limit=0").status_code == 400
+    assert client.get("/subscriptions?limit=abc").status_code == 400
+    assert client.get("/subscriptions?after=-5").status_code == 400
+
+
+def test_list_etag_not_modified():
+    client = app.test_client()
+    create(client, "etag")
+
+    resp = client.get("/subscriptions?limit=1000")
+    etag = resp.headers["ETag"]
+    resp = client.get("/subscriptions?limit=1000", headers={"If-None-Match": etag})
+    assert resp.status_code == 304
+
+    create(client, "etag-changed")
+    resp = client.get("/subscriptions?limit=1000", headers={"If-None-Match": etag})
+    assert resp.status_code == 200
+
+
+def test_full_export_stream_formats():
+    client = app.test_client()
+    create(client, "stream")
+
+    full = client.get("/subscriptions").get_json()
+    assert any(s["name"] == "stream" for s in full)
+
+    resp = client.get("/subscriptions?format=ndjson")
+    assert resp.mimetype == "application/x-ndjson"
+    lines = [json.loads(line) for line in resp.get_data(as_text=True).splitlines()]
+    assert lines == full
+
+
+def test_batch_mixed_operations():
+    client = app.test_client()
+    first = create(client, "batch-a")
+    second = create(client, "batch-b")
+
+    resp = client.post("/subscriptions/batch", json={"operations": [
+        {"op": "create", "data": {
+            "name": "batch-new", "amount": "9.99",
+            "period": "yearly", "start_date": "2025-03-01",
+        }},
+        {"op": "update", "id": first["id"], "data": {"amount": "42.50"}},
+        {"op": "update", "id": first["id"], "data": {"period": "yearly"}},
+        {"op": "delete", "id": second["id"]},
+        {"op": "delete", "id": second["id"]},
+        {"op": "create", "data": {"name": "no-amount"}},
+        {"op": "update", "id": first["id"], "data": {"next_charge_date": "bad"}},
+        {"op": "rename"},
+    ]})
+    assert resp.status_code == 200
+    results = resp.get_json()["results"]
+
+    assert [r["status"] for r in results] == [201, 200, 200, 200, 404, 400, 400, 400]
+    assert results[0]["body"]["name"] == "batch-new"
+    assert results[1]["body"]["amount"] == 42.5
+    assert results[2]["body"]["period"] == "yearly"
+    assert results[3]["body"] == {"status": "deleted"}
+
+    ids = [s["id"] for s in client.get("/subscriptions").get_json()]
+    assert results[0]["body"]["id"] in ids
+    assert second["id"] not in ids
+
+
+def test_batch_requires_operations():
+    client = app.test_client()
+    assert client.post("/subscriptions/batch", json={}).status_code == 400
+    assert client.post("/subscriptions/batch", json={"operations": []}).status_code == 400
+
+
+def count_inserts(client, operations):
+    """(ответ пакета, число INSERT INTO subscriptions за запрос)."""
+    inserts = []
+
+    def on_execute(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith("INSERT INTO SUBSCRIPTIONS"):
+            inserts.append(statement)
+
+    event.listen(engine, "before_cursor_execute", on_execute)
+    try:
+        resp = client.post("/subscriptions/batch", json={"operations": operations})
+    finally:
+        event.remove(engine, "before_cursor_execute", on_execute)
+    return resp, len(inserts)
+
+
+def test_batch_creates_in_one_insert(monkeypatch):
+    client = app.test_client()
+    operations = [
+        {"op": "create", "data": {"name": f"bulk-{i}", "amount": str(i + 1), "period": "monthly",
+                                  "start_date": "2025-01-01"}}
+        for i in range(50)
+    ]
+    resp, inserts = count_inserts(client, operations)
+    assert resp.status_code == 200 and inserts == 1
+    bodies = [r["body"] for r in resp.get_json()["results"]]
+    assert [b["name"] for b in bodies] == [f"bulk-{i}" for i in range(50)]
+    assert [b["amount"] for b in bodies] == [i + 1 for i in range(50)]
+
+    monkeypatch.setattr(app_module, "BATCH_INSERT_ROWS", 20)
+    resp, inserts = count_inserts(client, operations)
+    assert inserts == 3
+    assert [r["body"]["name"] for r in resp.get_json()["results"]] == [f"bulk-{i}" for i in range(50)]
+
+
+def test_batch_rejects_non_object_data():
+    client = app.test_client()
+    sub = create(client, "batch-data")
+    resp = client.post("/subscriptions/batch", json={"operations": [
+        {"op": "create", "data": ["name"]},
+        {"op": "update", "id": sub["id"], "data": "amount"},
+        {"op": "delete", "id": sub["id"], "data": 5},
+    ]})
+    assert resp.status_code == 200
+    assert [r["status"] for r in resp.get_json()["results"]] == [400, 400, 200]
+    assert client.post("/subscriptions/batch", json=[1]).status_code == 400